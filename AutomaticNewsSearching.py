@@ -11,6 +11,7 @@ from tqdm import tqdm
 from time import sleep 
 from datetime import datetime, timedelta
 from urllib.parse import quote_plus
+from url_cache import get_url_cache
 
 nltk.download('popular')
 
@@ -82,6 +83,11 @@ def get_redirect_link(driver: webdriver, article_url: str, max_retries: int = 2)
     """
     Get the final redirect URL from a Google News link with retry logic
     """
+    url_cache = get_url_cache()
+    hit, cached_url = url_cache.get(article_url)
+    if hit:
+        return cached_url or article_url
+
     for attempt in range(max_retries):
         try:
             driver.get(article_url)
@@ -91,6 +97,7 @@ def get_redirect_link(driver: webdriver, article_url: str, max_retries: int = 2)
             
             # Check if redirect was successful
             if "google.com" not in final_url:
+                url_cache.put(article_url, final_url)
                 return final_url
             else:
                 print(f"Attempt {attempt + 1}: Still contains google.com, retrying...")
@@ -104,6 +111,7 @@ def get_redirect_link(driver: webdriver, article_url: str, max_retries: int = 2)
     
     # If all retries failed, return the original URL
     print(f"All {max_retries} attempts failed for {article_url}")
+    url_cache.put_failure(article_url)
     return article_url
 
 def parse_article(article: Article, original_url: str = None) -> dict:
@@ -240,8 +248,5 @@ if __name__ == "__main__":
     # Take in Excel file name 
     main()
 
-# Make an automatic weekly email with the news articles 
-# Update with new articles one a week 
-# take in email address 
 # Document the processes of the code 
 # Make sure a video is made before august 8th 
\ No newline at end of file
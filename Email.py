@@ -1,57 +1,152 @@
+import logging
+import os
+import re
 import smtplib, ssl
-import os 
 from dotenv import load_dotenv
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from email.message import EmailMessage
+from time import sleep
 
 load_dotenv()
 
 sender_email = os.getenv("SENDER_EMAIL")
 sender_password = os.getenv("SENDER_PASSWORD")
 
-def send_email(receiver_email: str, subject: str, body: str) -> bool:
-    message = MIMEMultipart()
+# Point these at a local stand-in for testing, e.g. `python -m aiosmtpd -n -l localhost:8025`
+# with SMTP_HOST=localhost SMTP_PORT=8025 SMTP_STARTTLS=0
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+
+def parse_recipients(value) -> list:
+    """Recipients from a list or a comma/semicolon separated string"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r"[,;]", value)
+    return [address.strip() for address in value if address and address.strip()]
+
+def build_message(receiver_email: str, subject: str, body: str, html: str = None) -> EmailMessage:
+    """Plain-text message, or multipart/alternative with an HTML part when `html` is given"""
+    message = EmailMessage()
     message["From"] = sender_email
     message["To"] = receiver_email
     message["Subject"] = subject
+    message.set_content(body)
+    if html:
+        message.add_alternative(html, subtype="html")
+    return message
 
-    message.attach(MIMEText(body, "plain"))
+class SmtpMailer:
+    """
+    One SMTP connection (STARTTLS and login done once) reused for every message.
 
-    try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()  # Secure the connection
-            server.login(sender_email, sender_password)
-            server.sendmail(sender_email, receiver_email, message.as_string())
-            server.quit()
-        print("Email sent successfully!")
-    except Exception as e:
-        print(f"Error: {e}")
+    Dropped connections and temporary (4xx) errors are retried up to `retries` times
+    with exponential backoff, reconnecting as needed; permanent errors fail the message.
+    """
 
-def main():
-    sender_email = os.getenv("SENDER_EMAIL")
-    sender_password = os.getenv("SENDER_PASSWORD")
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, username: str = None, password: str = None,
+                 starttls: bool = SMTP_STARTTLS, timeout: float = 30, retries: int = 3, backoff: float = 1.0):
+        self.host = host
+        self.port = port
+        self.username = username if username is not None else sender_email
+        self.password = password if password is not None else sender_password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._server = None
 
-    receiver_email = os.getenv("SENDER_EMAIL")
+    def _connect(self) -> smtplib.SMTP:
+        if self._server is not None:
+            return self._server
 
-    context = ssl.create_default_context()
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls(context=ssl.create_default_context())
+            if self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        return server
 
-    message = MIMEMultipart()
-    message["From"] = sender_email
-    message["To"] = receiver_email
-    message["Subject"] = "Test Email from Python"
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except smtplib.SMTPException:
+            self._server.close()
+        except OSError:
+            pass
+        self._server = None
 
-    body = "Hello, this is a test email sent from Python!"
-    message.attach(MIMEText(body, "plain"))
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
+    def send(self, message: EmailMessage) -> bool:
+        """Send one message, returning whether it was accepted"""
+        for attempt in range(self.retries + 1):
+            try:
+                self._connect().send_message(message)
+                return True
+            except (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+                logging.error(f"Email to {message['To']} rejected: {e}")
+                return False
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code < 400 or e.smtp_code >= 500:
+                    logging.error(f"Email to {message['To']} failed permanently: {e}")
+                    return False
+                error = e
+            except (smtplib.SMTPException, OSError) as e:
+                # The connection is unusable, reconnect on the next attempt
+                if self._server is not None:
+                    self._server.close()
+                    self._server = None
+                error = e
+
+            if attempt < self.retries:
+                delay = self.backoff * (2 ** attempt)
+                logging.warning(f"Email to {message['To']} failed ({error}), retrying in {delay:.1f}s")
+                sleep(delay)
+
+        logging.error(f"Email to {message['To']} failed after {self.retries + 1} attempts: {error}")
+        return False
+
+def send_digest(recipients, subject: str, body: str, html: str = None, mailer: SmtpMailer = None) -> dict:
+    """Send the same email to each recipient over one connection. Returns {recipient: sent}."""
+    results = {}
+    owned = mailer is None
+    mailer = mailer or SmtpMailer()
     try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()  # Secure the connection
-            server.login(sender_email, sender_password)
-            server.sendmail(sender_email, receiver_email, message.as_string())
-            server.quit()
+        for recipient in parse_recipients(recipients):
+            results[recipient] = mailer.send(build_message(recipient, subject, body, html))
+    finally:
+        if owned:
+            mailer.close()
+
+    sent = sum(results.values())
+    logging.info(f"Email sent to {sent} of {len(results)} recipient(s)")
+    return results
+
+def send_email(receiver_email: str, subject: str, body: str, html: str = None) -> bool:
+    """Send an email to one or more (comma separated) recipients, returning True if every one was sent"""
+    results = send_digest(receiver_email, subject, body, html)
+    return bool(results) and all(results.values())
+
+def main():
+    receiver_email = os.getenv("SENDER_EMAIL")
+
+    body = "Hello, this is a test email sent from Python!"
+    if send_email(receiver_email, "Test Email from Python", body):
         print("Email sent successfully!")
-    except Exception as e:
-        print(f"Error: {e}")
+    else:
+        print("Error: the test email could not be sent, see the log for details")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
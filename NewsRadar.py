@@ -1,19 +1,36 @@
-import csv 
-import feedparser 
 import logging
-import pandas as pd 
-import nltk 
 import os 
 from dotenv import load_dotenv
+from feed_state import entry_id, entry_timestamp, get_feed_state
 from datetime import datetime, timedelta
-from Email import send_email
-from newspaper import Article
-from playwright.sync_api import sync_playwright
-from time import sleep 
-from tqdm import tqdm 
-from transformers import PegasusTokenizer, PegasusForConditionalGeneration
+from time import monotonic, perf_counter, sleep
+from article_fetcher import CircuitOpenError, FetchError, get_article_fetcher
+from article_parser import get_parser_pool, parser_worker_pids
+from article_record import ArticleRecord, release_text
+from article_store import get_article_store, merge_attributions
+from metrics import FAIL, SKIP, RssSampler, get_metrics, scoped_run_metrics, write_run_report
+from run_checkpoint import CANCELLED, COMPLETED, FAILED, get_checkpoint_store
+from browser_pool import BrowserPool, get_browser_pool
+from Email import send_digest
+from digest import render_digest
+from redirect_resolver import get_redirect_resolver
+from query_planner import QueryBatch, build_batches, match_key_terms
+from search_engine import SearchEngine
+from seen_index import get_seen_index
+from url_cache import get_url_cache
+from work_queue import (CANCELLED as QUEUE_CANCELLED, FAILED as QUEUE_FAILED, FINALIZING,
+                        FINISHED_STATES as QUEUE_FINISHED_STATES, get_work_queue)
+from summarizer import get_summarizer
+from nlp_resources import check_resources
+from near_duplicates import get_duplicate_detector
+from typing import TYPE_CHECKING
 from urllib.parse import quote_plus
 
+# feedparser, newspaper, pandas and tqdm are imported where they are used, so that
+# importing this module (as web_app.py does at startup) stays cheap
+if TYPE_CHECKING:
+    import pandas as pd
+
 # region 
 load_dotenv()
 
@@ -61,6 +78,37 @@ KEY_TERMS = ["Digital Transformation", "Bottleneck", "Warehouse", "CEO", "Optimi
 
 ARTICLE_AGE_DAYS = 90
 
+# Number of entries taken from the top of each query's feed, and whether feeds are
+# polled incrementally (conditional GETs, only entries newer than the last run)
+FEED_TOP_N = 1
+INCREMENTAL_FEEDS = True
+
+# Pack each company's key terms into OR-queries instead of one query per key term
+BATCH_QUERIES = True
+MAX_QUERY_WORDS = 32
+
+# Concurrency limits for each stage of the search pipeline and the minimum
+# interval between two requests to the same host
+FEED_CONCURRENCY = 4
+REDIRECT_CONCURRENCY = 4
+# Article parsing and NLP run in worker processes, one per core by default
+PARSE_WORKERS = int(os.getenv("NEWSRADAR_PARSE_WORKERS", os.cpu_count() or 1))
+PARSE_TIMEOUT = 60
+PARSE_CONCURRENCY = PARSE_WORKERS
+HOST_REQUEST_INTERVAL = 0.25
+# Seconds between writes of the seen-URL index during a search; completed units are checkpointed
+# immediately, see run_checkpoint.py
+SEEN_INDEX_FLUSH_INTERVAL = 60
+
+# Summaries come from newspaper's nlp() in the parser pool ("newspaper") or from a
+# batched Pegasus model run on each query's articles ("pegasus")
+SUMMARIZER_BACKEND = os.getenv("NEWSRADAR_SUMMARIZER", "newspaper")
+PEGASUS_QUANTIZE = os.getenv("NEWSRADAR_PEGASUS_QUANTIZE", "0") == "1"
+
+# In queue mode the web app gives up on a search that has not finished after this many seconds,
+# or once no worker has sent a heartbeat for a whole lease
+QUEUED_SEARCH_TIMEOUT = int(os.getenv("NEWSRADAR_QUEUED_SEARCH_TIMEOUT", 6 * 3600))
+
 RECIEVER_EMAIL = os.getenv("SENDER_EMAIL")
 # endregion
 
@@ -69,48 +117,17 @@ logging.basicConfig(filename='app.log', level=logging.DEBUG,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 # endregion
 
-# region NLTK Resources
-nltk.download('popular')
-# endregion
+def get_old_articles() -> "pd.DataFrame":
+    import pandas as pd
+
+    return pd.DataFrame(get_article_store().all_articles())
 
-def get_old_articles() -> pd.DataFrame:
+def get_redirect_link(url, browser_pool: BrowserPool = None) -> str:
     try:
-        with open("news_articles.csv", "r") as f:
-            reader = csv.DictReader(f)
-            return pd.DataFrame(reader)
-    except FileNotFoundError:
-        logging.debug('No existing news articles found.')
-        return pd.DataFrame()
-
-def get_redirect_link(url) -> str:
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        
-        try:
-            # Set user agent to avoid detection
-            page.set_extra_http_headers({
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            })
-            
-            # Navigate with longer timeout and wait for load
-            page.goto(url, wait_until="load", timeout=10000)
-            
-            # Try to wait for network to be idle with shorter timeout
-            try:
-                page.wait_for_load_state("networkidle", timeout=5000)
-            except:
-                pass  # Continue if network idle times out
-            
-            # Get the final URL before closing
-            final_url = page.url
-            browser.close()
-            return final_url
-            
-        except Exception as e:
-            logging.error(f"Error during redirect resolution: {e}")
-            browser.close()
-            return url  # Return original URL if redirect fails
+        return get_redirect_resolver().resolve(url, browser_pool)
+    except Exception as e:
+        logging.error(f"Error during redirect resolution: {e}")
+        return url  # Return original URL if redirect fails
 
 def skip_article_based_on_age(news_item, age_days: int) -> bool:
     # Skip article if it contains certain keywords
@@ -119,91 +136,398 @@ def skip_article_based_on_age(news_item, age_days: int) -> bool:
 
     return article_date < time_frame
 
-def parse_article(article: Article, url: str = "") -> dict:
-    try:
+def build_rss_url(company: str, key_term) -> str:
+    """Feed URL for a single key term, or for a QueryBatch of key terms"""
+    if isinstance(key_term, QueryBatch):
+        search_query = key_term.query
+    else:
+        search_query = f"{company} company {key_term}"
+    encoded_query = quote_plus(search_query)
 
-        article.download()
-        article.parse()
-        article.nlp()
+    return f"https://news.google.com/rss/search?q={encoded_query}"
+
+def fetch_feed_entries(company: str, key_term, top_n: int = None, run_id: str = None) -> list:
+    """
+    Fetch the top entries of a query's feed. With INCREMENTAL_FEEDS the request is a
+    conditional GET, and only entries newer than the feed's watermark (or as new but not the
+    entry that set it) are returned.
+    The feed's new state is staged for `run_id` until commit_feed_state() is called for
+    the query, or discarded by discard_feed_state().
+    A batched query takes FEED_TOP_N entries per key term in the batch.
+    """
+    import feedparser
+
+    rss_url = build_rss_url(company, key_term)
+    if top_n is None:
+        top_n = FEED_TOP_N * len(key_term.terms) if isinstance(key_term, QueryBatch) else FEED_TOP_N
+
+    feed_state = get_feed_state() if INCREMENTAL_FEEDS else None
+    state = feed_state.get(rss_url) if feed_state else {"etag": None, "modified": None}
+
+    metrics = get_metrics()
+    metrics.increment("search_units")
+    with metrics.timed("rss_fetch") as timer:
+        feed = feedparser.parse(rss_url, etag=state["etag"], modified=state["modified"])
+        if feed.get("status") == 304:
+            timer.skip("not_modified")
+        elif feed.get("bozo") and not feed.entries:
+            timer.fail("feed_error")
+
+    if not INCREMENTAL_FEEDS:
+        return feed.entries[:top_n]
+
+    if feed.get("status") == 304:
+        logging.debug(f"Feed unchanged for {company} - {key_term}")
+        return []
 
-        # summary = summarize_article(article.text) if article.text else ""
+    entries = feed.entries[:top_n]
+    watermark = state["watermark"] or 0
+
+    def is_new(entry) -> bool:
+        timestamp = entry_timestamp(entry)
+        if timestamp is None or timestamp > watermark:
+            return True
+        # Entries published in the same second as the watermark's one are only new if they are other entries
+        return timestamp == watermark and entry_id(entry) != state["newest_entry_id"]
+
+    feed_state.stage(rss_url, run=run_id, etag=feed.get("etag"), modified=feed.get("modified"),
+                     entries=[(entry.get("link"), entry_id(entry), entry_timestamp(entry)) for entry in entries])
+
+    return [entry for entry in entries if is_new(entry)]
+
+def commit_feed_state(company: str, key_term, run_id: str = None):
+    """Advance a query's feed watermark once the articles from its entries are stored"""
+    if INCREMENTAL_FEEDS:
+        get_feed_state().commit(build_rss_url(company, key_term), run=run_id)
+
+def hold_feed_entry(link: str, run_id: str = None):
+    """Keep the watermark of the run's feeds below an entry that could not be handled"""
+    if INCREMENTAL_FEEDS:
+        get_feed_state().hold(link, run=run_id)
+
+def discard_feed_state(run_id: str = None, company: str = None, key_term=None):
+    """Drop the feed state a run staged but did not commit, for one query or all of them"""
+    if INCREMENTAL_FEEDS:
+        feed_url = build_rss_url(company, key_term) if company is not None else None
+        get_feed_state().discard(run=run_id, feed_url=feed_url)
+
+def build_news_item(entry, company: str, key_term, since: datetime = None) -> dict:
+    """
+    Build the article record for an RSS entry, or return None if the entry is too old or,
+    with `since` (a scheduled run), published before it.
+    For a QueryBatch the entry is matched against the batch's key terms by title and summary.
+    """
+    if skip_article_based_on_age(entry, ARTICLE_AGE_DAYS):
+        get_metrics().count("rss_fetch", SKIP, "old_article")
+        logging.debug(f"Skipping old article from {entry.published}: {entry.title[:50]}...")
+        return None
+
+    if since is not None and (entry_timestamp(entry) or float("inf")) < since.timestamp():
+        get_metrics().count("rss_fetch", SKIP, "before_last_run")
+        logging.debug(f"Skipping article from before the last scheduled run: {entry.title[:50]}...")
+        return None
+
+    news_item = ArticleRecord(
+        title=entry.title,
+        url=entry.link,
+        publish_date=entry.published,
+        summary=entry.summary if 'summary' in entry else '',
+        text="",
+        company=company,
+        key_term=key_term
+    )
+
+    if isinstance(key_term, QueryBatch):
+        # An article found for one batch can mention the company's terms from other batches too
+        news_item['candidate_terms'] = key_term.all_terms
+        news_item['key_term'] = ""
+        news_item['matched_terms'] = match_key_terms(f"{news_item['title']} {news_item['summary']}",
+                                                     key_term.all_terms)
+
+    return news_item
+
+def attribute_news_item(news_item: dict) -> list:
+    """
+    Split an article found by a batched query into one record per key term it mentions.
+    Candidates are all of the company's key terms, not only the batch's. Terms not found in
+    the title or summary are looked up in the article text; an article that mentions none of
+    them is dropped.
+    """
+    candidate_terms = news_item.pop('candidate_terms', None)
+    matched_terms = news_item.pop('matched_terms', None)
+    if candidate_terms is None:
+        return [news_item]
+
+    if not matched_terms:
+        matched_terms = match_key_terms(news_item.get('text', ""), candidate_terms)
+    if not matched_terms:
+        logging.debug(f"No key term matched for batched article {news_item['url']}")
+        return []
 
-        return {
-            "title": article.title,
-            "authors": article.authors,
-            "publish_date": article.publish_date,
-            "summary": article.summary,
-            # "summary": summary,
-            "text": article.text,
-            "url": url
-        }
-    except Exception as e:
-        logging.debug(f"Error parsing and summarizing article {url}: {e}")
-        return {
-            "title": "",
-            "publish_date": None,
-            "url": "",
-            "summary": ""
-        }
+    return [news_item.replace(key_term=term) for term in matched_terms]
+
+def attribute_seen_item(news_item: dict, url: str) -> int:
+    """
+    Add the company and key term(s) of an item whose article is already stored (found by an
+    earlier run, or by another query of this one) to that article, without downloading it again.
+    Returns the number of new attributions.
+    """
+    canonical_url = get_duplicate_detector().canonical_url(url) or url
+    store = get_article_store()
+    if news_item.get('candidate_terms') is not None and not news_item.get('matched_terms'):
+        news_item['text'] = store.article_text(canonical_url)
+    records = attribute_news_item(news_item.replace(url=canonical_url))
+    added = store.add_attributions(records)
+    if added:
+        logging.debug(f"Added {added} attribution(s) to known article {canonical_url}")
+    return added
+
+def resolve_news_item(news_item: dict, browser_pool: BrowserPool = None, run_id: str = None) -> dict:
+    """
+    Replace the Google News link with the publisher URL. Returns None if the redirect failed
+    or the article was already seen; a seen article gets the item's company and key term(s)
+    added instead (see attribute_seen_item). A failed entry is held back from `run_id`'s
+    feed watermarks.
+    """
+    seen_index = get_seen_index()
+    google_link = news_item['url']
+    if google_link in seen_index:
+        get_metrics().count("redirect", SKIP, "already_seen")
+        logging.debug(f"Skipping already seen article: {news_item['title'][:50]}...")
+        # Only attribute when the link's article is still in the URL cache; a seen link is never resolved again
+        hit, article_url = get_url_cache().get(google_link)
+        if hit and article_url:
+            attribute_seen_item(news_item, article_url)
+        return None
+
+    with get_metrics().timed("redirect") as timer:
+        article_url = get_redirect_link(google_link, browser_pool)
+
+        if "google.com" in article_url:
+            timer.fail("failed_redirect")
+            logging.debug(f"Skipping article with failed redirect: {news_item['title']} {google_link}")
+            hold_feed_entry(google_link, run_id)
+            return None
+
+        seen = article_url in seen_index
+        if seen:
+            timer.skip("already_seen")
+            logging.debug(f"Skipping already seen article: {article_url}")
+
+    if seen:
+        attribute_seen_item(news_item, article_url)
+        return None
+
+    news_item['url'] = article_url
+    news_item['google_link'] = google_link
+    return news_item
+
+def download_article_html(url: str) -> str:
+    """Article HTML through the shared fetcher (timeouts, retries and per-domain circuit breakers)"""
+    return get_article_fetcher().fetch(url)
+
+def record_parse_metrics(parsed_article: dict, seconds: float):
+    """Parse and NLP timings measured in the parser worker, or the failure and its total time"""
+    metrics = get_metrics()
+    if parsed_article.get("error"):
+        metrics.observe("parse", seconds, FAIL, parsed_article["error"])
+        return
+    metrics.observe("parse", parsed_article.get("parse_seconds") or seconds)
+    if parsed_article.get("nlp_seconds") is not None:
+        metrics.observe("nlp", parsed_article["nlp_seconds"])
+
+def match_known_story(news_item: dict) -> bool:
+    """
+    If the item's headline belongs to a story that is already stored under another URL
+    (a syndicated copy), point the item at that article and return True.
+    """
+    canonical = get_duplicate_detector().match_title(news_item['title'])
+    if canonical is None or canonical[0] == news_item['url']:
+        return False
+
+    logging.debug(f"Skipping parse of known story {news_item['url']}, same as {canonical[0]}")
+    news_item['duplicate_url'] = news_item['url']
+    news_item['url'], news_item['title'] = canonical
+    return True
+
+def enrich_news_item(news_item: dict) -> dict:
+    """
+    Download the article and parse it in the parser pool, filling in publish date, summary and text.
+    Copies of stories that are already stored are not downloaded again.
+    """
+    article_url = news_item['url']
+    metrics = get_metrics()
 
-def search_news_rss(company: str, key_term: str) -> list:
-    search_query = f"{company} company {key_term}"
-    encoded_query = quote_plus(search_query)
+    try:
+        if match_known_story(news_item):
+            metrics.count("download", SKIP, "known_story")
+            return news_item
 
-    rss_url = f"https://news.google.com/rss/search?q={encoded_query}"
+        with metrics.timed("download") as timer:
+            try:
+                html = download_article_html(article_url)
+            except CircuitOpenError:
+                timer.skip("circuit_open")
+                raise
+            except FetchError:
+                timer.fail("fetch_error")
+                raise
+
+        parser_pool = get_parser_pool(workers=PARSE_WORKERS, timeout=PARSE_TIMEOUT)
+        start = perf_counter()
+        parsed_article = parser_pool.parse(article_url, html, nlp=SUMMARIZER_BACKEND == "newspaper")
+        record_parse_metrics(parsed_article, perf_counter() - start)
+
+        if parsed_article["publish_date"]:
+            news_item["publish_date"] = parsed_article["publish_date"]
+
+        if parsed_article["summary"]:
+            news_item["summary"] = parsed_article["summary"]
+        else:
+            logging.debug(f"No summary generated for article {article_url}, default entry summary.")
+        news_item["text"] = parsed_article.get("text", "")
+    except CircuitOpenError as e:
+        logging.info(f"Keeping feed summary for {article_url}: {e}")
+    except FetchError as e:
+        logging.warning(f"Keeping feed summary for {article_url}: {e}")
+    except Exception as e:
+        logging.error(f"Error parsing article {article_url}: {e}")
 
-    try:
-        feed = feedparser.parse(rss_url)
+    return news_item
 
+def search_news_rss(company: str, key_term, browser_pool: BrowserPool = None) -> list:
+    try:
         news_data = []
 
-        for entry in feed.entries[:1]:
-            article_url = get_redirect_link(entry.link)
-            # print(f"Redirected URL for {company} - {key_term}: {article_url}")
-
-            if "google.com" in article_url:
-                logging.debug(f"Skipping article with failed redirect: {entry.title} {entry.link}")
+        for entry in fetch_feed_entries(company, key_term):
+            news_item = build_news_item(entry, company, key_term)
+            if news_item is None:
                 continue
 
-            news_item = {
-                'title': entry.title,
-                'url': article_url,
-                'publish_date': entry.published,
-                'summary': entry.summary if 'summary' in entry else '',
-                'text': "",
-                'company': company,
-                'key_term': key_term
-            }
-
-            if skip_article_based_on_age(entry, ARTICLE_AGE_DAYS):
-                logging.debug(f"Skipping old article from {news_item['published']}: {entry.title[:50]}...")
+            news_item = resolve_news_item(news_item, browser_pool)
+            if news_item is None:
                 continue
 
-            try:
-                article_obj = Article(article_url)
-                parsed_article = parse_article(article_obj, article_url)
-
-                if parsed_article["publish_date"]:
-                    news_item["publish_date"] = parsed_article["publish_date"]
-
-                if parsed_article["summary"]:
-                    news_item["summary"] = parsed_article["summary"]
-                else:
-                    logging.debug(f"No summary generated for article {article_url}, default entry summary.")
-                news_item["text"] = parsed_article["text"]
-            except Exception as e:
-                logging.error(f"Error parsing article {article_url}: {e}")
-            
-            news_data.append(news_item)
+            news_data.extend(attribute_news_item(enrich_news_item(news_item)))
 
+        commit_feed_state(company, key_term)
         return news_data
     except Exception as e:
         logging.error(f"Error fetching RSS feed for {company} - {key_term}: {e}")
+        discard_feed_state(company=company, key_term=key_term)
         return []
 
-def write_to_text_file(news_articles: pd.DataFrame, filename: str = "news_articles.txt"):
+def summarize_articles(news_articles: list) -> list:
+    """
+    Replace the summaries of parsed articles with the configured summarizer's, in one batch.
+    With the newspaper backend the parser pool already summarized them.
+    """
+    if SUMMARIZER_BACKEND == "newspaper":
+        return news_articles
+
+    articles_with_text = [article for article in news_articles if article.get('text')]
+    if not articles_with_text:
+        return news_articles
+
+    with get_metrics().timed("nlp") as timer:
+        try:
+            summarizer = get_summarizer(SUMMARIZER_BACKEND, quantize=PEGASUS_QUANTIZE)
+            for article, summary in zip(articles_with_text, summarizer.summarize_many(articles_with_text)):
+                if summary:
+                    article['summary'] = summary
+        except Exception as e:
+            timer.fail("summarizer_error")
+            logging.error(f"Error summarizing {len(articles_with_text)} articles with {SUMMARIZER_BACKEND}: {e}")
+
+    return news_articles
+
+def save_articles(news_articles: list, flush: bool = True) -> list:
+    """
+    Summarize and store the articles and mark their links as seen, returning the ones that are new.
+    Near-duplicates of stored stories are merged into the existing article. Once stored (and
+    indexed for full-text search) the articles' text is dropped.
+    """
+    metrics = get_metrics()
+    summarize_articles(news_articles)
+
+    with metrics.timed("dedup"):
+        merged_articles = get_duplicate_detector().merge(news_articles)
+
+    with metrics.timed("persist"):
+        new_articles = get_article_store().add_articles(merged_articles)
+
+        seen_index = get_seen_index()
+        seen_index.add_many(article.get(key) for article in merged_articles
+                            for key in ('url', 'google_link', 'duplicate_url'))
+        if flush:
+            seen_index.flush()
+    release_text(news_articles)
+
+    metrics.increment("articles_found", len(merged_articles))
+    metrics.increment("articles_merged", sum(1 for article in merged_articles if article.get('duplicate_url')))
+    metrics.increment("articles_new", len(new_articles))
+    return new_articles
+
+def plan_search_units(companies: list[str], key_terms: list[str]) -> list:
+    """One unit per company and key term, or per company and OR-query batch with BATCH_QUERIES"""
+    if not BATCH_QUERIES:
+        return [(company, term) for company in companies for term in key_terms]
+
+    return [(company, batch) for company in companies
+            for batch in build_batches(company, key_terms, max_words=MAX_QUERY_WORDS)]
+
+def create_search_engine(browser_pool: BrowserPool = None, since: datetime = None,
+                         completed_units: set = None, units: list = None, run_id: str = None) -> SearchEngine:
+    """
+    Search engine over the NewsRadar stages; units whose feed URL is in `completed_units` are skipped.
+    With `units` (a list of (company, key_term), as claimed by a queue worker) the engine searches
+    exactly those instead of planning the companies and key terms it is given. Feed state is staged
+    for `run_id`, see commit_feed_state.
+    """
+    pool = browser_pool or get_browser_pool()
+    completed_units = completed_units or set()
+
+    def plan_remaining_units(companies: list[str], key_terms: list[str]) -> list:
+        planned = units if units is not None else plan_search_units(companies, key_terms)
+        return [(company, term) for company, term in planned
+                if build_rss_url(company, term) not in completed_units]
+
+    return SearchEngine(
+        fetch_entries=lambda company, key_term: fetch_feed_entries(company, key_term, run_id=run_id),
+        build_item=lambda entry, company, key_term: build_news_item(entry, company, key_term, since),
+        resolve_item=lambda news_item: resolve_news_item(news_item, pool, run_id),
+        parse_item=lambda news_item: attribute_news_item(enrich_news_item(news_item)),
+        feed_url=build_rss_url,
+        plan_units=plan_remaining_units,
+        feed_concurrency=FEED_CONCURRENCY,
+        redirect_concurrency=REDIRECT_CONCURRENCY,
+        parse_concurrency=PARSE_CONCURRENCY,
+        host_interval=HOST_REQUEST_INTERVAL
+    )
+
+def enqueue_search(companies: list[str], key_terms: list[str], receiver_email=None, since: datetime = None,
+                   digest_after_id: int = None) -> str:
+    """Queue a search for the worker processes (see worker.py) instead of running it here. Returns the search id."""
+    units = [(company, term, build_rss_url(company, term)) for company, term in plan_search_units(companies, key_terms)]
+    return get_work_queue().enqueue_search(companies, key_terms, units, receiver_email=receiver_email, since=since,
+                                           digest_after_id=digest_after_id)
+
+def digest_articles(run_articles, companies: list[str], key_terms: list[str], digest_after_id: int = None) -> tuple:
+    """
+    (records, digest_row_id) of a search's digest: `run_articles`, the records of the articles the
+    search stored first or, with `digest_after_id`, every article stored for the companies and key
+    terms after that row (see main_web_friendly). `digest_row_id` is the store's newest row when
+    the digest was read.
+    """
+    store = get_article_store()
+    digest_row_id = store.last_article_id()
+    if digest_after_id is None:
+        return list(run_articles), digest_row_id
+    return store.articles_added(digest_after_id, digest_row_id, companies, key_terms), digest_row_id
+
+def write_to_text_file(news_articles: list, filename: str = "news_articles.txt"):
     with open(filename, "w", encoding="utf-8") as f:
-        for index, row in news_articles.iterrows():
+        for row in merge_attributions(news_articles):
             if row['title'] == "":
                 continue
             f.write(f"Title: {row['title']}\n")
@@ -212,161 +536,343 @@ def write_to_text_file(news_articles: pd.DataFrame, filename: str = "news_articl
             f.write(f"Summary: {row['summary']}\n")
             f.write("\n")
 
-def write_to_email_body(news_articles: pd.DataFrame) -> str:
-    body = "Found the following news articles:\n\n"
-    for index, row in news_articles.iterrows():
-        if row["title"] == "":
-            continue
-        body += f"{row['company']} - Focus: {row['key_term']}\n"
-        body += f"Title: {row['title']}\n"
-        body += f"Publish Date: {row['publish_date']}\n"
-        body += f"URL: {row['url']}\n"
-        body += f"Summary: {row['summary']}\n"
-        body += "\n"
-    return body
+def write_to_email_body(news_articles: list) -> str:
+    """Plain-text digest of article records, as render_digest takes them"""
+    return render_digest(news_articles, intro="Found the following news articles:")["text"]
 
-def main(companies : list[str] = COMPANIES, key_terms: list[str] = KEY_TERMS):
-
-    # Can replace with a DB to keep track of what old articles have been seen
-    # Can remove old articles if they are past the date range 
-    old_articles = get_old_articles() 
+def build_results_email(new_articles: list, intro: str, empty_body: str) -> tuple:
+    """Plain-text and HTML bodies of the digest of the new articles, grouped by company"""
+    if not new_articles:
+        return empty_body, None
+    digest = render_digest(new_articles, intro=intro)
+    return digest["text"], digest["html"]
 
-    news_articles = []
-
-    for company in tqdm(companies, desc="Processing Companies"):
-        for term in key_terms:
-            news_article = search_news_rss(company, term)
+def send_results_email(receiver_email, subject: str, body: str, html: str = None) -> dict:
+    """Email the digest to every recipient over one SMTP connection. Returns {recipient: sent}."""
+    with get_metrics().timed("email") as timer:
+        try:
+            results = send_digest(receiver_email, subject, body, html)
+        except Exception as e:
+            timer.fail("smtp_error")
+            logging.error(f"Failed to send email to {receiver_email}: {e}")
+            return {}
+
+        if not results:
+            timer.skip("no_recipients")
+        elif not all(results.values()):
+            timer.fail("recipient_failed")
+        return results
+
+def write_search_report(run_start: dict, started: float, memory: RssSampler, run_id: str = None,
+                        **details) -> str:
+    """
+    Write the JSON run report: per-stage latency and outcomes and throughput since `run_start`
+    (a snapshot of the run's metrics, see scoped_run_metrics), the run's peak memory from `memory`,
+    plus redirect tier and per-domain download statistics. Memory and the redirect and download
+    statistics are per process, so they overlap between searches running at the same time.
+    """
+    report = get_metrics().report_since(run_start, perf_counter() - started)
+    report["run_id"] = run_id
+    report.update(details)
+    report["memory"] = memory.stop()
+    logging.info(f"Search memory: peak RSS {report['memory']['rss_peak_mb']} MB, "
+                 f"parser workers {report['memory']['workers_rss_peak_mb']} MB")
+    report["redirects"] = get_redirect_resolver().metrics()
+    report["domains"] = get_article_fetcher().stats()
+    try:
+        return write_run_report(report, run_id=run_id)
+    except OSError as e:
+        logging.error(f"Could not write run report: {e}")
+        return None
+
+def search_and_store(companies: list[str], key_terms: list[str], progress_callback=None, progress_start: int = 20,
+                     progress_end: int = 80, unit_callback=None, cancel_event=None, articles_callback=None,
+                     since: datetime = None, receiver_email=None) -> dict:
+    """
+    Run the search, storing each query's articles as soon as it finishes and checkpointing every
+    completed query. A search for the same companies, key terms, `since` and recipients as an
+    unfinished earlier run resumes it. Articles are not kept in memory; the new ones are read back with
+    get_checkpoint_store().new_articles(run_id). Returns {"run_id", "resumed", "units_skipped"}.
+    The caller ends the run with finish_run once the digest is sent.
+    """
+    checkpoints = get_checkpoint_store()
+    run = checkpoints.begin_run(companies, key_terms, since=since, receiver_email=receiver_email)
+    search_engine = create_search_engine(since=since, completed_units=run["completed_units"], run_id=run["id"])
+    last_flush = perf_counter()
+
+    def store_results(company, key_term, articles):
+        stored = save_articles(articles, flush=False)
+        checkpoints.record_articles(run["id"], len(articles), stored)
+        if articles_callback and stored:
+            articles_callback(stored)
+
+    def complete_unit(company, key_term):
+        nonlocal last_flush
+        commit_feed_state(company, key_term, run_id=run["id"])
+        checkpoints.complete_unit(run["id"], build_rss_url(company, key_term))
+        if perf_counter() - last_flush >= SEEN_INDEX_FLUSH_INTERVAL:
+            last_flush = perf_counter()
+            get_seen_index().flush()
 
-            for article in news_article:
-                news_articles.append(article)
-            sleep(0.25)
+    try:
+        search_engine.search(companies, key_terms, progress_callback=progress_callback,
+                             progress_start=progress_start, progress_end=progress_end,
+                             unit_callback=unit_callback, cancel_event=cancel_event,
+                             results_callback=store_results, complete_callback=complete_unit, collect=False)
+    except Exception:
+        checkpoints.finish_run(run["id"], FAILED)
+        raise
+    finally:
+        # Units that failed or were cancelled fetch their entries again next time
+        discard_feed_state(run["id"])
+        get_seen_index().flush()
+        get_url_cache().flush()
+
+    return {"run_id": run["id"], "resumed": run["resumed"], "units_skipped": len(run["completed_units"])}
+
+@scoped_run_metrics
+def main(companies : list[str] = COMPANIES, key_terms: list[str] = KEY_TERMS):
+    from tqdm import tqdm
 
-    news_articles = pd.DataFrame(news_articles)
+    run_start, started = get_metrics().snapshot(), perf_counter()
+    memory = RssSampler(child_pids=parser_worker_pids).start()
+    check_resources()
 
-    if not old_articles.empty and 'url' in old_articles.columns:
-        new_news_articles = news_articles[~news_articles['url'].isin(old_articles['url'])]
-    else:
-        new_news_articles = news_articles
-        logging.info("No previous articles found or invalid format, treating all articles as new.")
+    with tqdm(total=len(plan_search_units(companies, key_terms)), desc="Processing Queries") as progress_bar:
+        run = search_and_store(companies, key_terms, receiver_email=RECIEVER_EMAIL,
+                               progress_callback=lambda progress, message: progress_bar.update(1))
+    get_redirect_resolver().log_metrics()
+    get_article_fetcher().log_stats()
 
-    news_articles[["company", "key_term","title", "publish_date", "url"]].to_csv("news_articles.csv", index=False, encoding='utf-8-sig', mode='a')
+    checkpoints = get_checkpoint_store()
+    new_articles = list(checkpoints.new_articles(run["run_id"]))
 
     subject = f"NewsRadar - {datetime.now().strftime('%Y-%m-%d')}"
-    body = ""
 
-    if not new_news_articles.empty:
-        print(f"Found {len(new_news_articles)} new articles.")
-        write_to_text_file(new_news_articles, "news_articles.txt")
-        subject += f"- Found {len(new_news_articles)} new articles"
-        body = write_to_email_body(new_news_articles)
+    if new_articles:
+        print(f"Found {len(new_articles)} new articles.")
+        write_to_text_file(new_articles, "news_articles.txt")
+        subject += f"- Found {len(new_articles)} new articles"
     else:
         print("No new articles found.")
         subject += " - No New Articles"
-        body = "No news articles found this week."
-        
-    try:
-        send_email(RECIEVER_EMAIL, subject, body)
-        logging.info(f"Email sent successfully to {RECIEVER_EMAIL}")
-    except Exception as e:
-        logging.error(f"Failed to send email to {RECIEVER_EMAIL}: {e}")
+
+    body, html = build_results_email(new_articles, intro="Found the following news articles:",
+                                     empty_body="No news articles found this week.")
+    email_status = send_results_email(RECIEVER_EMAIL, subject, body, html)
+    checkpoints.finish_run(run["run_id"], COMPLETED)
+    write_search_report(run_start, started, memory, run_id=run["run_id"], companies=len(companies),
+                        key_terms=len(key_terms), **checkpoints.summary(run["run_id"]))
     
     # Return results for web app usage
     return {
-        'all_articles': news_articles,
-        'new_articles': new_news_articles,
+        'new_articles': new_articles,
+        'articles_found': checkpoints.summary(run["run_id"])["articles_found"],
         'subject': subject,
-        'body': body
+        'body': body,
+        'email_status': email_status
     }
 
-def main_web_friendly(companies: list[str], key_terms: list[str], progress_callback=None, receiver_email=None):
-    """Web-app friendly version of main function with progress tracking and custom email"""
+@scoped_run_metrics
+def main_web_friendly(companies: list[str], key_terms: list[str], progress_callback=None, receiver_email=None,
+                      unit_callback=None, cancel_event=None, articles_callback=None, since: datetime = None,
+                      digest_after_id: int = None):
+    """
+    Web-app friendly version of main function with progress tracking and custom email.
+    `unit_callback(done, total)` reports completed search units and `articles_callback(articles)`
+    receives new articles as soon as they are stored; setting `cancel_event` stops the search
+    early, keeps what was found so far and skips the email. With `since` only articles published
+    after it are considered, as scheduled runs do with the time of their last run.
+    An interrupted search is resumed by the next search for the same companies and key terms,
+    see search_and_store.
+
+    By default the digest holds the articles this run stored first. With `digest_after_id` (a
+    schedule's digest_row_id) it holds every article stored for these companies and key terms
+    since that schedule's last digest, whichever search found it; the result's `digest_row_id`
+    is where the next digest starts.
+    """
+    run_start, started = get_metrics().snapshot(), perf_counter()
+    memory = RssSampler(child_pids=parser_worker_pids).start()
+    run = None
     try:
         if progress_callback:
             progress_callback(10, "Initializing search...")
         
-        old_articles = get_old_articles()
-        news_articles = []
-        
-        total_combinations = len(companies) * len(key_terms)
-        current_combination = 0
+        check_resources()
         
         if progress_callback:
             progress_callback(20, "Searching for news articles...")
         
-        for company in companies:
-            for term in key_terms:
-                current_combination += 1
-                if progress_callback:
-                    progress = 20 + int((current_combination / total_combinations) * 60)
-                    progress_callback(progress, f"Searching {company} for {term}...")
-                
-                news_article = search_news_rss(company, term)
-                for article in news_article:
-                    news_articles.append(article)
-                sleep(0.25)
+        # Articles are stored and checkpointed as each query finishes
+        run = search_and_store(companies, key_terms, progress_callback=progress_callback,
+                               progress_start=20, progress_end=80, unit_callback=unit_callback,
+                               cancel_event=cancel_event, articles_callback=articles_callback, since=since,
+                               receiver_email=receiver_email)
+        if run["units_skipped"]:
+            logging.info(f"Resumed search run {run['run_id']}, skipped {run['units_skipped']} completed queries")
+        get_redirect_resolver().log_metrics()
+        get_article_fetcher().log_stats()
         
         if progress_callback:
             progress_callback(85, "Processing results...")
         
-        news_articles = pd.DataFrame(news_articles)
-        
-        if not old_articles.empty and 'url' in old_articles.columns:
-            new_news_articles = news_articles[~news_articles['url'].isin(old_articles['url'])]
-        else:
-            new_news_articles = news_articles
-            logging.info("No previous articles found or invalid format, treating all articles as new.")
-        
-        # Save articles
-        if not news_articles.empty:
-            news_articles[["company", "key_term","title", "publish_date", "url"]].to_csv(
-                "news_articles.csv", index=False, encoding='utf-8-sig', mode='a')
+        checkpoints = get_checkpoint_store()
+        new_articles, digest_row_id = digest_articles(checkpoints.new_articles(run["run_id"]), companies, key_terms,
+                                                      digest_after_id)
         
         # Prepare email
         subject = f"NewsRadar - {datetime.now().strftime('%Y-%m-%d')}"
-        body = ""
         
-        if not new_news_articles.empty:
-            logging.info(f"Found {len(new_news_articles)} new articles.")
-            write_to_text_file(new_news_articles, "news_articles.txt")
-            subject += f" - Found {len(new_news_articles)} new articles"
-            body = "NewsRadar found the following new articles:\n\n"
-            body += write_to_email_body(new_news_articles)
+        if new_articles:
+            logging.info(f"Found {len(new_articles)} new articles.")
+            write_to_text_file(new_articles, "news_articles.txt")
+            subject += f" - Found {len(new_articles)} new articles"
         else:
             logging.info("No new articles found.")
             subject += " - No New Articles"
-            body = "NewsRadar found no news articles."
+        body, html = build_results_email(new_articles, intro="NewsRadar found the following new articles:",
+                                         empty_body="NewsRadar found no news articles.")
+
+        cancelled = cancel_event is not None and cancel_event.is_set()
 
         # Send email if receiver_email is provided
-        if receiver_email:
-            try:
-                send_email(receiver_email, subject, body)
-                logging.info(f"Email sent successfully to {receiver_email}")
-            except Exception as e:
-                logging.error(f"Failed to send email to {receiver_email}: {e}")
+        email_status = {}
+        if receiver_email and not cancelled:
+            email_status = send_results_email(receiver_email, subject, body, html)
+        email_failed = [recipient for recipient, sent in email_status.items() if not sent]
+        checkpoints.finish_run(run["run_id"], CANCELLED if cancelled else COMPLETED)
+        run_summary = checkpoints.summary(run["run_id"])
+        run_report = write_search_report(run_start, started, memory, run_id=run["run_id"],
+                                         companies=len(companies), key_terms=len(key_terms), cancelled=cancelled,
+                                         resumed=run["resumed"], **run_summary)
+        
+        if cancelled:
+            if progress_callback:
+                progress_callback(100, f"Search cancelled. Kept {len(new_articles)} new articles.")
+            return {
+                'success': True,
+                'cancelled': True,
+                'new_articles': new_articles,
+                'articles_found': run_summary["articles_found"],
+                'subject': subject,
+                'body': body,
+                'run_report': run_report,
+                'digest_row_id': digest_row_id,
+                'message': f"Search cancelled. Kept {len(new_articles)} new articles."
+            }
         
         if progress_callback:
-            progress_callback(100, f"Search completed! Found {len(new_news_articles)} new articles.")
+            progress_callback(100, f"Search completed! Found {len(new_articles)} new articles.")
+        
+        message = f"Found {len(new_articles)} new articles."
+        if run["resumed"]:
+            message += f" Resumed an interrupted search, {run['units_skipped']} queries were already done."
+        if email_failed:
+            message += f" Email could not be sent to {', '.join(email_failed)}."
         
         return {
             'success': True,
-            'all_articles': news_articles,
-            'new_articles': new_news_articles,
+            'new_articles': new_articles,
+            'articles_found': run_summary["articles_found"],
             'subject': subject,
             'body': body,
-            'message': f"Found {len(new_news_articles)} new articles."
+            'email_status': email_status,
+            'run_report': run_report,
+            'digest_row_id': digest_row_id,
+            'message': message
         }
         
     except Exception as e:
         logging.error(f"Error in main_web_friendly: {e}")
+        if run is not None:
+            # Left resumable: the next search for the same companies and key terms continues it
+            get_checkpoint_store().finish_run(run["run_id"], FAILED)
+        write_search_report(run_start, started, memory, run_id=run["run_id"] if run else None,
+                            companies=len(companies), key_terms=len(key_terms), error=str(e))
         if progress_callback:
             progress_callback(0, f"Search failed: {str(e)}")
         return {
             'success': False,
             'error': str(e),
-            'all_articles': pd.DataFrame(),
-            'new_articles': pd.DataFrame(),
+            'new_articles': [],
+            'articles_found': 0,
             'message': f"Search failed: {str(e)}"
         }
 
+def run_queued_search(companies: list[str], key_terms: list[str], progress_callback=None, receiver_email=None,
+                      unit_callback=None, cancel_event=None, articles_callback=None, since: datetime = None,
+                      digest_after_id: int = None, poll_interval: float = 1.0) -> dict:
+    """
+    Queue-mode counterpart of main_web_friendly: enqueue the search for the worker processes and
+    follow it until a worker has sent its digest, reporting progress and new articles through the
+    same callbacks. Setting `cancel_event` cancels the queued search. Returns the same fields.
+
+    The search is failed when no worker has been seen for a lease, or QUEUED_SEARCH_TIMEOUT
+    passes, and a cancelled search is finished here when no worker is left to finalize it.
+    """
+    work_queue = get_work_queue()
+    search_id = enqueue_search(companies, key_terms, receiver_email=receiver_email, since=since,
+                               digest_after_id=digest_after_id)
+    if progress_callback:
+        progress_callback(10, "Search queued for the workers...")
+
+    last_article_id = 0
+    cancel_sent = False
+    deadline = monotonic() + QUEUED_SEARCH_TIMEOUT
+    workers_seen_at = monotonic()
+    while True:
+        if cancel_event is not None and cancel_event.is_set() and not cancel_sent:
+            work_queue.cancel(search_id)
+            cancel_sent = True
+
+        workers = work_queue.workers()
+        if workers:
+            workers_seen_at = monotonic()
+        elif monotonic() - workers_seen_at >= work_queue.lease_seconds:
+            if cancel_sent:
+                work_queue.abandon(search_id, QUEUE_CANCELLED, "Search cancelled.")
+            else:
+                work_queue.abandon(search_id, QUEUE_FAILED,
+                                   f"No worker seen for {work_queue.lease_seconds:.0f} seconds, is worker.py running?")
+        if monotonic() >= deadline:
+            work_queue.abandon(search_id, QUEUE_CANCELLED if cancel_sent else QUEUE_FAILED,
+                               f"Search did not finish within {QUEUED_SEARCH_TIMEOUT} seconds.")
+        status = work_queue.status(search_id)
+
+        rows = work_queue.article_rows(search_id, last_article_id)
+        if rows:
+            last_article_id = rows[-1][0]
+            if articles_callback:
+                articles_callback([record for _, record in rows])
+
+        if unit_callback:
+            unit_callback(status["units_done"] + status["units_failed"], status["units_total"])
+        if progress_callback and status["units_total"]:
+            done = (status["units_done"] + status["units_failed"]) / status["units_total"]
+            message = ("Sending results..." if status["state"] == FINALIZING else
+                       f"Searching: {status['units_done']} of {status['units_total']} queries done "
+                       f"({len(workers)} workers)...")
+            progress_callback(20 + int(done * 60), message)
+
+        if status["state"] in QUEUE_FINISHED_STATES and not rows:
+            break
+        sleep(poll_interval)
+
+    new_articles = list(work_queue.new_articles(search_id))
+    cancelled = status["state"] == QUEUE_CANCELLED
+    if progress_callback:
+        progress_callback(100, status["message"])
+    return {
+        'success': status["state"] != QUEUE_FAILED,
+        'cancelled': cancelled,
+        'new_articles': new_articles,
+        'articles_found': status["articles_found"],
+        'email_status': status["email_status"],
+        'search_id': search_id,
+        'digest_row_id': status["digest_row_id"],
+        'error': status["message"],
+        'message': status["message"]
+    }
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""
+HTTP fetch layer for article downloads.
+
+Every request has separate connect and read timeouts, and transient failures
+(connection errors, timeouts, 429 and 5xx) are retried with jittered
+exponential backoff. Each publisher domain has a circuit breaker: after
+`failure_threshold` consecutive failures the domain is skipped for `cooldown`
+seconds, then a single trial request decides whether it is healthy again. So
+one slow or broken publisher costs a few bounded requests instead of stalling
+the search. Per-domain success, failure and latency statistics are kept for
+the run report.
+"""
+
+import logging
+import random
+import re
+import threading
+from time import monotonic, perf_counter, sleep
+from urllib.parse import urlparse
+
+from browser_pool import USER_AGENT
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Status codes worth retrying; other 4xx responses are final
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+# Missing pages say nothing about the health of the publisher
+NOT_FOUND_STATUSES = {404, 410}
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([A-Za-z0-9_\-]+)""", re.IGNORECASE)
+
+
+class FetchError(Exception):
+    """An article could not be downloaded"""
+
+
+class CircuitOpenError(FetchError):
+    """The article's domain is being skipped after repeated failures"""
+
+
+def domain_of(url: str) -> str:
+    host = urlparse(url).netloc.lower().rsplit("@", 1)[-1].split(":", 1)[0]
+    return host[4:] if host.startswith("www.") else host
+
+
+class DomainHealth:
+    """Circuit breaker and statistics of one publisher domain"""
+
+    def __init__(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.skipped = 0
+        self.seconds = 0.0
+        self.last_error = None
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "success_rate": round(self.successes / self.attempts, 3) if self.attempts else None,
+            "mean_seconds": round(self.seconds / self.attempts, 3) if self.attempts else None,
+            "last_error": self.last_error
+        }
+
+
+class ArticleFetcher:
+    """
+    Download article HTML with timeouts, retries and per-domain circuit breakers.
+
+    - `connect_timeout` / `read_timeout`: seconds to connect and between received bytes
+    - `retries` / `backoff` / `max_backoff`: retry policy for transient failures, sleeping a
+      random time up to `backoff * 2 ** attempt` (capped at `max_backoff`) between attempts
+    - `failure_threshold` / `cooldown`: consecutive failures that open a domain's circuit and
+      how many seconds it stays open
+    - `max_bytes`: larger responses are cut off
+    """
+
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 15, retries: int = 2,
+                 backoff: float = 0.5, max_backoff: float = 8, failure_threshold: int = 5, cooldown: float = 300,
+                 pool_connections: int = 16, max_bytes: int = 5 * 1024 * 1024):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.pool_connections = pool_connections
+        self.max_bytes = max_bytes
+
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._domains = {}
+
+    def _get_session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_connections)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"User-Agent": USER_AGENT,
+                                        "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8"})
+                self._session = session
+            return self._session
+
+    # region Circuit breaker
+    def _health(self, domain: str) -> DomainHealth:
+        health = self._domains.get(domain)
+        if health is None:
+            health = self._domains[domain] = DomainHealth()
+        return health
+
+    def _allow(self, domain: str) -> bool:
+        with self._lock:
+            health = self._health(domain)
+            if health.state == CLOSED:
+                return True
+            if health.state == OPEN and monotonic() >= health.open_until:
+                health.state = HALF_OPEN
+            # Half open: let exactly one trial request through
+            if health.state == HALF_OPEN and not health.trial_in_flight:
+                health.trial_in_flight = True
+                return True
+            health.skipped += 1
+            return False
+
+    def _record(self, domain: str, seconds: float, error: str = None, counts_against_domain: bool = True):
+        with self._lock:
+            health = self._health(domain)
+            health.attempts += 1
+            health.seconds += seconds
+            health.trial_in_flight = False
+
+            if error is None or not counts_against_domain:
+                if error is None:
+                    health.successes += 1
+                else:
+                    health.failures += 1
+                    health.last_error = error
+                health.consecutive_failures = 0
+                health.state = CLOSED
+                return
+
+            health.failures += 1
+            health.last_error = error
+            health.consecutive_failures += 1
+            if health.state == HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+                if health.state != OPEN:
+                    logging.warning(f"Skipping {domain} for {self.cooldown:.0f}s after "
+                                    f"{health.consecutive_failures} failed downloads (last: {error})")
+                health.state = OPEN
+                health.open_until = monotonic() + self.cooldown
+    # endregion
+
+    # region Fetching
+    def _delay(self, attempt: int, retry_after: str = None) -> float:
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _read(self, response) -> str:
+        content = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            content.extend(chunk)
+            if len(content) >= self.max_bytes:
+                logging.debug(f"Truncated {response.url} at {self.max_bytes} bytes")
+                break
+
+        encoding = None
+        if "charset=" in response.headers.get("Content-Type", "").lower():
+            encoding = response.encoding
+        if encoding is None:
+            match = _META_CHARSET.search(bytes(content[:4096]))
+            encoding = match.group(1).decode("ascii") if match else "utf-8"
+        try:
+            return content.decode(encoding, errors="replace")
+        except LookupError:
+            return content.decode("utf-8", errors="replace")
+
+    def _get(self, url: str) -> tuple:
+        """One attempt. Returns (html, error, retryable, counts_against_domain, retry_after)."""
+        import requests
+
+        try:
+            with self._get_session().get(url, timeout=(self.connect_timeout, self.read_timeout),
+                                         allow_redirects=True, stream=True) as response:
+                if response.status_code >= 400:
+                    return (None, f"HTTP {response.status_code}", response.status_code in RETRY_STATUSES,
+                            response.status_code not in NOT_FOUND_STATUSES, response.headers.get("Retry-After"))
+                return self._read(response), None, False, True, None
+        except requests.exceptions.Timeout:
+            return None, "timeout", True, True, None
+        except requests.exceptions.ConnectionError as e:
+            return None, f"connection error: {e.__class__.__name__}", True, True, None
+        except requests.exceptions.RequestException as e:
+            return None, f"request error: {e.__class__.__name__}", False, True, None
+
+    def fetch(self, url: str) -> str:
+        """
+        Return the HTML of an article. Raises CircuitOpenError if its domain is being
+        skipped, or FetchError once the retries are used up.
+        """
+        domain = domain_of(url)
+        error = None
+
+        for attempt in range(self.retries + 1):
+            if not self._allow(domain):
+                raise CircuitOpenError(f"{domain} is temporarily skipped after repeated failures")
+
+            start = perf_counter()
+            html, error, retryable, counts_against_domain, retry_after = self._get(url)
+            self._record(domain, perf_counter() - start, error, counts_against_domain)
+            if error is None:
+                return html
+            if not retryable or attempt == self.retries:
+                break
+            sleep(self._delay(attempt, retry_after))
+
+        raise FetchError(f"Download of {url} failed: {error}")
+    # endregion
+
+    def stats(self) -> dict:
+        """Per-domain circuit state, success rate and mean latency"""
+        with self._lock:
+            return {domain: health.to_dict() for domain, health in self._domains.items()}
+
+    def log_stats(self, top: int = 5):
+        stats = self.stats()
+        attempts = sum(domain["attempts"] for domain in stats.values())
+        successes = sum(domain["successes"] for domain in stats.values())
+        skipped = sum(domain["skipped"] for domain in stats.values())
+        worst = sorted((item for item in stats.items() if item[1]["failures"]),
+                       key=lambda item: item[1]["failures"], reverse=True)[:top]
+        message = (f"Article downloads: {successes}/{attempts} succeeded across {len(stats)} domains, "
+                   f"{skipped} skipped by open circuits")
+        if worst:
+            message += "; most failures: " + ", ".join(f"{name} ({domain['failures']})" for name, domain in worst)
+        logging.info(message)
+
+
+_shared_fetcher = None
+_shared_fetcher_lock = threading.Lock()
+
+
+def get_article_fetcher() -> ArticleFetcher:
+    """Return the process-wide article fetcher"""
+    global _shared_fetcher
+    with _shared_fetcher_lock:
+        if _shared_fetcher is None:
+            _shared_fetcher = ArticleFetcher()
+        return _shared_fetcher
@@ -0,0 +1,265 @@
+"""
+Process pool for the CPU-bound article parse and NLP stage.
+
+newspaper's `parse()` and `nlp()` (keyword extraction and summarization through
+NLTK) hold the GIL, so running them on the search threads serializes the whole
+pipeline. Here the already downloaded HTML is handed to worker processes which
+load the NLTK resources once at startup. Each worker handles one article at a
+time; a worker that exceeds the timeout is killed and replaced.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from time import perf_counter
+
+
+def empty_parse_result(error: str = "parse_error") -> dict:
+    """Result returned when an article could not be parsed, same shape as parse_html's"""
+    return {
+        "title": "",
+        "publish_date": None,
+        "url": "",
+        "summary": "",
+        "error": error
+    }
+
+
+# region Worker process
+def _load_resources():
+    import nltk
+
+    for resource in ("tokenizers/punkt/english.pickle",):
+        try:
+            nltk.data.load(resource)
+        except LookupError:
+            logging.warning(f"NLTK resource {resource} is not installed")
+
+
+def parse_html(url: str, html: str, nlp: bool = True) -> dict:
+    """
+    Parse already downloaded HTML and, with `nlp`, run newspaper's NLP on it.
+    The time spent in each step is returned in `parse_seconds` and `nlp_seconds`.
+    """
+    try:
+        from newspaper import Article
+
+        start = perf_counter()
+        article = Article(url)
+        article.download(input_html=html)
+        article.parse()
+        parse_seconds = perf_counter() - start
+        if nlp:
+            article.nlp()
+        nlp_seconds = perf_counter() - start - parse_seconds if nlp else None
+
+        return {
+            "title": article.title,
+            "authors": article.authors,
+            "publish_date": article.publish_date,
+            "summary": article.summary,
+            "text": article.text,
+            "url": url,
+            "parse_seconds": parse_seconds,
+            "nlp_seconds": nlp_seconds
+        }
+    except Exception as e:
+        logging.debug(f"Error parsing and summarizing article {url}: {e}")
+        return empty_parse_result()
+
+
+def _worker_main(connection):
+    _load_resources()
+
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        connection.send(parse_html(*task))
+# endregion
+
+
+class _Worker:
+
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_connection,), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        finally:
+            self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+            self.process.join(timeout=5)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+        self.connection.close()
+
+
+class ArticleParserPool:
+    """
+    Pool of parse/NLP worker processes.
+
+    - `workers`: number of processes, defaults to every core on the machine
+    - `timeout`: seconds an article may take before its worker is killed
+    """
+
+    def __init__(self, workers: int = None, timeout: float = 60):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.timeout = timeout
+
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._started = False
+        self.timeouts = 0
+        self.crashes = 0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return self
+            # Left over from close: stopped workers and the sentinel
+            while not self._idle.empty():
+                self._idle.get_nowait()
+            for _ in range(self.workers):
+                worker = _Worker(self._context)
+                self._all.append(worker)
+                self._idle.put(worker)
+            self._started = True
+            logging.info(f"Article parser pool started with {self.workers} worker(s)")
+            return self
+
+    def close(self):
+        with self._lock:
+            if not self._started:
+                return
+            for worker in self._all:
+                worker.stop()
+            self._all = []
+            self._started = False
+            # Drop the stopped idle workers, so the parse calls waiting for one get the sentinel instead;
+            # each one passes it on to the next
+            while True:
+                try:
+                    self._idle.get_nowait()
+                except queue.Empty:
+                    break
+            self._idle.put(None)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def worker_pids(self) -> list:
+        with self._lock:
+            return [worker.process.pid for worker in self._all]
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        """Kill `worker` and start another in its place. Returns None if the pool was closed meanwhile."""
+        worker.kill()
+        with self._lock:
+            if not any(w is worker for w in self._all):
+                return None
+            replacement = _Worker(self._context)
+            if not replacement.process.is_alive():
+                logging.error("Replacement parser worker exited on start")
+                replacement.kill()
+                self._all = [w for w in self._all if w is not worker]
+                if not self._all:
+                    self._started = False
+                    self._idle.put(None)
+                return None
+            self._all = [replacement if w is worker else w for w in self._all]
+        return replacement
+
+    def _release(self, worker: _Worker):
+        """Put a worker back in the idle queue; a dead one is replaced and one of a closed pool dropped"""
+        if worker is None:
+            return
+        with self._lock:
+            if not any(w is worker for w in self._all):
+                return
+        if not worker.process.is_alive():
+            worker = self._replace(worker)
+            if worker is None:
+                return
+        self._idle.put(worker)
+
+    def parse(self, url: str, html: str, nlp: bool = True) -> dict:
+        """
+        Parse an article in a worker process, returning the same fields as parse_html.
+        Without `nlp` the summary is left empty for another summarizer to fill in.
+        """
+        if not self._started:
+            self.start()
+
+        worker = self._idle.get()
+        if worker is None:
+            self._idle.put(None)
+            return empty_parse_result("pool_closed")
+        with self._lock:
+            # Taken just before close() stopped it
+            if not any(w is worker for w in self._all):
+                return empty_parse_result("pool_closed")
+        try:
+            worker.connection.send((url, html, nlp))
+            if worker.connection.poll(self.timeout):
+                return worker.connection.recv()
+
+            logging.warning(f"Parsing {url} took longer than {self.timeout}s, killing worker")
+            self.timeouts += 1
+            worker = self._replace(worker)
+            return empty_parse_result("parse_timeout")
+        except (EOFError, OSError) as e:
+            logging.error(f"Parser worker crashed while parsing {url}: {e}")
+            self.crashes += 1
+            worker = self._replace(worker)
+            return empty_parse_result("worker_crash")
+        finally:
+            self._release(worker)
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_parser_pool(**kwargs) -> ArticleParserPool:
+    """Return the process-wide parser pool, creating it on first use"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ArticleParserPool(**kwargs)
+            atexit.register(close_parser_pool)
+        return _shared_pool
+
+
+def parser_worker_pids() -> list:
+    """Process IDs of the shared pool's workers, without starting the pool"""
+    with _shared_pool_lock:
+        return _shared_pool.worker_pids() if _shared_pool is not None else []
+
+
+def close_parser_pool():
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is not None:
+            _shared_pool.close()
+            _shared_pool = None
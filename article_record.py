@@ -0,0 +1,87 @@
+"""
+Compact in-flight record of one article.
+
+A search used to carry every article as a dict of up to a dozen keys, copied
+again for every key term the article was attributed to. ArticleRecord keeps the
+same fields in slots (no per-instance dict), and supports the dict-style access
+the pipeline already uses (`record["url"]`, `record.get("text")`, `"summary" in
+record`, `dict(record)`), so the stages, the summarizer, the duplicate detector
+and the article store take records and plain dicts alike.
+
+Unset fields are None, and `get` treats None as missing. The article text is
+only needed until the article is summarized, fingerprinted and indexed;
+`release_text` drops it after that.
+"""
+
+
+class ArticleRecord:
+
+    __slots__ = ("title", "url", "publish_date", "summary", "text", "company", "key_term",
+                 "google_link", "duplicate_url", "candidate_terms", "matched_terms")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f"Unknown article fields: {', '.join(fields)}")
+
+    @classmethod
+    def from_mapping(cls, mapping) -> "ArticleRecord":
+        """Record from an article dict, ignoring keys that are not article fields"""
+        if isinstance(mapping, cls):
+            return mapping
+        return cls(**{name: mapping.get(name) for name in cls.__slots__})
+
+    def replace(self, **changes) -> "ArticleRecord":
+        """Copy of the record with some fields changed"""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return ArticleRecord(**fields)
+
+    def release_text(self):
+        self.text = None
+
+    # region Dict-style access
+    def _check(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+
+    def __getitem__(self, key: str):
+        self._check(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value):
+        self._check(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def get(self, key: str, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def pop(self, key: str, default=None):
+        value = self.get(key, default)
+        if key in self.__slots__:
+            setattr(self, key, None)
+        return value
+
+    def keys(self) -> list:
+        return [name for name in self.__slots__ if getattr(self, name) is not None]
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.keys()}
+    # endregion
+
+    def __repr__(self) -> str:
+        return f"ArticleRecord(url={self.url!r}, title={self.title!r})"
+
+
+def release_text(articles):
+    """Drop the text of articles that have been summarized, fingerprinted and stored"""
+    for article in articles:
+        if isinstance(article, ArticleRecord):
+            article.release_text()
+        elif "text" in article:
+            article["text"] = None
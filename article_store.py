@@ -0,0 +1,703 @@
+"""
+SQLite-backed store for every article NewsRadar has found.
+
+Replaces the append-only news_articles.csv. The table is indexed on url,
+company, key_term, publish_date and retrieval time, so dedup and the dashboard
+queries only touch the rows they need instead of re-reading the whole history.
+A (url, company, key_term) triple is stored once; finding it again refreshes
+the row through an upsert.
+
+Running totals (overall, per company, per key term and per publish day) are
+kept in the article_stats table by triggers, so they change in the same
+transaction as the articles and reading them never scans the history.
+
+The title, summary and text of every URL are kept once in article_contents,
+with an FTS5 full-text index over them for ranked article search.
+"""
+
+import argparse
+import base64
+import csv
+import html
+import json
+import re
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+ARTICLE_STORE_PATH = "news_articles.db"
+LEGACY_CSV_PATH = "news_articles.csv"
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+ARTICLE_COLUMNS = ["company", "key_term", "title", "publish_date", "url", "summary", "retrieved_at"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    company TEXT NOT NULL DEFAULT '',
+    key_term TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL DEFAULT '',
+    publish_date TEXT,
+    summary TEXT NOT NULL DEFAULT '',
+    retrieved_at TEXT NOT NULL,
+    UNIQUE (url, company, key_term)
+);
+CREATE INDEX IF NOT EXISTS idx_articles_url ON articles (url);
+CREATE INDEX IF NOT EXISTS idx_articles_company_retrieved ON articles (company, retrieved_at, id);
+CREATE INDEX IF NOT EXISTS idx_articles_company_published ON articles (company, publish_date, id);
+CREATE INDEX IF NOT EXISTS idx_articles_key_term_retrieved ON articles (key_term, retrieved_at, id);
+CREATE INDEX IF NOT EXISTS idx_articles_key_term_published ON articles (key_term, publish_date, id);
+CREATE INDEX IF NOT EXISTS idx_articles_publish_date ON articles (publish_date, id);
+CREATE INDEX IF NOT EXISTS idx_articles_retrieved_at ON articles (retrieved_at, id);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS article_stats (
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (dimension, key)
+);
+CREATE INDEX IF NOT EXISTS idx_article_stats_count ON article_stats (dimension, count);
+
+CREATE TRIGGER IF NOT EXISTS trg_articles_stats_insert AFTER INSERT ON articles BEGIN
+    INSERT INTO article_stats (dimension, key, count) VALUES
+        ('total', '', 1),
+        ('company', NEW.company, 1),
+        ('key_term', NEW.key_term, 1),
+        ('day', COALESCE(substr(NEW.publish_date, 1, 10), ''), 1)
+    ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_articles_stats_day AFTER UPDATE OF publish_date ON articles
+WHEN COALESCE(substr(OLD.publish_date, 1, 10), '') != COALESCE(substr(NEW.publish_date, 1, 10), '') BEGIN
+    UPDATE article_stats SET count = count - 1
+        WHERE dimension = 'day' AND key = COALESCE(substr(OLD.publish_date, 1, 10), '');
+    INSERT INTO article_stats (dimension, key, count)
+        VALUES ('day', COALESCE(substr(NEW.publish_date, 1, 10), ''), 1)
+    ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+    DELETE FROM article_stats WHERE dimension = 'day' AND count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_articles_stats_delete AFTER DELETE ON articles BEGIN
+    UPDATE article_stats SET count = count - 1
+        WHERE (dimension = 'total' AND key = '')
+           OR (dimension = 'company' AND key = OLD.company)
+           OR (dimension = 'key_term' AND key = OLD.key_term)
+           OR (dimension = 'day' AND key = COALESCE(substr(OLD.publish_date, 1, 10), ''));
+    DELETE FROM article_stats WHERE count <= 0;
+END;
+"""
+
+_FTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS article_contents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL DEFAULT '',
+    summary TEXT NOT NULL DEFAULT '',
+    text TEXT NOT NULL DEFAULT ''
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS article_fts USING fts5(
+    title, summary, text,
+    content = 'article_contents', content_rowid = 'id',
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_article_contents_insert AFTER INSERT ON article_contents BEGIN
+    INSERT INTO article_fts (rowid, title, summary, text) VALUES (NEW.id, NEW.title, NEW.summary, NEW.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_article_contents_update AFTER UPDATE ON article_contents
+WHEN OLD.title != NEW.title OR OLD.summary != NEW.summary OR OLD.text != NEW.text BEGIN
+    INSERT INTO article_fts (article_fts, rowid, title, summary, text)
+        VALUES ('delete', OLD.id, OLD.title, OLD.summary, OLD.text);
+    INSERT INTO article_fts (rowid, title, summary, text) VALUES (NEW.id, NEW.title, NEW.summary, NEW.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_article_contents_delete AFTER DELETE ON article_contents BEGIN
+    INSERT INTO article_fts (article_fts, rowid, title, summary, text)
+        VALUES ('delete', OLD.id, OLD.title, OLD.summary, OLD.text);
+END;
+"""
+
+STATS_DIMENSIONS = ("company", "key_term", "day")
+
+ORDER_COLUMNS = ("retrieved_at", "publish_date")
+MAX_PAGE_SIZE = 200
+
+_QUERY_TOKENS = re.compile(r"\w+\*?", re.UNICODE)
+# Placeholders for the snippet highlight, swapped for <mark> after HTML escaping
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+
+def normalize_date(value) -> str:
+    """Normalize RSS, ISO and datetime values to a sortable 'YYYY-MM-DD HH:MM:SS' string in UTC"""
+    if value is None or value == "":
+        return None
+
+    parsed = None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        text = str(value).strip()
+        try:
+            parsed = parsedate_to_datetime(text)
+        except (TypeError, ValueError, IndexError):
+            try:
+                parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+            except ValueError:
+                return None
+
+    if parsed is None:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime(DATE_FORMAT)
+
+
+def to_record(article: dict, retrieved_at: datetime = None) -> dict:
+    """The stored, JSON-safe form of an article, as returned by ArticleStore.recent_articles"""
+    return {
+        "company": article.get("company") or "",
+        "key_term": article.get("key_term") or "",
+        "title": article.get("title") or "",
+        "publish_date": normalize_date(article.get("publish_date")) or "",
+        "url": article.get("url") or "",
+        "summary": article.get("summary") or "",
+        "retrieved_at": (retrieved_at or datetime.now()).strftime(DATE_FORMAT)
+    }
+
+
+def _date_bound(value, end_of_day: bool = False) -> str:
+    """Normalize a date range bound; a bare 'YYYY-MM-DD' upper bound covers that whole day"""
+    if value is None or value == "":
+        return None
+    text = str(value).strip()
+    bound = normalize_date(text)
+    if bound is None:
+        raise ValueError(f"Invalid date: {value}")
+    if end_of_day and len(text) == 10:
+        bound = bound[:10] + " 23:59:59"
+    return bound
+
+
+def fts_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 query matching every word, so user input can't cause
+    syntax errors. A trailing * keeps prefix matching: 'logist*' matches 'logistics'.
+    """
+    terms = []
+    for token in _QUERY_TOKENS.findall(text or ""):
+        if token.endswith("*"):
+            terms.append(f'"{token[:-1]}"*')
+        else:
+            terms.append(f'"{token}"')
+    return " ".join(terms)
+
+
+def encode_cursor(order_value: str, article_id: int) -> str:
+    raw = json.dumps([order_value, article_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of encode_cursor. Raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        order_value, article_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(order_value, str) or not isinstance(article_id, int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return order_value, article_id
+
+
+def merge_attributions(records: list) -> list:
+    """
+    Fold records of the same URL into one, in first-seen order, joining their
+    companies and key terms with ', ' so a story found for several queries shows once
+    """
+    merged = {}
+    for record in records:
+        url = record.get("url")
+        if url not in merged:
+            merged[url] = dict(record)
+            continue
+        for key in ("company", "key_term"):
+            values = merged[url][key].split(", ") if merged[url].get(key) else []
+            if record.get(key) and record[key] not in values:
+                merged[url][key] = ", ".join(values + [record[key]])
+    return list(merged.values())
+
+
+class ArticleStore:
+
+    def __init__(self, path: str = ARTICLE_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        connection.commit()
+
+        self.full_text_search = True
+        try:
+            connection.executescript(_FTS_SCHEMA)
+            connection.commit()
+        except sqlite3.OperationalError as e:
+            # SQLite builds without FTS5 still store articles, only search is unavailable
+            logging.warning(f"Full-text search disabled, SQLite has no FTS5 support: {e}")
+            self.full_text_search = False
+
+        if self.full_text_search and not self._get_meta("contents_built"):
+            self._backfill_contents()
+
+        # Stores created before the stats triggers existed start with empty stats
+        if not self._get_meta("stats_built"):
+            self.rebuild_stats()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread: WAL lets readers run alongside the writer
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    # region Writes
+    def known_urls(self, urls) -> set:
+        """Return the subset of `urls` that is already stored"""
+        urls = list(set(url for url in urls if url))
+        known = set()
+        connection = self._connection()
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT DISTINCT url FROM articles WHERE url IN ({placeholders})", chunk)
+            known.update(row[0] for row in rows)
+        return known
+
+    def has_url(self, url: str) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM articles WHERE url = ? LIMIT 1", (url,)).fetchone() is not None
+
+    def add_articles(self, articles: list, retrieved_at: datetime = None) -> list:
+        """
+        Upsert articles and return the ones whose URL was not stored before this call.
+        Articles without a title or URL are skipped.
+        """
+        articles = [article for article in articles if article.get("url") and article.get("title")]
+        if not articles:
+            return []
+
+        retrieved_at = (retrieved_at or datetime.now()).strftime(DATE_FORMAT)
+        rows = [(
+            article["url"],
+            article.get("company") or "",
+            article.get("key_term") or "",
+            article.get("title") or "",
+            normalize_date(article.get("publish_date")),
+            article.get("summary") or "",
+            retrieved_at
+        ) for article in articles]
+
+        contents = {}
+        for article in articles:
+            contents[article["url"]] = (
+                article["url"],
+                article.get("title") or "",
+                article.get("summary") or "",
+                article.get("text") or ""
+            )
+
+        with self._write_lock:
+            known = self.known_urls(article["url"] for article in articles)
+            connection = self._connection()
+            with connection:
+                if self.full_text_search:
+                    connection.executemany("""
+                        INSERT INTO article_contents (url, title, summary, text) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (url) DO UPDATE SET
+                            title = excluded.title,
+                            summary = CASE WHEN excluded.summary != '' THEN excluded.summary
+                                           ELSE article_contents.summary END,
+                            text = CASE WHEN excluded.text != '' THEN excluded.text ELSE article_contents.text END
+                    """, list(contents.values()))
+                connection.executemany("""
+                    INSERT INTO articles (url, company, key_term, title, publish_date, summary, retrieved_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (url, company, key_term) DO UPDATE SET
+                        title = excluded.title,
+                        publish_date = COALESCE(excluded.publish_date, articles.publish_date),
+                        summary = CASE WHEN excluded.summary != '' THEN excluded.summary ELSE articles.summary END,
+                        retrieved_at = excluded.retrieved_at
+                """, rows)
+
+        return [article for article in articles if article["url"] not in known]
+
+    def add_attributions(self, attributions: list, retrieved_at: datetime = None) -> int:
+        """
+        Record that stored articles were found again for another company or key term.
+        `attributions` are dicts with url, company and key_term; the title, publish date and
+        summary are copied from the stored article, and unknown URLs are ignored.
+        Returns the number of new (url, company, key_term) rows.
+        """
+        retrieved_at = (retrieved_at or datetime.now()).strftime(DATE_FORMAT)
+        rows = [(attribution.get("company") or "", attribution.get("key_term") or "", retrieved_at, attribution["url"])
+                for attribution in attributions if attribution.get("url")]
+        if not rows:
+            return 0
+
+        with self._write_lock:
+            connection = self._connection()
+            with connection:
+                cursor = connection.executemany("""
+                    INSERT INTO articles (url, company, key_term, title, publish_date, summary, retrieved_at)
+                    SELECT url, ?, ?, title, publish_date, summary, ? FROM articles WHERE url = ?
+                    ORDER BY id LIMIT 1
+                    ON CONFLICT (url, company, key_term) DO NOTHING
+                """, rows)
+                return cursor.rowcount
+    # endregion
+
+    # region Reads
+    def recent_articles(self, limit: int = 20) -> list:
+        """Most recently retrieved articles first"""
+        rows = self._connection().execute(
+            f"SELECT {', '.join(ARTICLE_COLUMNS)} FROM articles ORDER BY retrieved_at DESC, id DESC LIMIT ?",
+            (limit,))
+        return [{key: (row[key] or "") for key in ARTICLE_COLUMNS} for row in rows]
+
+    def _page_filters(self, company: str, key_term: str, since, until, order_by: str) -> tuple:
+        conditions = []
+        parameters = []
+        if company:
+            conditions.append("company = ?")
+            parameters.append(company)
+        if key_term:
+            conditions.append("key_term = ?")
+            parameters.append(key_term)
+
+        since = _date_bound(since)
+        until = _date_bound(until, end_of_day=True)
+        if since is not None:
+            conditions.append("publish_date >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("publish_date <= ?")
+            parameters.append(until)
+        if order_by == "publish_date":
+            conditions.append("publish_date IS NOT NULL")
+        return conditions, parameters
+
+    def page_articles(self, limit: int = 20, cursor: str = None, company: str = None, key_term: str = None,
+                      since=None, until=None, order_by: str = "retrieved_at") -> dict:
+        """
+        One page of up to `limit` distinct articles, newest first by `order_by` (retrieved_at
+        or publish_date), each with the companies and key terms it was stored for joined as in
+        merge_attributions.
+
+        Keyset pagination: pass the returned `next_cursor` back to get the following page.
+        An article is placed by its newest row matching the filters, so it is on exactly one
+        page; its older rows are skipped on later pages. `since`/`until` bound the publish
+        date; ordering by publish date only returns dated articles.
+        Raises ValueError for an invalid order, date or cursor.
+        """
+        if order_by not in ORDER_COLUMNS:
+            raise ValueError(f"Cannot order articles by {order_by}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        conditions, parameters = self._page_filters(company, key_term, since, until, order_by)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        filtered = " AND ".join(conditions + [""])
+        connection = self._connection()
+
+        after = decode_cursor(cursor) if cursor else None
+        # url -> (order value, id) of its newest matching row, for limit + 1 articles
+        page = {}
+        position = after
+        while len(page) <= limit:
+            keyset = [f"({order_by}, id) < (?, ?)"] if position else []
+            rows = connection.execute(
+                f"SELECT id, url, {order_by} FROM articles WHERE {' AND '.join(conditions + keyset) or '1'} "
+                f"ORDER BY {order_by} DESC, id DESC LIMIT ?",
+                parameters + (list(position) if position else []) + [limit * 2]).fetchall()
+            for row in rows:
+                if row["url"] in page:
+                    continue
+                # Shown on an earlier page if it has a matching row at or before the cursor
+                if after and connection.execute(
+                        f"SELECT 1 FROM articles WHERE {filtered} url = ? AND ({order_by}, id) >= (?, ?) LIMIT 1",
+                        parameters + [row["url"], *after]).fetchone():
+                    continue
+                page[row["url"]] = (row[order_by], row["id"])
+                if len(page) > limit:
+                    break
+            if len(rows) < limit * 2:
+                break
+            position = (rows[-1][order_by], rows[-1]["id"])
+
+        urls = list(page)
+        next_cursor = None
+        if len(urls) > limit:
+            urls = urls[:limit]
+            next_cursor = encode_cursor(*page[urls[-1]])
+
+        records = []
+        if urls:
+            placeholders = ",".join("?" * len(urls))
+            rows = connection.execute(
+                f"SELECT {', '.join(ARTICLE_COLUMNS)} FROM articles {where} {'AND' if where else 'WHERE'} "
+                f"url IN ({placeholders}) ORDER BY {order_by} DESC, id DESC", parameters + urls)
+            records = merge_attributions([{key: (row[key] or "") for key in ARTICLE_COLUMNS} for row in rows])
+
+        return {"articles": records, "next_cursor": next_cursor}
+
+    def search_articles(self, query: str, limit: int = 20, company: str = None) -> list:
+        """
+        Full-text search over article titles, summaries and text, best match first.
+        Each result has the article's companies and key terms, a bm25 score (lower is
+        better) and an HTML-escaped snippet with the matched words in <mark> tags.
+        """
+        if not self.full_text_search:
+            raise RuntimeError("Full-text search is not available in this SQLite build")
+        match = fts_query(query)
+        if not match:
+            return []
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        parameters = [_MARK_START, _MARK_END, match]
+        company_filter = ""
+        if company:
+            company_filter = "AND EXISTS (SELECT 1 FROM articles a WHERE a.url = c.url AND a.company = ?)"
+            parameters.append(company)
+
+        connection = self._connection()
+        rows = connection.execute(f"""
+            SELECT c.url, c.title, c.summary,
+                   snippet(article_fts, -1, ?, ?, '...', 24) AS snippet,
+                   bm25(article_fts, 10.0, 4.0, 1.0) AS score
+            FROM article_fts JOIN article_contents c ON c.id = article_fts.rowid
+            WHERE article_fts MATCH ? {company_filter}
+            ORDER BY score LIMIT ?
+        """, parameters + [limit]).fetchall()
+
+        results = []
+        for row in rows:
+            # Only the returned URLs are looked up, through the url index
+            attributions = connection.execute(
+                "SELECT company, key_term, publish_date, retrieved_at FROM articles WHERE url = ?",
+                (row["url"],)).fetchall()
+            snippet = html.escape(row["snippet"] or "")
+            results.append({
+                "url": row["url"],
+                "title": row["title"],
+                "summary": row["summary"],
+                "snippet": snippet.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>"),
+                "score": round(row["score"], 4),
+                "companies": sorted({a["company"] for a in attributions if a["company"]}),
+                "key_terms": sorted({a["key_term"] for a in attributions if a["key_term"]}),
+                "publish_date": max((a["publish_date"] or "" for a in attributions), default=""),
+                "retrieved_at": max((a["retrieved_at"] for a in attributions), default="")
+            })
+        return results
+
+    def article_text(self, url: str) -> str:
+        """Stored text of an article, or '' if there is none"""
+        if not self.full_text_search:
+            return ""
+        row = self._connection().execute("SELECT text FROM article_contents WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else ""
+
+    def article_texts(self, limit: int = 100) -> list:
+        """Title, URL and text of the most recently stored articles that have text"""
+        if not self.full_text_search:
+            return []
+        rows = self._connection().execute(
+            "SELECT url, title, text FROM article_contents WHERE text != '' ORDER BY id DESC LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+    def iter_contents(self, batch_size: int = 1000):
+        """Every stored URL with its title, summary and text, oldest first, read in batches"""
+        if not self.full_text_search:
+            return
+        last_id = 0
+        while True:
+            rows = self._connection().execute(
+                "SELECT id, url, title, summary, text FROM article_contents WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield {"url": row["url"], "title": row["title"], "summary": row["summary"], "text": row["text"]}
+            last_id = rows[-1]["id"]
+
+    def last_article_id(self) -> int:
+        """Row id of the newest (url, company, key_term) row; ids only grow, so it marks a point in time"""
+        return self._connection().execute("SELECT COALESCE(MAX(id), 0) FROM articles").fetchone()[0]
+
+    def articles_added(self, after_id: int, until_id: int, companies: list, key_terms: list) -> list:
+        """
+        Rows added after `after_id` up to `until_id` (see last_article_id) for the given companies
+        and key terms, oldest first, in the form of recent_articles
+        """
+        rows = self._connection().execute(f"""
+            SELECT {', '.join(ARTICLE_COLUMNS)} FROM articles
+            WHERE id > ? AND id <= ?
+              AND company IN (SELECT value FROM json_each(?)) AND key_term IN (SELECT value FROM json_each(?))
+            ORDER BY id
+        """, (after_id, until_id, json.dumps(list(companies)), json.dumps(list(key_terms))))
+        return [{key: (row[key] or "") for key in ARTICLE_COLUMNS} for row in rows]
+
+    def all_articles(self) -> list:
+        rows = self._connection().execute(
+            f"SELECT {', '.join(ARTICLE_COLUMNS)} FROM articles ORDER BY retrieved_at, id")
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        row = self._connection().execute(
+            "SELECT count FROM article_stats WHERE dimension = 'total' AND key = ''").fetchone()
+        return row[0] if row else 0
+
+    def counts_by(self, column: str, limit: int = None) -> dict:
+        """Article counts grouped by `company`, `key_term` or publish `day`, largest first"""
+        if column not in STATS_DIMENSIONS:
+            raise ValueError(f"Cannot group articles by {column}")
+        query = "SELECT key, count FROM article_stats WHERE dimension = ? ORDER BY count DESC, key"
+        parameters = (column,)
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters = (column, limit)
+        return {row[0]: row[1] for row in self._connection().execute(query, parameters)}
+
+    def daily_counts(self, days: int = None) -> dict:
+        """Article counts per publish day ('YYYY-MM-DD'), oldest first; '' counts undated articles"""
+        query = "SELECT key, count FROM article_stats WHERE dimension = 'day' ORDER BY key DESC"
+        parameters = ()
+        if days is not None:
+            query += " LIMIT ?"
+            parameters = (days,)
+        return dict(reversed(self._connection().execute(query, parameters).fetchall()))
+
+    def last_retrieved_at(self) -> str:
+        row = self._connection().execute("SELECT MAX(retrieved_at) FROM articles").fetchone()
+        return row[0] if row else None
+    # endregion
+
+    # region Stats
+    def _computed_stats(self, connection: sqlite3.Connection) -> list:
+        day = "COALESCE(substr(publish_date, 1, 10), '')"
+        return connection.execute(f"""
+            SELECT 'total', '', COUNT(*) FROM articles
+            UNION ALL SELECT 'company', company, COUNT(*) FROM articles GROUP BY company
+            UNION ALL SELECT 'key_term', key_term, COUNT(*) FROM articles GROUP BY key_term
+            UNION ALL SELECT 'day', {day}, COUNT(*) FROM articles GROUP BY {day}
+        """).fetchall()
+
+    def rebuild_stats(self) -> int:
+        """
+        Recompute article_stats from the articles table. Returns the number of stored
+        counters that differed from the recomputed ones, so a non-zero result means the
+        running totals had drifted.
+        """
+        with self._write_lock:
+            connection = self._connection()
+            with connection:
+                stored = {(row[0], row[1]): row[2] for row in
+                          connection.execute("SELECT dimension, key, count FROM article_stats")}
+                computed = {(row[0], row[1]): row[2] for row in self._computed_stats(connection) if row[2]}
+                connection.execute("DELETE FROM article_stats")
+                connection.executemany("INSERT INTO article_stats (dimension, key, count) VALUES (?, ?, ?)",
+                                       [(dimension, key, count) for (dimension, key), count in computed.items()])
+            self._set_meta("stats_built", datetime.now().strftime(DATE_FORMAT))
+
+        mismatches = sum(1 for key in stored.keys() | computed.keys() if stored.get(key) != computed.get(key))
+        if mismatches and stored:
+            logging.warning(f"Rebuilt article stats: {mismatches} counters had drifted")
+        return mismatches
+    # endregion
+
+    # region Migration
+    def _backfill_contents(self):
+        """Index the titles and summaries of articles stored before full-text search existed"""
+        with self._write_lock:
+            connection = self._connection()
+            with connection:
+                connection.execute("""
+                    INSERT OR IGNORE INTO article_contents (url, title, summary)
+                    SELECT url, MAX(title), MAX(summary) FROM articles GROUP BY url
+                """)
+            self._set_meta("contents_built", datetime.now().strftime(DATE_FORMAT))
+
+    def _get_meta(self, key: str) -> str:
+        row = self._connection().execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        connection = self._connection()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)", (key, value))
+
+    def migrate_csv(self, csv_path: str = LEGACY_CSV_PATH) -> int:
+        """
+        Import the legacy news_articles.csv once. Returns the number of rows imported.
+
+        The CSV was appended to with a header on every run, so repeated header
+        rows are skipped. Rows keep their file order; their retrieval time is the
+        file's modification time since the CSV never recorded one.
+        """
+        if self._get_meta("csv_migrated") or not os.path.exists(csv_path):
+            return 0
+
+        retrieved_at = datetime.fromtimestamp(os.path.getmtime(csv_path))
+        articles = []
+        with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                row = {(key or "").lstrip("\ufeff"): (value or "").lstrip("\ufeff") for key, value in row.items()}
+                if row.get("url") in ("", "url"):
+                    continue
+                articles.append(row)
+
+        self.add_articles(articles, retrieved_at=retrieved_at)
+        self._set_meta("csv_migrated", datetime.now().strftime(DATE_FORMAT))
+        logging.info(f"Migrated {len(articles)} articles from {csv_path} to {self.path}")
+        return len(articles)
+    # endregion
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_article_store() -> ArticleStore:
+    """Return the process-wide article store, migrating the legacy CSV on first use"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = ArticleStore()
+            _shared_store.migrate_csv()
+        return _shared_store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintenance commands for the NewsRadar article store")
+    parser.add_argument("command", choices=["rebuild-stats"])
+    parser.add_argument("--path", default=ARTICLE_STORE_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "rebuild-stats":
+        store = ArticleStore(args.path)
+        mismatches = store.rebuild_stats()
+        print(f"Rebuilt stats for {store.count()} articles ({mismatches} counters differed)")
@@ -0,0 +1,299 @@
+"""
+Local replay of Google News and publisher sites for the pipeline benchmark.
+
+The server is an HTTP proxy: with `http_proxy` pointing at it, feedparser and
+requests talk to it instead of the network, so the pipeline code runs
+unchanged. It answers
+- `http://news.google.com/rss/search?q=...` with one of the recorded feeds,
+  its links rewritten to unique article IDs for the query,
+- those article links with a redirect chain of a recorded length, ending at
+  the publisher URL of a recorded article,
+- the publisher URL with the recorded HTML. Unless `unique_articles` is off,
+  each article gets extra paragraphs drawn from its own vocabulary, so the
+  near-duplicate detector does not merge the whole benchmark into a few stories.
+
+Any query is answered, so a matrix of any size replays from a handful of
+recordings. Recordings live in benchmarks/fixtures (see manifest.json); to
+replace the samples there with real ones:
+
+Usage: python benchmarks/fixture_server.py --record [--companies Volvo,Carlsberg] [--key-terms CEO,Warehouse]
+       python benchmarks/fixture_server.py [--port 8765]   # serve the fixtures until Ctrl+C
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import xml.etree.ElementTree as ElementTree
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+from urllib.parse import parse_qs, quote, urlparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(REPO_ROOT, "benchmarks", "fixtures")
+
+GOOGLE_NEWS_HOST = "news.google.com"
+VARIATION_WORDS = 400
+
+_TAGS = re.compile(r"<[^>]+>")
+_WORDS = re.compile(r"[A-Za-z][A-Za-z'-]+")
+
+
+def _digest(value: str) -> int:
+    return int.from_bytes(hashlib.sha1(value.encode("utf-8")).digest()[:8], "big")
+
+
+class Fixtures:
+    """The recorded feeds, redirect chain lengths and articles listed in manifest.json"""
+
+    def __init__(self, fixture_dir: str = FIXTURE_DIR):
+        with open(os.path.join(fixture_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        self.feeds = []
+        for path in manifest["feeds"]:
+            channel = ElementTree.parse(os.path.join(fixture_dir, path)).getroot().find("channel")
+            self.feeds.append([{
+                "title": item.findtext("title", ""),
+                "description": item.findtext("description", ""),
+                "source": item.findtext("source", ""),
+                "source_url": item.find("source").get("url", "") if item.find("source") is not None else ""
+            } for item in channel.findall("item")])
+
+        self.articles = []
+        for article in manifest["articles"]:
+            with open(os.path.join(fixture_dir, article["file"]), encoding="utf-8") as f:
+                html = f.read()
+            url = urlparse(article["url"])
+            self.articles.append({
+                "host": url.netloc,
+                "path": url.path.rstrip("/"),
+                "html": html,
+                "vocabulary": _WORDS.findall(_TAGS.sub(" ", html)) or ["news"]
+            })
+
+        self.redirect_hops = manifest.get("redirect_hops") or [1]
+        if not self.feeds or not self.articles:
+            raise ValueError(f"{fixture_dir}/manifest.json lists no feeds or no articles")
+
+    def article_for(self, article_id: str) -> dict:
+        return self.articles[_digest(article_id) % len(self.articles)]
+
+    def publisher_url(self, article_id: str) -> str:
+        article = self.article_for(article_id)
+        return f"http://{article['host']}{article['path']}-{article_id}"
+
+
+class FixtureServer:
+    """
+    Serve the fixtures on a background thread. `latency` adds a delay to every response,
+    to stand in for network round trips.
+
+        with FixtureServer() as server:
+            os.environ["http_proxy"] = server.proxy_url
+    """
+
+    def __init__(self, fixture_dir: str = FIXTURE_DIR, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, unique_articles: bool = True):
+        self.fixtures = Fixtures(fixture_dir)
+        self.latency = latency
+        self.unique_articles = unique_articles
+        self.requests = 0
+
+        server = self
+
+        class Handler(_ReplayHandler):
+            replay = server
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def proxy_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FixtureServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="FixtureServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # region Responses
+    def render_feed(self, query: str) -> str:
+        query_id = f"{_digest(query):016x}"
+        items = self.fixtures.feeds[int(query_id, 16) % len(self.fixtures.feeds)]
+        now = datetime.now(timezone.utc)
+        lines = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>',
+                 '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel>',
+                 f'<title>"{escape(query)}" - Google News</title>',
+                 f'<link>http://{GOOGLE_NEWS_HOST}/search?q={quote(query)}</link>',
+                 '<language>en-US</language>',
+                 f'<lastBuildDate>{format_datetime(now)}</lastBuildDate>',
+                 '<description>Google News</description>']
+        for i, item in enumerate(items):
+            article_id = f"FX{query_id}{i:02d}"
+            link = f"http://{GOOGLE_NEWS_HOST}/rss/articles/{article_id}?oc=5"
+            lines.append(
+                f'<item><title>{escape(item["title"])}</title><link>{link}</link>'
+                f'<guid isPermaLink="false">{article_id}</guid>'
+                f'<pubDate>{format_datetime(now - timedelta(hours=3 * i + 1))}</pubDate>'
+                f'<description>{escape(item["description"])}</description>'
+                f'<source url="{escape(item["source_url"])}">{escape(item["source"])}</source></item>')
+        lines.append("</channel></rss>")
+        return "\n".join(lines) + "\n"
+
+    def redirect_target(self, article_id: str, hop: int) -> str:
+        """Next location in an article link's redirect chain"""
+        hops = self.fixtures.redirect_hops[_digest(article_id) % len(self.fixtures.redirect_hops)]
+        if hop + 1 < hops:
+            return f"http://{GOOGLE_NEWS_HOST}/rss/articles/{article_id}?hop={hop + 1}"
+        return self.fixtures.publisher_url(article_id)
+
+    def render_article(self, article_id: str) -> str:
+        article = self.fixtures.article_for(article_id)
+        if not self.unique_articles:
+            return article["html"]
+
+        rng = random.Random(article_id)
+        words = [rng.choice(article["vocabulary"]) for _ in range(VARIATION_WORDS)]
+        paragraphs = "".join(f"<p>{' '.join(words[i:i + 80])}.</p>\n" for i in range(0, len(words), 80))
+        html = article["html"]
+        marker = "</article>" if "</article>" in html else "</body>"
+        return html.replace(marker, paragraphs + marker, 1)
+    # endregion
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+
+    replay: FixtureServer = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.replay.requests += 1
+        if self.replay.latency:
+            sleep(self.replay.latency)
+
+        # Proxied requests carry the absolute URL; direct ones only the path
+        url = urlparse(self.path if "://" in self.path else f"http://{self.headers.get('Host', '')}{self.path}")
+        query = parse_qs(url.query)
+
+        if url.netloc == GOOGLE_NEWS_HOST and url.path == "/rss/search":
+            self._send(200, self.replay.render_feed(query.get("q", [""])[0]), "application/xml; charset=utf-8")
+        elif url.netloc == GOOGLE_NEWS_HOST and url.path.startswith("/rss/articles/"):
+            article_id = url.path.rsplit("/", 1)[-1]
+            hop = int(query.get("hop", ["0"])[0])
+            self._send(302, "", "text/html", location=self.replay.redirect_target(article_id, hop))
+        else:
+            article_id = url.path.rsplit("-", 1)[-1]
+            if not article_id.startswith("FX"):
+                self._send(404, "Not a fixture", "text/plain")
+                return
+            self._send(200, self.replay.render_article(article_id), "text/html; charset=utf-8")
+
+    def _send(self, status: int, body: str, content_type: str, location: str = None):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        if location:
+            self.send_header("Location", location)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# region Recording
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:60]
+
+
+def record_fixtures(companies: list, key_terms: list, entries: int = 3, fixture_dir: str = FIXTURE_DIR):
+    """Record live feeds, redirect chain lengths and article HTML into `fixture_dir`, replacing its manifest"""
+    sys.path.insert(0, REPO_ROOT)
+    import requests
+
+    from NewsRadar import build_rss_url, get_redirect_link
+    from article_fetcher import get_article_fetcher
+
+    manifest = {"description": f"Recorded on {datetime.now().strftime('%Y-%m-%d')}",
+                "feeds": [], "articles": [], "redirect_hops": []}
+    os.makedirs(os.path.join(fixture_dir, "feeds"), exist_ok=True)
+    os.makedirs(os.path.join(fixture_dir, "articles"), exist_ok=True)
+
+    for company in companies:
+        for term in key_terms:
+            name = _slug(f"{company} {term}")
+            response = requests.get(build_rss_url(company, term), timeout=15)
+            response.raise_for_status()
+            feed_path = f"feeds/{name}.xml"
+            with open(os.path.join(fixture_dir, feed_path), "w", encoding="utf-8") as f:
+                f.write(response.text)
+            manifest["feeds"].append(feed_path)
+
+            channel = ElementTree.fromstring(response.content).find("channel")
+            for i, item in enumerate(channel.findall("item")[:entries]):
+                link = item.findtext("link")
+                try:
+                    manifest["redirect_hops"].append(max(1, len(requests.get(link, timeout=15).history)))
+                    url = get_redirect_link(link)
+                    html = get_article_fetcher().fetch(url)
+                except Exception as e:
+                    print(f"  skipped {link}: {e}")
+                    continue
+                article_path = f"articles/{name}-{i}.html"
+                with open(os.path.join(fixture_dir, article_path), "w", encoding="utf-8") as f:
+                    f.write(html)
+                manifest["articles"].append({"url": url, "file": article_path})
+            print(f"Recorded {company} - {term}: {len(channel.findall('item'))} feed items")
+
+    with open(os.path.join(fixture_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"{len(manifest['feeds'])} feeds and {len(manifest['articles'])} articles recorded in {fixture_dir}")
+# endregion
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve or record the pipeline benchmark fixtures")
+    parser.add_argument("--record", action="store_true", help="Record live fixtures instead of serving them")
+    parser.add_argument("--companies", default="Volvo,Carlsberg", help="Comma separated, for --record")
+    parser.add_argument("--key-terms", default="Warehouse,CEO", help="Comma separated, for --record")
+    parser.add_argument("--entries", type=int, default=3, help="Articles recorded per feed")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures([item.strip() for item in args.companies.split(",") if item.strip()],
+                        [item.strip() for item in args.key_terms.split(",") if item.strip()], args.entries)
+        return
+
+    with FixtureServer(port=args.port) as server:
+        print(f"Serving fixtures, use http_proxy={server.proxy_url}. Stop with Ctrl+C.")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
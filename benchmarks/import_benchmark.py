@@ -0,0 +1,84 @@
+"""
+Measure the startup cost of importing web_app: wall time, peak memory and which
+heavy modules get loaded. Each import runs in a fresh interpreter.
+
+Pass a git revision with --ref to measure that revision too (checked out into a
+temporary worktree), e.g. the commit before lazy imports, for a before/after comparison.
+
+Usage: python benchmarks/import_benchmark.py [--module web_app] [--runs 5] [--ref <git revision>]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["pandas", "nltk", "newspaper", "feedparser", "transformers", "torch", "playwright", "tqdm"]
+
+# Runs in the child interpreter; prints one JSON line
+_PROBE = """
+import json, resource, sys
+from time import perf_counter
+start = perf_counter()
+import {module}
+elapsed = perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "seconds": elapsed,
+    "peak_rss_mb": peak / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    "modules": len(sys.modules),
+    "heavy": [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+
+def measure(directory: str, module: str, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=directory, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip()}")
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    return {
+        "median_seconds": statistics.median(sample["seconds"] for sample in samples),
+        "peak_rss_mb": max(sample["peak_rss_mb"] for sample in samples),
+        "modules": samples[-1]["modules"],
+        "heavy": samples[-1]["heavy"]
+    }
+
+
+def report(name: str, result: dict):
+    print(f"{name}: import {result['median_seconds']:.2f}s (median), peak RSS {result['peak_rss_mb']:.0f} MB, "
+          f"{result['modules']} modules, heavy: {', '.join(result['heavy']) or 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import cost of a NewsRadar module")
+    parser.add_argument("--module", default="web_app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ref", help="git revision to compare against")
+    args = parser.parse_args()
+
+    if args.ref:
+        worktree = tempfile.mkdtemp(prefix="newsradar-import-")
+        try:
+            subprocess.run(["git", "worktree", "add", "--detach", worktree, args.ref],
+                           cwd=REPO_ROOT, check=True, capture_output=True)
+            report(f"{args.module} at {args.ref}", measure(worktree, args.module, args.runs))
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=REPO_ROOT, capture_output=True)
+            shutil.rmtree(worktree, ignore_errors=True)
+
+    report(f"{args.module} in working tree", measure(REPO_ROOT, args.module, args.runs))
+
+
+if __name__ == "__main__":
+    main()
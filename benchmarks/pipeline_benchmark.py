@@ -0,0 +1,277 @@
+"""
+Time each stage of the search pipeline on recorded fixtures, at several matrix sizes.
+
+The feeds, redirect chains and article pages are replayed by a local proxy (see
+fixture_server.py), so runs do not touch the network and are comparable between
+versions. Each matrix size runs in a fresh interpreter in its own temporary
+directory, so the article store, fingerprints, seen-URL index and URL cache
+start empty. The stages run one call at a time:
+
+- rss_fetch: `feedparser.parse` of a query's feed
+- redirect: `get_redirect_link` of an entry
+- download: the article fetcher's download of the publisher page
+- parse / nlp: `parse_html`, the parser workers' newspaper parse and NLP, timed separately
+- dedup: near-duplicate merge of a query's articles
+- persist: article store write and seen-URL index update of a query's articles
+- email_body: `write_to_email_body` of the new articles
+
+Results are written as JSON (benchmarks/results/ by default). Pass an earlier
+result with --compare to print the change per stage; changes above --threshold
+are flagged as regressions.
+
+Usage: python benchmarks/pipeline_benchmark.py [--matrix 1x1 10x20 100x200] [--max-articles N]
+       [--no-batch] [--latency SECONDS] [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+STAGES = ("rss_fetch", "redirect", "download", "parse", "nlp", "dedup", "persist", "email_body")
+
+
+def summarize(timings: list) -> dict:
+    if not timings:
+        return {"count": 0}
+    ordered = sorted(timings)
+    return {
+        "count": len(ordered),
+        "total_seconds": round(sum(ordered), 4),
+        "mean_seconds": round(statistics.mean(ordered), 6),
+        "p50_seconds": round(ordered[len(ordered) // 2], 6),
+        "p95_seconds": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 6),
+        "max_seconds": round(ordered[-1], 6)
+    }
+
+
+def build_matrix(companies: int, key_terms: int) -> tuple:
+    """The default companies and key terms, padded with made-up ones up to the requested size"""
+    from NewsRadar import COMPANIES, KEY_TERMS
+
+    return ((COMPANIES + [f"Company {i}" for i in range(len(COMPANIES), companies)])[:companies],
+            (KEY_TERMS + [f"Key Term {i}" for i in range(len(KEY_TERMS), key_terms)])[:key_terms])
+
+
+# region Single matrix, in the child interpreter
+def run_matrix(companies: int, key_terms: int, max_articles: int = None, batch_queries: bool = True) -> dict:
+    """Run the stages over a companies x key terms matrix; the fixture proxy must be set in http_proxy"""
+    sys.path.insert(0, REPO_ROOT)
+    import feedparser
+
+    import NewsRadar
+    from NewsRadar import (FEED_TOP_N, attribute_news_item, build_news_item, build_rss_url, get_redirect_link,
+                           plan_search_units, write_to_email_body)
+    from article_fetcher import get_article_fetcher
+    from article_parser import parse_html
+    from article_store import get_article_store
+    from near_duplicates import get_duplicate_detector
+    from query_planner import QueryBatch
+    from seen_index import get_seen_index
+
+    NewsRadar.BATCH_QUERIES = batch_queries
+    company_names, term_names = build_matrix(companies, key_terms)
+    units = plan_search_units(company_names, term_names)
+    timings = {stage: [] for stage in STAGES}
+    fetcher, store, detector, seen_index = (get_article_fetcher(), get_article_store(), get_duplicate_detector(),
+                                            get_seen_index())
+
+    def timed(stage: str, fn, *args):
+        start = perf_counter()
+        result = fn(*args)
+        timings[stage].append(perf_counter() - start)
+        return result
+
+    articles_done = 0
+    new_articles = []
+    started = perf_counter()
+    for company, term in units:
+        # build_rss_url gives https; the replay proxy answers plain http
+        feed = timed("rss_fetch", feedparser.parse, build_rss_url(company, term).replace("https://", "http://", 1))
+        top_n = FEED_TOP_N * len(term.terms) if isinstance(term, QueryBatch) else FEED_TOP_N
+
+        records = []
+        for entry in feed.entries[:top_n]:
+            if max_articles is not None and articles_done >= max_articles:
+                break
+            item = build_news_item(entry, company, term)
+            if item is None:
+                continue
+            articles_done += 1
+            url = timed("redirect", get_redirect_link, item["url"])
+            item["google_link"], item["url"] = item["url"], url
+            try:
+                html = timed("download", fetcher.fetch, url)
+            except Exception as e:
+                print(f"Download of {url} failed: {e}", file=sys.stderr)
+                continue
+            parsed = parse_html(url, html)
+            if parsed.get("parse_seconds") is not None:
+                timings["parse"].append(parsed["parse_seconds"])
+            if parsed.get("nlp_seconds") is not None:
+                timings["nlp"].append(parsed["nlp_seconds"])
+            item["text"] = parsed.get("text", "")
+            if parsed.get("publish_date"):
+                item["publish_date"] = parsed["publish_date"]
+            item["summary"] = parsed.get("summary") or item["summary"]
+            records.extend(attribute_news_item(item))
+
+        if records:
+            merged = timed("dedup", detector.merge, records)
+
+            def persist():
+                stored = store.add_articles(merged)
+                seen_index.add_many(article.get(key) for article in merged
+                                    for key in ("url", "google_link", "duplicate_url"))
+                return stored
+
+            new_articles.extend(timed("persist", persist))
+        if max_articles is not None and articles_done >= max_articles:
+            break
+    timed("persist", seen_index.flush)
+
+    timed("email_body", write_to_email_body, new_articles)
+    elapsed = perf_counter() - started
+
+    return {
+        "matrix": f"{companies}x{key_terms}",
+        "companies": companies,
+        "key_terms": key_terms,
+        "queries": len(units),
+        "queries_run": len(timings["rss_fetch"]),
+        "articles": articles_done,
+        "new_articles": len(new_articles),
+        "wall_seconds": round(elapsed, 3),
+        "throughput": {
+            "queries_per_second": round(len(timings["rss_fetch"]) / elapsed, 3) if elapsed else None,
+            "articles_per_second": round(articles_done / elapsed, 3) if elapsed else None
+        },
+        "stages": {stage: summarize(timings[stage]) for stage in STAGES}
+    }
+# endregion
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_in_child(matrix: str, args, proxy_url: str) -> dict:
+    """Run one matrix size in a fresh interpreter and working directory"""
+    workdir = tempfile.mkdtemp(prefix="newsradar-bench-")
+    env = dict(os.environ, http_proxy=proxy_url, HTTP_PROXY=proxy_url)
+    for name in ("no_proxy", "NO_PROXY"):
+        env.pop(name, None)
+    command = [sys.executable, os.path.abspath(__file__), "--single", matrix]
+    if args.max_articles is not None:
+        command += ["--max-articles", str(args.max_articles)]
+    if args.no_batch:
+        command.append("--no-batch")
+    try:
+        result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Benchmark of {matrix} failed:\n{result.stderr.strip()}")
+        return json.loads(result.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def report(result: dict):
+    print(f"{result['matrix']}: {result['queries_run']} queries, {result['articles']} articles in "
+          f"{result['wall_seconds']:.1f}s ({result['throughput']['articles_per_second']} articles/sec)")
+    for stage, summary in result["stages"].items():
+        if summary["count"]:
+            print(f"  {stage:<11} n={summary['count']:<6} mean={summary['mean_seconds'] * 1000:9.2f}ms "
+                  f"p95={summary['p95_seconds'] * 1000:9.2f}ms total={summary['total_seconds']:.2f}s")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> int:
+    """Print the change in mean and p95 per stage against `baseline`; returns the number of regressions"""
+    earlier = {result["matrix"]: result for result in baseline["results"]}
+    regressions = 0
+    print(f"\nCompared with {baseline.get('revision', '?')} from {baseline.get('created_at', '?')}:")
+    for result in results["results"]:
+        before = earlier.get(result["matrix"])
+        if before is None:
+            print(f"{result['matrix']}: not in the baseline")
+            continue
+        print(f"{result['matrix']}:")
+        for stage, summary in result["stages"].items():
+            old = before["stages"].get(stage, {})
+            if not summary["count"] or not old.get("count"):
+                continue
+            mean, p95 = ((summary[key] - old[key]) / old[key] if old[key] else 0.0
+                         for key in ("mean_seconds", "p95_seconds"))
+            regressed = mean > threshold
+            regressions += regressed
+            print(f"  {stage:<11} mean {mean:+7.1%}  p95 {p95:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search pipeline stages on recorded fixtures")
+    parser.add_argument("--matrix", nargs="+", default=["1x1", "10x20"],
+                        help="Companies x key terms sizes, e.g. 1x1 10x20 100x200")
+    parser.add_argument("--max-articles", type=int, help="Stop after this many articles per matrix size")
+    parser.add_argument("--no-batch", action="store_true", help="One query per key term instead of batched queries")
+    parser.add_argument("--latency", type=float, default=0.0, help="Added delay per fixture response, in seconds")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/pipeline-<revision>-<time>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Mean slowdown flagged as a regression")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        companies, key_terms = (int(value) for value in args.single.lower().split("x"))
+        print(json.dumps(run_matrix(companies, key_terms, args.max_articles, batch_queries=not args.no_batch)))
+        return
+
+    from fixture_server import FixtureServer
+
+    results = {
+        "benchmark": "pipeline",
+        "revision": git_revision(),
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"max_articles": args.max_articles, "batch_queries": not args.no_batch, "latency": args.latency},
+        "results": []
+    }
+    with FixtureServer(latency=args.latency) as server:
+        for matrix in args.matrix:
+            result = run_in_child(matrix, args, server.proxy_url)
+            report(result)
+            results["results"].append(result)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"pipeline-{results['revision']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare per-entry redirect latency: a fresh browser per entry vs the shared browser pool.
+
+Usage: python benchmarks/redirect_benchmark.py [number_of_entries]
+"""
+
+import os
+import statistics
+import sys
+from time import perf_counter
+
+import feedparser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser_pool import USER_AGENT, BrowserPool
+
+
+def legacy_get_redirect_link(url) -> str:
+    """Redirect resolution as it worked before the pool: one browser per call"""
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        page = browser.new_page()
+        try:
+            page.set_extra_http_headers({"User-Agent": USER_AGENT})
+            page.goto(url, wait_until="load", timeout=10000)
+            try:
+                page.wait_for_load_state("networkidle", timeout=5000)
+            except Exception:
+                pass
+            return page.url
+        except Exception:
+            return url
+        finally:
+            browser.close()
+
+
+def time_calls(fn, links) -> list:
+    timings = []
+    for link in links:
+        start = perf_counter()
+        try:
+            fn(link)
+        except Exception as e:
+            print(f"  failed: {e}")
+        timings.append(perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list):
+    print(f"{name}: n={len(timings)} mean={statistics.mean(timings):.3f}s "
+          f"median={statistics.median(timings):.3f}s max={max(timings):.3f}s total={sum(timings):.1f}s")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    feed = feedparser.parse("https://news.google.com/rss/search?q=Volvo+company+Warehouse")
+    links = [entry.link for entry in feed.entries[:count]]
+    if not links:
+        print("No RSS entries found, nothing to benchmark.")
+        return
+
+    report("fresh browser per entry", time_calls(legacy_get_redirect_link, links))
+
+    with BrowserPool() as pool:
+        report("shared browser pool", time_calls(pool.resolve_redirect, links))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compare summarization throughput (articles/sec) of the newspaper and Pegasus backends.
+
+The articles are the most recent ones with text from the article store. Summaries
+are not cached during the benchmark.
+
+Usage: python benchmarks/summarizer_benchmark.py [number_of_articles] [--quantize] [--batch-size N]
+"""
+
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from article_store import get_article_store
+from summarizer import NewspaperSummarizer, PegasusSummarizer
+
+
+def time_summarizer(name: str, summarizer, articles: list):
+    start = perf_counter()
+    summaries = summarizer.summarize_many(articles)
+    elapsed = perf_counter() - start
+    empty = sum(1 for summary in summaries if not summary)
+    print(f"{name}: n={len(articles)} total={elapsed:.1f}s throughput={len(articles) / elapsed:.2f} articles/sec "
+          f"(empty summaries: {empty})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("count", nargs="?", type=int, default=32)
+    parser.add_argument("--quantize", action="store_true", help="also time the int8 quantized model")
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    articles = get_article_store().article_texts(args.count)
+    if not articles:
+        print("No stored articles with text found, run a search first.")
+        return
+
+    time_summarizer("newspaper nlp()", NewspaperSummarizer(), articles)
+
+    pegasus = PegasusSummarizer(batch_size=args.batch_size).load()
+    time_summarizer(f"pegasus, batch size {args.batch_size}", pegasus, articles)
+    pegasus.batch_size = 1
+    time_summarizer("pegasus, unbatched", pegasus, articles)
+
+    if args.quantize:
+        quantized = PegasusSummarizer(batch_size=args.batch_size, quantize=True).load()
+        time_summarizer(f"pegasus int8, batch size {args.batch_size}", quantized, articles)
+
+
+if __name__ == "__main__":
+    main()
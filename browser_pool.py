@@ -0,0 +1,269 @@
+"""
+Long-lived Playwright browser pool used to resolve Google News redirect links.
+
+Launching Chromium is by far the most expensive part of resolving a redirect, so
+instead of starting a browser per RSS entry we keep a few browsers alive on a
+dedicated event-loop thread and hand out pages from them. Callers on any thread
+borrow a page through `BrowserPool.run()`.
+"""
+
+import asyncio
+import atexit
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
+
+
+class _BrowserSlot:
+    """A single browser plus the idle pages it can hand out"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.browser = None
+        self.context = None
+        self.idle_pages = []  # list of (page, uses)
+        self.restarts = 0
+        # Created on the pool's event loop (slots are made in _startup); held while the browser restarts
+        self.restart_lock = asyncio.Lock()
+
+    def is_alive(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+
+class BrowserPool:
+    """
+    Pool of headless Chromium browsers running on a background event loop.
+
+    - `browsers`: number of browser processes to keep alive
+    - `max_pages`: maximum number of pages in use at the same time, across all browsers
+    - `page_max_uses`: a page is closed and replaced after this many navigations
+    """
+
+    def __init__(self, browsers: int = 1, max_pages: int = 4, page_max_uses: int = 50,
+                 headless: bool = True):
+        self.browsers = max(1, browsers)
+        self.max_pages = max(1, max_pages)
+        self.page_max_uses = max(1, page_max_uses)
+        self.headless = headless
+
+        self._loop = None
+        self._thread = None
+        self._playwright = None
+        self._slots = []
+        self._semaphore = None
+        self._next_slot = 0
+        self._start_lock = threading.Lock()
+        self._started = threading.Event()
+        self._start_error = None
+
+    # region Lifecycle
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return self
+            self._started.clear()
+            self._start_error = None
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run_loop, name="BrowserPool", daemon=True)
+            self._thread.start()
+            self._started.wait()
+
+            if self._start_error is not None:
+                error = self._start_error
+                self._thread = None
+                raise error
+
+            logging.info(f"Browser pool started with {self.browsers} browser(s), {self.max_pages} page(s)")
+            return self
+
+    def close(self):
+        with self._start_lock:
+            if self._thread is None:
+                return
+            future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+            try:
+                future.result(timeout=30)
+            except Exception as e:
+                logging.error(f"Error shutting down browser pool: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+            self._thread = None
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._startup())
+        except Exception as e:
+            self._start_error = e
+            self._started.set()
+            self._loop.close()
+            return
+
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _startup(self):
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        self._semaphore = asyncio.Semaphore(self.max_pages)
+        self._slots = [_BrowserSlot(i) for i in range(self.browsers)]
+        try:
+            for slot in self._slots:
+                await self._launch(slot)
+        except Exception:
+            # Otherwise the Playwright driver and the browsers launched so far outlive the failed start
+            try:
+                await self._shutdown()
+            except Exception as e:
+                logging.error(f"Error cleaning up after failed browser pool start: {e}")
+            raise
+
+    async def _shutdown(self):
+        for slot in self._slots:
+            await self._close_slot(slot)
+        self._slots = []
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+    # endregion
+
+    # region Browser management
+    async def _launch(self, slot: _BrowserSlot):
+        slot.browser = await self._playwright.chromium.launch(headless=self.headless)
+        slot.context = await slot.browser.new_context(user_agent=USER_AGENT)
+        slot.idle_pages = []
+
+    async def _close_slot(self, slot: _BrowserSlot):
+        for page, _ in slot.idle_pages:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        slot.idle_pages = []
+        if slot.browser is not None:
+            try:
+                await slot.browser.close()
+            except Exception:
+                pass
+        slot.browser = None
+        slot.context = None
+
+    async def _restart(self, slot: _BrowserSlot):
+        logging.warning(f"Restarting crashed browser {slot.index}")
+        await self._close_slot(slot)
+        slot.restarts += 1
+        await self._launch(slot)
+
+    async def _acquire_page(self):
+        slot = self._slots[self._next_slot % len(self._slots)]
+        self._next_slot += 1
+
+        if not slot.is_alive():
+            async with slot.restart_lock:
+                # Another page request may have restarted it while we waited
+                if not slot.is_alive():
+                    await self._restart(slot)
+
+        if slot.idle_pages:
+            page, uses = slot.idle_pages.pop()
+            if not page.is_closed():
+                return slot, page, uses
+
+        page = await slot.context.new_page()
+        return slot, page, 0
+
+    async def _release_page(self, slot: _BrowserSlot, page, uses: int, broken: bool):
+        if broken or uses >= self.page_max_uses or not slot.is_alive():
+            try:
+                await page.close()
+            except Exception:
+                pass
+            return
+        slot.idle_pages.append((page, uses))
+
+    async def _with_page(self, fn):
+        async with self._semaphore:
+            slot, page, uses = await self._acquire_page()
+            broken = False
+            try:
+                return await fn(page)
+            except Exception:
+                broken = True
+                raise
+            finally:
+                await self._release_page(slot, page, uses + 1, broken)
+    # endregion
+
+    # region Public API
+    def submit(self, fn) -> Future:
+        """Schedule `fn(page)` (a coroutine function) on a pooled page and return a Future"""
+        if self._thread is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(self._with_page(fn), self._loop)
+
+    def run(self, fn, timeout: float = None):
+        """Run `fn(page)` (a coroutine function) on a pooled page and wait for the result"""
+        future = self.submit(fn)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Stop the coroutine so it does not keep holding a page
+            future.cancel()
+            raise
+
+    def resolve_redirect(self, url: str, timeout: float = 30) -> str:
+        """Follow a redirect in a pooled page and return the final URL"""
+
+        async def _resolve(page):
+            await page.goto(url, wait_until="load", timeout=10000)
+            try:
+                await page.wait_for_load_state("networkidle", timeout=5000)
+            except Exception:
+                pass  # Continue if network idle times out
+            return page.url
+
+        return self.run(_resolve, timeout=timeout)
+
+    def stats(self) -> dict:
+        return {
+            "browsers": len(self._slots),
+            "idle_pages": sum(len(slot.idle_pages) for slot in self._slots),
+            "restarts": sum(slot.restarts for slot in self._slots),
+        }
+    # endregion
+
+
+# region Shared pool
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_browser_pool(**kwargs) -> BrowserPool:
+    """Return the process-wide browser pool, creating it on first use"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = BrowserPool(**kwargs)
+            atexit.register(close_browser_pool)
+        return _shared_pool
+
+
+def close_browser_pool():
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is not None:
+            _shared_pool.close()
+            _shared_pool = None
+# endregion
@@ -0,0 +1,67 @@
+"""
+Email digest of newly found articles.
+
+Articles are read once as plain records (no DataFrame.iterrows), folded so a
+story found for several companies or key terms appears once, grouped by
+company and rendered into plain-text and HTML bodies from the Jinja templates
+in templates/email.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+from article_store import merge_attributions
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "email")
+
+_environment = None
+_environment_lock = threading.Lock()
+
+
+def _template_environment():
+    global _environment
+    with _environment_lock:
+        if _environment is None:
+            from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+            _environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR),
+                                       autoescape=select_autoescape(["html"]),
+                                       trim_blocks=False, keep_trailing_newline=True)
+        return _environment
+
+
+def _format_date(value) -> str:
+    if value is None or value != value:  # None or NaN from a DataFrame
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
+
+
+def group_by_company(articles) -> list:
+    """
+    [(company, articles)] in first-seen order. A story attributed to several companies is
+    listed under the first one, with the others in `other_companies`.
+    """
+    groups = {}
+    for article in merge_attributions([dict(article) for article in articles if article.get("title")]):
+        companies = (article.get("company") or "Other").split(", ")
+        article["other_companies"] = ", ".join(companies[1:])
+        article["publish_date"] = _format_date(article.get("publish_date"))
+        article["summary"] = article.get("summary") or ""
+        groups.setdefault(companies[0], []).append(article)
+    return list(groups.items())
+
+
+def render_digest(articles, intro: str = "NewsRadar found the following new articles:") -> dict:
+    """Render the digest of `articles` (an iterable of dicts). Returns the `text` and `html` bodies and the story `count`."""
+    companies = group_by_company(articles)
+    environment = _template_environment()
+    context = {"intro": intro, "companies": companies}
+
+    return {
+        "text": "".join(environment.get_template("digest.txt").generate(**context)),
+        "html": "".join(environment.get_template("digest.html").generate(**context)),
+        "count": sum(len(group) for _, group in companies)
+    }
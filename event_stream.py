@@ -0,0 +1,87 @@
+"""
+In-process publish/subscribe broker for Server-Sent Events.
+
+The search pipeline publishes progress updates and every newly stored article;
+each connected dashboard holds a subscription and receives the events over a
+single long-lived `text/event-stream` response instead of polling. Recent events
+are kept in a small ring buffer so a reconnecting client can resume from its
+`Last-Event-ID`.
+"""
+
+import json
+import queue
+import threading
+from collections import deque
+
+HEARTBEAT_SECONDS = 15
+
+
+class Subscription:
+
+    def __init__(self, broker, max_queued: int):
+        self.broker = broker
+        self.events = queue.Queue(maxsize=max_queued)
+        self.dropped = False
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+
+    def __init__(self, history: int = 200, max_queued: int = 1000):
+        self.max_queued = max_queued
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history)
+        self._next_id = 1
+
+    def publish(self, event_type: str, data):
+        with self._lock:
+            event = (self._next_id, event_type, json.dumps(data, default=str))
+            self._next_id += 1
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            try:
+                subscription.events.put_nowait(event)
+            except queue.Full:
+                # A client that stopped reading must not block the pipeline; it reloads on reconnect
+                subscription.dropped = True
+
+    def subscribe(self, last_event_id: int = None) -> Subscription:
+        subscription = Subscription(self, self.max_queued)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history:
+                    if event[0] > last_event_id:
+                        subscription.events.put_nowait(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(self, subscription: Subscription):
+        """Generator of SSE-formatted messages for a subscription, with periodic heartbeats"""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if subscription.dropped:
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                try:
+                    event_id, event_type, data = subscription.events.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+        finally:
+            subscription.close()
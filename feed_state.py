@@ -0,0 +1,147 @@
+"""
+Per-query RSS polling state for incremental searches.
+
+For every feed URL we remember the ETag and Last-Modified headers from the last
+fetch, so the next fetch can be a conditional GET, and a watermark: the publish
+time and ID of the newest entry handled so far. Feeds that answer 304 are
+skipped entirely, and from changed feeds only entries newer than the watermark,
+or as new with another ID, are processed.
+
+A search stages the new state when it fetches a feed and commits it once the
+feed's articles are stored, so a search that is interrupted in between fetches
+the same entries again on the next run instead of skipping them. Entries the
+search could not handle (a failed redirect) are held back: the watermark only
+moves up to the newest handled entry older than them. Staged state is kept per
+run and feed, and a run discards what it did not commit when it ends, so one
+search never commits a feed state another search fetched.
+"""
+
+import sqlite3
+import threading
+from calendar import timegm
+from datetime import datetime
+
+FEED_STATE_PATH = "feed_state.db"
+
+
+def entry_timestamp(entry) -> float:
+    """Publish time of an RSS entry as a UTC timestamp, or None if the entry has no date"""
+    published = entry.get("published_parsed") or entry.get("updated_parsed")
+    return float(timegm(published)) if published else None
+
+
+def entry_id(entry) -> str:
+    return entry.get("id") or entry.get("link")
+
+
+class FeedStateStore:
+
+    def __init__(self, path: str = FEED_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._staged = {}
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS feed_state (
+                feed_url TEXT PRIMARY KEY,
+                etag TEXT,
+                modified TEXT,
+                newest_entry_id TEXT,
+                watermark REAL,
+                checked_at TEXT
+            )
+        """)
+        self._connection.commit()
+
+    def get(self, feed_url: str) -> dict:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT etag, modified, newest_entry_id, watermark FROM feed_state WHERE feed_url = ?",
+                (feed_url,)).fetchone()
+        if row is None:
+            return {"etag": None, "modified": None, "newest_entry_id": None, "watermark": None}
+        return {"etag": row[0], "modified": row[1], "newest_entry_id": row[2], "watermark": row[3]}
+
+    def update(self, feed_url: str, etag: str = None, modified: str = None,
+               newest_entry_id: str = None, watermark: float = None):
+        """Record the latest validators, keeping the previous watermark if no newer entry was seen"""
+        with self._lock:
+            self._connection.execute("""
+                INSERT INTO feed_state (feed_url, etag, modified, newest_entry_id, watermark, checked_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (feed_url) DO UPDATE SET
+                    etag = excluded.etag,
+                    modified = excluded.modified,
+                    newest_entry_id = CASE
+                        WHEN excluded.newest_entry_id IS NOT NULL
+                         AND COALESCE(excluded.watermark, 0) >= COALESCE(feed_state.watermark, 0)
+                        THEN excluded.newest_entry_id ELSE feed_state.newest_entry_id END,
+                    watermark = MAX(COALESCE(excluded.watermark, 0), COALESCE(feed_state.watermark, 0)),
+                    checked_at = excluded.checked_at
+            """, (feed_url, etag, modified, newest_entry_id, watermark, datetime.now().isoformat(timespec="seconds")))
+            self._connection.commit()
+
+    def stage(self, feed_url: str, run: str = None, etag: str = None, modified: str = None, entries: list = ()):
+        """Hold the state of a feed fetched by `run`, with its (link, entry id, timestamp) entries, until commit()"""
+        with self._lock:
+            self._staged[(run, feed_url)] = {"etag": etag, "modified": modified, "entries": list(entries),
+                                             "held": set()}
+
+    def hold(self, link: str, run: str = None):
+        """Keep the watermarks of `run`'s feeds below an entry it could not handle, so it is fetched again"""
+        with self._lock:
+            for (staged_run, _), staged in self._staged.items():
+                if staged_run == run:
+                    staged["held"].add(link)
+
+    def commit(self, feed_url: str, run: str = None):
+        """Write the staged state of a feed whose entries `run` has handled"""
+        with self._lock:
+            staged = self._staged.pop((run, feed_url), None)
+        if staged is None:
+            return
+
+        held = [timestamp for link, _, timestamp in staged["entries"] if link in staged["held"] and timestamp]
+        limit = min(held, default=float("inf"))
+        handled = [(timestamp, newest_id) for link, newest_id, timestamp in staged["entries"]
+                   if timestamp and timestamp < limit and link not in staged["held"]]
+        watermark, newest_id = max(handled, key=lambda entry: entry[0], default=(None, None))
+        if any(link in staged["held"] for link, _, _ in staged["entries"]):
+            # Without validators the next fetch is a full one, instead of a 304 that skips the held entries
+            self.update(feed_url, newest_entry_id=newest_id, watermark=watermark)
+        else:
+            self.update(feed_url, etag=staged["etag"], modified=staged["modified"], newest_entry_id=newest_id,
+                        watermark=watermark)
+
+    def discard(self, run: str = None, feed_url: str = None):
+        """Drop the uncommitted state of one feed of `run`, or of all its feeds"""
+        with self._lock:
+            for key in [key for key in self._staged if key[0] == run and feed_url in (None, key[1])]:
+                del self._staged[key]
+
+    def reset(self, feed_url: str = None):
+        """Forget the state of one feed, or of every feed, forcing a full fetch"""
+        with self._lock:
+            if feed_url is None:
+                self._connection.execute("DELETE FROM feed_state")
+            else:
+                self._connection.execute("DELETE FROM feed_state WHERE feed_url = ?", (feed_url,))
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_feed_state() -> FeedStateStore:
+    """Return the process-wide feed state store"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = FeedStateStore()
+        return _shared_store
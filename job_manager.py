@@ -0,0 +1,207 @@
+"""
+Thread-safe manager for background search jobs.
+
+Each search submitted from the web app becomes a job with its own ID, status,
+progress, ETA and throughput counters. Jobs run on a bounded worker pool, so
+several searches can be queued or run at the same time, and a queued or
+running job can be cancelled.
+"""
+
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import monotonic
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class SearchJob:
+
+    def __init__(self, companies: list, key_terms: list, receiver_email: str = None, since: datetime = None,
+                 schedule_id: str = None, digest_after_id: int = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.companies = companies
+        self.key_terms = key_terms
+        self.receiver_email = receiver_email
+        # Only consider articles published after `since`; set for runs of a recurring schedule
+        self.since = since
+        self.schedule_id = schedule_id
+        # Store row after which a schedule's digest starts; the finished run reports the next one in digest_row_id
+        self.digest_after_id = digest_after_id
+        self.digest_row_id = None
+
+        self.state = QUEUED
+        self.progress = 0
+        self.message = "Queued"
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.units_done = 0
+        self.units_total = 0
+        self.new_articles = 0
+        self.cancel_event = threading.Event()
+        self.future = None
+
+        self._search_started = None
+        self._last_unit_at = None
+
+    def to_dict(self) -> dict:
+        elapsed = None
+        if self.started_at:
+            elapsed = ((self.finished_at or datetime.now()) - self.started_at).total_seconds()
+
+        throughput = None
+        eta_seconds = None
+        if self._search_started is not None and self._last_unit_at is not None and self.units_done:
+            search_elapsed = self._last_unit_at - self._search_started
+            throughput = self.units_done / search_elapsed if search_elapsed > 0 else None
+            if throughput and self.state == RUNNING:
+                eta_seconds = round((self.units_total - self.units_done) / throughput, 1)
+
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "running": self.state in (QUEUED, RUNNING),
+            "progress": self.progress,
+            "message": self.message,
+            "companies": len(self.companies),
+            "key_terms": len(self.key_terms),
+            "units_done": self.units_done,
+            "units_total": self.units_total,
+            "throughput": round(throughput, 3) if throughput else None,
+            "eta_seconds": eta_seconds,
+            "elapsed_seconds": round(elapsed, 1) if elapsed is not None else None,
+            "new_articles": self.new_articles,
+            "schedule_id": self.schedule_id,
+            "digest_row_id": self.digest_row_id,
+            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "started_at": self.started_at.strftime("%Y-%m-%d %H:%M:%S") if self.started_at else None,
+            "finished_at": self.finished_at.strftime("%Y-%m-%d %H:%M:%S") if self.finished_at else None,
+        }
+
+
+class JobManager:
+    """
+    Runs search jobs on a bounded pool of worker threads.
+
+    `run_search(job, progress_callback, unit_callback)` does the actual work and
+    returns the result dict of NewsRadar.main_web_friendly. `on_update(status)`, if
+    given, is called with the job's status dict after every change.
+    """
+
+    def __init__(self, run_search, max_workers: int = 2, max_pending: int = 10, history: int = 50,
+                 on_update=None):
+        self.run_search = run_search
+        self.on_update = on_update
+        self.max_pending = max_pending
+        self.history = history
+
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="SearchJob")
+
+    def submit(self, companies: list, key_terms: list, receiver_email: str = None, since: datetime = None,
+               schedule_id: str = None, digest_after_id: int = None) -> SearchJob:
+        """Queue a search job. Raises RuntimeError if too many jobs are already waiting or running."""
+        job = SearchJob(companies, key_terms, receiver_email, since, schedule_id, digest_after_id)
+        with self._lock:
+            pending = sum(1 for existing in self._jobs.values() if existing.state in (QUEUED, RUNNING))
+            if pending >= self.max_pending:
+                raise RuntimeError(f"Too many searches in progress ({pending})")
+            self._jobs[job.id] = job
+            self._prune()
+            job.future = self._executor.submit(self._run, job)
+            status = job.to_dict()
+        self._notify(status)
+        return job
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.state in FINISHED_STATES]
+        for job in sorted(finished, key=lambda job: job.created_at)[:max(0, len(finished) - self.history)]:
+            del self._jobs[job.id]
+
+    def _update(self, job: SearchJob, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(job, key, value)
+            status = job.to_dict()
+        self._notify(status)
+
+    def _notify(self, status: dict):
+        if self.on_update is None:
+            return
+        try:
+            self.on_update(status)
+        except Exception as e:
+            logging.error(f"Error publishing search job update: {e}")
+
+    def _run(self, job: SearchJob):
+        if job.cancel_event.is_set():
+            self._update(job, state=CANCELLED, message="Search cancelled", finished_at=datetime.now())
+            return
+        self._update(job, state=RUNNING, started_at=datetime.now(), message="Starting search...",
+                     _search_started=monotonic())
+
+        def progress_callback(progress, message):
+            """Callback function to update the job status"""
+            self._update(job, progress=progress, message=message)
+
+        def unit_callback(done, total):
+            self._update(job, units_done=done, units_total=total, _last_unit_at=monotonic())
+
+        try:
+            result = self.run_search(job, progress_callback, unit_callback)
+            if job.cancel_event.is_set():
+                final = dict(state=CANCELLED, message=result.get('message', "Search cancelled"),
+                             new_articles=len(result['new_articles']))
+            elif result['success']:
+                final = dict(state=COMPLETED, progress=100, message=result['message'],
+                             new_articles=len(result['new_articles']), digest_row_id=result.get('digest_row_id'))
+            else:
+                final = dict(state=FAILED, progress=0,
+                             message=f"Search failed: {result.get('error', 'Unknown error')}")
+        except Exception as e:
+            logging.error(f"Error running search job {job.id}: {e}")
+            final = dict(state=FAILED, progress=0, message=f"Search failed: {str(e)}")
+
+        self._update(job, finished_at=datetime.now(), **final)
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def latest(self) -> dict:
+        with self._lock:
+            if not self._jobs:
+                return None
+            return max(self._jobs.values(), key=lambda job: job.created_at).to_dict()
+
+    def list(self) -> list:
+        with self._lock:
+            return [job.to_dict() for job in sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job. Returns False if the job is unknown or already finished."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return False
+            job.cancel_event.set()
+            if job.state == QUEUED and job.future.cancel():
+                job.state = CANCELLED
+                job.message = "Search cancelled"
+                job.finished_at = datetime.now()
+            else:
+                job.message = "Cancelling..."
+            status = job.to_dict()
+        self._notify(status)
+        return True
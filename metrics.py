@@ -0,0 +1,359 @@
+"""
+In-process instrumentation of the search pipeline.
+
+Every stage (RSS fetch, redirect resolution, download, parse, NLP, dedup,
+persist, email) records its latency in a histogram and counts its outcomes -
+success, skip or fail, each with a reason such as `old_article` or
+`failed_redirect`. The totals are exposed in the Prometheus text format on the
+web app's /metrics endpoint, and the difference between two snapshots gives
+the JSON report written at the end of a run, together with the run's peak
+resident memory (RSS) of this process and of the parser workers.
+
+A search records into its own child registry (see scoped_run_metrics), which
+also adds everything to the process-wide one, so searches running at the same
+time do not count towards each other's reports.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ("rss_fetch", "redirect", "download", "parse", "nlp", "dedup", "persist", "email")
+
+SUCCESS = "success"
+SKIP = "skip"
+FAIL = "fail"
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+RUN_REPORT_DIR = "run_reports"
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def copy(self) -> "Histogram":
+        histogram = Histogram()
+        histogram.counts = list(self.counts)
+        histogram.sum = self.sum
+        histogram.count = self.count
+        return histogram
+
+    def minus(self, earlier: "Histogram") -> "Histogram":
+        histogram = Histogram()
+        histogram.counts = [a - b for a, b in zip(self.counts, earlier.counts)]
+        histogram.sum = self.sum - earlier.sum
+        histogram.count = self.count - earlier.count
+        return histogram
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+class StageTimer:
+    """Times one stage call; the outcome is a success unless marked otherwise or an exception escapes"""
+
+    def __init__(self, registry: "MetricsRegistry", stage: str):
+        self.registry = registry
+        self.stage = stage
+        self.outcome = SUCCESS
+        self.reason = ""
+
+    def skip(self, reason: str):
+        self.outcome, self.reason = SKIP, reason
+
+    def fail(self, reason: str):
+        self.outcome, self.reason = FAIL, reason
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.outcome == SUCCESS:
+            self.fail(exc_type.__name__)
+        self.registry.observe(self.stage, perf_counter() - self._start, self.outcome, self.reason)
+        return False
+
+
+class MetricsRegistry:
+    """Latency histograms and counters; a registry with a `parent` also records everything into it"""
+
+    def __init__(self, parent: "MetricsRegistry" = None):
+        self.parent = parent
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._events = {}
+        self._counters = {}
+
+    def timed(self, stage: str) -> StageTimer:
+        """`with metrics.timed("download") as timer:` - call `timer.skip(reason)` or `timer.fail(reason)` as needed"""
+        return StageTimer(self, stage)
+
+    def observe(self, stage: str, seconds: float, outcome: str = SUCCESS, reason: str = ""):
+        with self._lock:
+            self._histograms.setdefault(stage, Histogram()).observe(seconds)
+            key = (stage, outcome, reason)
+            self._events[key] = self._events.get(key, 0) + 1
+        if self.parent is not None:
+            self.parent.observe(stage, seconds, outcome, reason)
+
+    def count(self, stage: str, outcome: str, reason: str = "", amount: int = 1):
+        """Count an outcome that was not timed, e.g. an entry skipped before any work"""
+        with self._lock:
+            key = (stage, outcome, reason)
+            self._events[key] = self._events.get(key, 0) + amount
+        if self.parent is not None:
+            self.parent.count(stage, outcome, reason, amount)
+
+    def increment(self, name: str, amount: float = 1):
+        """Increment a plain counter such as `search_units` or `articles_stored`"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+        if self.parent is not None:
+            self.parent.increment(name, amount)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "histograms": {stage: histogram.copy() for stage, histogram in self._histograms.items()},
+                "events": dict(self._events),
+                "counters": dict(self._counters)
+            }
+
+    # region Export
+    def render_prometheus(self, extra_gauges: dict = None) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP newsradar_stage_duration_seconds Time spent in each search pipeline stage",
+            "# TYPE newsradar_stage_duration_seconds histogram",
+        ]
+        for stage, histogram in sorted(snapshot["histograms"].items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'newsradar_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'newsradar_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'newsradar_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        lines += [
+            "# HELP newsradar_stage_events_total Outcomes of each pipeline stage by reason",
+            "# TYPE newsradar_stage_events_total counter",
+        ]
+        for (stage, outcome, reason), count in sorted(snapshot["events"].items()):
+            lines.append(f'newsradar_stage_events_total{{stage="{stage}",outcome="{outcome}",'
+                         f'reason="{_escape(reason)}"}} {count}')
+
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE newsradar_{name}_total counter")
+            lines.append(f"newsradar_{name}_total {value}")
+
+        for name, value in sorted((extra_gauges or {}).items()):
+            if value is None:
+                continue
+            lines.append(f"# TYPE newsradar_{name} gauge")
+            lines.append(f"newsradar_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def report_since(self, start: dict, elapsed_seconds: float) -> dict:
+        """Per-stage latency and outcome counts, and throughput, since the `start` snapshot"""
+        end = self.snapshot()
+        stages = {}
+        for stage, histogram in end["histograms"].items():
+            delta = histogram.minus(start["histograms"].get(stage, Histogram()))
+            if not delta.count:
+                continue
+            stages[stage] = {
+                "count": delta.count,
+                "total_seconds": round(delta.sum, 3),
+                "mean_seconds": round(delta.sum / delta.count, 4),
+                "p50_seconds": delta.quantile(0.5),
+                "p95_seconds": delta.quantile(0.95),
+                "outcomes": {}
+            }
+
+        for key, count in end["events"].items():
+            count -= start["events"].get(key, 0)
+            if count <= 0:
+                continue
+            stage, outcome, reason = key
+            outcomes = stages.setdefault(stage, {"count": 0, "outcomes": {}})["outcomes"]
+            if reason:
+                outcomes.setdefault(outcome, {})[reason] = count
+            else:
+                outcomes[outcome] = count
+
+        counters = {name: value - start["counters"].get(name, 0) for name, value in end["counters"].items()}
+        throughput = {}
+        if elapsed_seconds > 0:
+            throughput = {f"{name}_per_second": round(value / elapsed_seconds, 3) for name, value in counters.items()}
+
+        return {
+            "elapsed_seconds": round(elapsed_seconds, 3),
+            "stages": {stage: stages[stage] for stage in STAGES if stage in stages},
+            "counters": counters,
+            "throughput": throughput
+        }
+    # endregion
+
+
+# region Memory
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss(pid: int = None) -> int:
+    """Resident memory of a process in bytes, or None where /proc is not available"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss() -> int:
+    """Highest resident memory of this process since it started, in bytes"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """
+    Sample the resident memory of this process, and of the processes returned by
+    `child_pids()`, every `interval` seconds while a run is in progress, keeping the peaks.
+    """
+
+    def __init__(self, interval: float = 0.5, child_pids=None):
+        self.interval = interval
+        self.child_pids = child_pids
+        self.start_rss = None
+        self.peak = 0
+        self.children_peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is not None:
+            self.peak = max(self.peak, rss)
+        if self.child_pids is not None:
+            try:
+                children = sum(current_rss(pid) or 0 for pid in self.child_pids())
+            except Exception:
+                children = 0
+            self.children_peak = max(self.children_peak, children)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "RssSampler":
+        self.start_rss = current_rss()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="RssSampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> dict:
+        """Stop sampling and return the run's memory figures in MB"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+        self._sample()
+
+        def mb(value):
+            return round(value / (1024 * 1024), 1) if value else None
+
+        return {
+            "rss_start_mb": mb(self.start_rss),
+            "rss_end_mb": mb(current_rss()),
+            # Sampled, so a spike shorter than the interval can be missed; process_peak_rss_mb cannot
+            "rss_peak_mb": mb(self.peak),
+            "workers_rss_peak_mb": mb(self.children_peak),
+            "process_peak_rss_mb": mb(peak_rss())
+        }
+# endregion
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_run_report(report: dict, directory: str = RUN_REPORT_DIR, run_id: str = None) -> str:
+    """Write a run report as JSON and return its path"""
+    os.makedirs(directory, exist_ok=True)
+    name = f"run-{datetime.now().strftime('%Y%m%d-%H%M%S')}" + (f"-{run_id}" if run_id else "")
+    path = os.path.join(directory, f"{name}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    logging.info(f"Run report written to {path}")
+    return path
+
+
+_shared_registry = MetricsRegistry()
+_run_registry = contextvars.ContextVar("run_registry", default=None)
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the current run's metrics registry, or the process-wide one outside a run"""
+    return _run_registry.get() or _shared_registry
+
+
+def get_process_metrics() -> MetricsRegistry:
+    """Return the process-wide metrics registry, the totals of every run"""
+    return _shared_registry
+
+
+def scoped_run_metrics(fn):
+    """
+    Decorator running `fn` with a child registry of its own as get_metrics(). Threads started
+    by the run must copy the context (contextvars.copy_context) to record into it.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _run_registry.set(MetricsRegistry(parent=_shared_registry))
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _run_registry.reset(token)
+
+    return wrapper
@@ -0,0 +1,295 @@
+"""
+Near-duplicate detection for articles found under different URLs.
+
+The same story comes back for many key terms and from syndicated outlets, so
+exact URL matching is not enough. Each article gets a MinHash signature over the
+word 3-grams of its headline and text, whose matching positions estimate the
+Jaccard similarity of two articles. Signatures use one-permutation hashing: a
+single hash per 3-gram, binned into `SIGNATURE_SIZE` slots, so computing one is
+linear in the article length.
+
+Candidates are found by LSH banding instead of comparing against the whole
+history: the signature is cut into bands and every band is hashed into an
+indexed key, so only articles that agree on a whole band are compared. With 16
+bands of 4 slots, articles with a similarity of 0.5 or more almost always share
+a band.
+
+The first article of a story is its canonical article. Later duplicates are
+merged into it: they are stored under the canonical URL with their own company
+and key term, so one article carries every match. Syndicated copies with the
+same headline are recognized from the RSS title alone, before they are
+downloaded and parsed.
+
+Fingerprints are read from the database on every lookup, so search workers
+sharing the file merge into each other's stories. A merge holds the database's
+write lock from its first lookup to its commit, so two workers cannot both make
+the same new story canonical.
+"""
+
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+from array import array
+
+from article_record import ArticleRecord
+from article_store import get_article_store
+
+FINGERPRINT_PATH = "article_fingerprints.db"
+
+SHINGLE_SIZE = 3
+SIGNATURE_SIZE = 64
+BANDS = 16
+# Estimated Jaccard similarity above which two articles are the same story
+SIMILARITY_THRESHOLD = 0.6
+# Headlines shorter than this are too generic to identify a story on their own
+MIN_TITLE_WORDS = 5
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+_PUBLISHER_SUFFIX = re.compile(r"\s+[-|–—]\s+[^-|–—]{1,60}$")
+_EMPTY = -1
+
+
+def _shingles(text: str) -> set:
+    words = _WORDS.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text: str, size: int = SIGNATURE_SIZE) -> list:
+    """
+    One-permutation MinHash signature of a text's word 3-grams, or None for text
+    without words. Empty slots are filled from the next non-empty slot (densification).
+    """
+    shingles = _shingles(text)
+    if not shingles:
+        return None
+
+    signature = [_EMPTY] * size
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        slot = value % size
+        value //= size
+        if signature[slot] == _EMPTY or value < signature[slot]:
+            signature[slot] = value
+
+    filled = [slot for slot in range(size) if signature[slot] != _EMPTY]
+    if len(filled) < size:
+        dense = list(signature)
+        for slot in range(size):
+            if signature[slot] == _EMPTY:
+                # Borrow the nearest filled slot to the right; the distance keeps borrowed values distinct
+                distance = next(d for d in range(1, size) if signature[(slot + d) % size] != _EMPTY)
+                dense[slot] = signature[(slot + distance) % size] + distance * (1 << 58)
+        signature = dense
+    return signature
+
+
+def similarity(a: list, b: list) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+def band_keys(signature: list, bands: int = BANDS) -> list:
+    """One indexed key per band; equal keys mean the signatures agree on that whole band"""
+    rows = len(signature) // bands
+    keys = []
+    for band in range(bands):
+        values = array("Q", signature[band * rows:(band + 1) * rows]).tobytes()
+        digest = hashlib.blake2b(values, digest_size=8, person=band.to_bytes(2, "little")).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+
+def title_key(title: str) -> str:
+    """Normalized headline without the ' - Publisher' suffix, or None if it is too short to be distinctive"""
+    words = _WORDS.findall(strip_publisher(title).lower())
+    if len(words) < MIN_TITLE_WORDS:
+        return None
+    return " ".join(words)
+
+
+def strip_publisher(title: str) -> str:
+    return _PUBLISHER_SUFFIX.sub("", (title or "").strip())
+
+
+class DuplicateDetector:
+
+    def __init__(self, path: str = FINGERPRINT_PATH, threshold: float = SIMILARITY_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.merged = 0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL UNIQUE,
+                title TEXT NOT NULL DEFAULT '',
+                title_key TEXT,
+                signature BLOB
+            );
+            CREATE INDEX IF NOT EXISTS idx_fingerprints_title_key ON fingerprints (title_key);
+            CREATE TABLE IF NOT EXISTS fingerprint_bands (
+                band_key INTEGER NOT NULL,
+                fingerprint_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_fingerprint_bands_key ON fingerprint_bands (band_key);
+            CREATE TABLE IF NOT EXISTS duplicates (
+                url TEXT PRIMARY KEY,
+                canonical_url TEXT NOT NULL
+            );
+        """)
+        self._connection.commit()
+
+    @staticmethod
+    def _fingerprint_text(article: dict) -> str:
+        return f"{strip_publisher(article.get('title'))} {article.get('text') or article.get('summary') or ''}"
+
+    # region Lookups
+    def _canonical(self, url: str) -> tuple:
+        """(canonical url, canonical title) if `url` is already known, else None"""
+        row = self._connection.execute("SELECT url, title FROM fingerprints WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            row = self._connection.execute("""
+                SELECT f.url, f.title FROM duplicates d JOIN fingerprints f ON f.url = d.canonical_url
+                WHERE d.url = ?
+            """, (url,)).fetchone()
+        return row
+
+    def _nearest(self, signature: list, keys: list) -> tuple:
+        """(url, title) of the most similar stored story above the threshold, or None"""
+        rows = self._connection.execute(f"""
+            SELECT url, title, signature FROM fingerprints WHERE id IN (
+                SELECT fingerprint_id FROM fingerprint_bands WHERE band_key IN ({",".join("?" * len(keys))})
+            )
+        """, keys)
+
+        best = None
+        for url, title, candidate in rows:
+            score = similarity(signature, array("Q", candidate))
+            if score >= self.threshold and (best is None or score > best[0]):
+                best = (score, url, title)
+        return (best[1], best[2]) if best else None
+
+    def canonical_url(self, url: str) -> str:
+        """URL of the canonical article of the story `url` belongs to, or None if it is not known"""
+        with self._lock:
+            row = self._canonical(url)
+        return row[0] if row else None
+
+    def match_title(self, title: str) -> tuple:
+        """(canonical url, canonical title) of a stored story with the same headline, or None"""
+        key = title_key(title)
+        if key is None:
+            return None
+        with self._lock:
+            return self._connection.execute(
+                "SELECT url, title FROM fingerprints WHERE title_key = ? LIMIT 1", (key,)).fetchone()
+    # endregion
+
+    # region Updates
+    def _add_canonical(self, url: str, title: str, signature: list, keys: list):
+        cursor = self._connection.execute(
+            "INSERT OR IGNORE INTO fingerprints (url, title, title_key, signature) VALUES (?, ?, ?, ?)",
+            (url, title or "", title_key(title), array("Q", signature).tobytes() if signature else None))
+        if cursor.rowcount and keys:
+            self._connection.executemany("INSERT INTO fingerprint_bands (band_key, fingerprint_id) VALUES (?, ?)",
+                                         [(key, cursor.lastrowid) for key in keys])
+
+    def _add_duplicate(self, url: str, canonical_url: str):
+        self._connection.execute("INSERT OR IGNORE INTO duplicates (url, canonical_url) VALUES (?, ?)",
+                                 (url, canonical_url))
+
+    def merge(self, articles: list) -> list:
+        """
+        Map every article to its story's canonical article, fingerprinting new stories.
+        Duplicates come back under the canonical URL and title, with the URL they were
+        found under in `duplicate_url` and without their text.
+        """
+        if not articles:
+            return []
+        merged = []
+        with self._lock:
+            with self._connection:
+                # Take the write lock before looking up, see the module docstring
+                self._connection.execute("BEGIN IMMEDIATE")
+                for article in articles:
+                    url = article.get("url")
+                    if not url:
+                        merged.append(article)
+                        continue
+
+                    # Already mapped before it was downloaded, see match_title
+                    if article.get("duplicate_url"):
+                        self._add_duplicate(article["duplicate_url"], url)
+                        merged.append(article)
+                        continue
+
+                    canonical = self._canonical(url)
+                    if canonical is None:
+                        signature = minhash(self._fingerprint_text(article))
+                        keys = band_keys(signature) if signature else []
+                        canonical = self._nearest(signature, keys) if signature else None
+                        if canonical is None:
+                            self._add_canonical(url, article.get("title"), signature, keys)
+                            merged.append(article)
+                            continue
+                        self._add_duplicate(url, canonical[0])
+
+                    if canonical[0] == url:
+                        merged.append(article)
+                        continue
+
+                    self.merged += 1
+                    logging.debug(f"Merged near-duplicate {url} into {canonical[0]}")
+                    duplicate = dict(url=canonical[0], title=canonical[1] or article.get("title"),
+                                     duplicate_url=url, text="")
+                    merged.append(article.replace(**duplicate) if isinstance(article, ArticleRecord)
+                                  else dict(article, **duplicate))
+        return merged
+
+    def index_store(self, store=None) -> int:
+        """Fingerprint every article already in the article store. Returns the number indexed."""
+        store = store or get_article_store()
+        indexed = 0
+        batch = []
+        for article in store.iter_contents():
+            batch.append(article)
+            if len(batch) >= 1000:
+                indexed += len(self.merge(batch))
+                batch = []
+        if batch:
+            indexed += len(self.merge(batch))
+        return indexed
+    # endregion
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_shared_detector = None
+_shared_detector_lock = threading.Lock()
+
+
+def get_duplicate_detector() -> DuplicateDetector:
+    """Return the process-wide detector, fingerprinting the stored articles the first time"""
+    global _shared_detector
+    with _shared_detector_lock:
+        if _shared_detector is None:
+            _shared_detector = DuplicateDetector()
+            if len(_shared_detector) == 0:
+                indexed = _shared_detector.index_store()
+                if indexed:
+                    logging.info(f"Fingerprinted {indexed} stored articles for near-duplicate detection")
+        return _shared_detector
@@ -0,0 +1,68 @@
+"""
+Local NLTK resources needed by newspaper's NLP.
+
+NewsRadar used to run `nltk.download('popular')` every time it was imported,
+which hit the network and slowed down the web server's startup. Now the
+resources are provisioned once, explicitly:
+
+    python nlp_resources.py
+
+and searches only check that they are installed locally.
+"""
+
+import logging
+import sys
+
+# (path nltk.data.find looks up, package name for nltk.download)
+REQUIRED_RESOURCES = [
+    ("tokenizers/punkt", "punkt"),
+]
+
+PROVISION_COMMAND = "python nlp_resources.py"
+
+
+def missing_resources() -> list:
+    """Package names of the required NLTK resources that are not installed"""
+    import nltk
+
+    missing = []
+    for path, package in REQUIRED_RESOURCES:
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(package)
+    return missing
+
+
+def check_resources() -> bool:
+    """Log a warning with the provisioning command if resources are missing. Returns True if all are installed."""
+    try:
+        missing = missing_resources()
+    except ImportError as e:
+        logging.warning(f"Cannot check NLTK resources: {e}")
+        return False
+
+    if missing:
+        logging.warning(f"NLTK resources {', '.join(missing)} are not installed, article summaries may be empty. "
+                        f"Run '{PROVISION_COMMAND}' once to install them.")
+        return False
+    return True
+
+
+def download_resources() -> list:
+    """Download the missing resources. Returns the packages that still failed to install."""
+    import nltk
+
+    failed = []
+    for package in missing_resources():
+        if not nltk.download(package, quiet=True):
+            failed.append(package)
+    return failed
+
+
+if __name__ == "__main__":
+    failed = download_resources()
+    if failed:
+        print(f"Failed to download NLTK resources: {', '.join(failed)}")
+        sys.exit(1)
+    print("NLTK resources are installed.")
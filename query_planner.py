@@ -0,0 +1,102 @@
+"""
+Query planner that packs many key terms into one Google News OR-query per company.
+
+Sending one RSS query per (company, key term) pair means well over a thousand
+requests per run. Instead each company's key terms are grouped into batches
+like `"Volvo" ("Warehouse" OR "Lead Time" OR "3PL")`, kept under Google's word
+limit and a maximum URL length, and each returned entry is attributed back to
+the key terms it actually mentions.
+"""
+
+import re
+from urllib.parse import quote_plus
+
+# Google ignores everything after the 32nd word of a query
+MAX_QUERY_WORDS = 32
+MAX_URL_LENGTH = 2000
+
+_PARENTHESES = re.compile(r"\(([^)]*)\)")
+_TAGS = re.compile(r"<[^>]+>")
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+class QueryBatch:
+    """
+    A group of key terms searched together for one company. `all_terms` is the company's
+    full key-term list, which its results are attributed against.
+    """
+
+    def __init__(self, company: str, terms: list, query: str, all_terms: list = None):
+        self.company = company
+        self.terms = terms
+        self.query = query
+        self.all_terms = all_terms or terms
+
+    def __str__(self) -> str:
+        if len(self.terms) <= 2:
+            return " / ".join(self.terms)
+        return f"{self.terms[0]} and {len(self.terms) - 1} other key terms"
+
+    def __repr__(self) -> str:
+        return f"QueryBatch({self.company!r}, {self.terms!r})"
+
+
+def _normalize(text: str) -> str:
+    return " " + _NON_WORD.sub(" ", _TAGS.sub(" ", text).lower()).strip() + " "
+
+
+def term_variants(term: str) -> list:
+    """
+    Forms of a key term to search and match on. 'Third-Party Logistics (3PL)' yields
+    'Third-Party Logistics' and '3PL'.
+    """
+    variants = [_PARENTHESES.sub("", term).strip()]
+    variants += [alias.strip() for alias in _PARENTHESES.findall(term) if alias.strip()]
+    return [variant for variant in variants if variant] or [term]
+
+
+def _term_clause(term: str) -> str:
+    return " OR ".join(f'"{variant}"' for variant in term_variants(term))
+
+
+def _word_count(query: str) -> int:
+    return len(query.split())
+
+
+def _build_query(company: str, terms: list) -> str:
+    return f'"{company}" ({" OR ".join(_term_clause(term) for term in terms)})'
+
+
+def build_batches(company: str, key_terms: list, max_words: int = MAX_QUERY_WORDS,
+                  max_url_length: int = MAX_URL_LENGTH, url_template: str = None) -> list:
+    """
+    Split a company's key terms into OR-query batches that stay within `max_words`
+    words and `max_url_length` characters once URL-encoded. A term that doesn't fit
+    on its own still gets a batch of its own.
+    """
+    url_template = url_template or "https://news.google.com/rss/search?q={}"
+    batches = []
+    current = []
+    all_terms = list(dict.fromkeys(key_terms))
+
+    def fits(terms: list) -> bool:
+        query = _build_query(company, terms)
+        return (_word_count(query) <= max_words
+                and len(url_template.format(quote_plus(query))) <= max_url_length)
+
+    for term in all_terms:
+        if current and not fits(current + [term]):
+            batches.append(QueryBatch(company, current, _build_query(company, current), all_terms))
+            current = []
+        current.append(term)
+
+    if current:
+        batches.append(QueryBatch(company, current, _build_query(company, current), all_terms))
+    return batches
+
+
+def match_key_terms(text: str, terms: list) -> list:
+    """Key terms from `terms` that appear in `text` (case-insensitive, on word boundaries)"""
+    normalized = _normalize(text or "")
+    return [term for term in terms
+            if any(_normalize(variant) in normalized for variant in term_variants(term))]
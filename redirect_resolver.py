@@ -0,0 +1,219 @@
+"""
+Tiered resolver for Google News article links.
+
+1. Decode the article ID offline - older `CBMi...` IDs embed the publisher URL
+2. Follow the redirect with a plain HTTP request on a pooled session
+3. Fall back to a headless browser from the shared browser pool
+
+Each tier is only tried when the previous one could not produce a publisher URL,
+and the resolver counts how often each tier hits. Results, including failures,
+are kept in the persistent URL cache so a link is only resolved once.
+"""
+
+import base64
+import html
+import logging
+import re
+import threading
+from time import perf_counter
+from urllib.parse import urlparse
+
+from browser_pool import USER_AGENT, BrowserPool, get_browser_pool
+from url_cache import UrlCache, get_url_cache
+
+TIERS = ("decode", "http", "browser")
+
+_ARTICLE_PREFIX = b"\x08\x13\x22"
+_ARTICLE_SUFFIX = b"\xd2\x01\x00"
+_DATA_URL_PATTERN = re.compile(r'data-n-au="([^"]+)"')
+
+
+def is_google_url(url: str) -> bool:
+    return "google.com" in (urlparse(url).netloc or "")
+
+
+def _read_varint(data: bytes, position: int):
+    result = 0
+    shift = 0
+    while position < len(data):
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+    raise ValueError("Truncated varint")
+
+
+def decode_google_news_url(url: str) -> str:
+    """Decode a Google News article link offline, returning None if the ID does not embed the URL"""
+    parts = urlparse(url).path.split("/")
+    if "articles" not in parts or parts.index("articles") + 1 >= len(parts):
+        return None
+
+    article_id = parts[parts.index("articles") + 1]
+    try:
+        decoded = base64.urlsafe_b64decode(article_id + "=" * (-len(article_id) % 4))
+    except Exception:
+        return None
+
+    if decoded.startswith(_ARTICLE_PREFIX):
+        decoded = decoded[len(_ARTICLE_PREFIX):]
+    if decoded.endswith(_ARTICLE_SUFFIX):
+        decoded = decoded[:-len(_ARTICLE_SUFFIX)]
+
+    try:
+        length, position = _read_varint(decoded, 0)
+    except ValueError:
+        return None
+    candidate = decoded[position:position + length]
+
+    # Newer IDs only contain an opaque token that has to be exchanged online
+    if candidate.startswith(b"AU_yqL"):
+        return None
+
+    try:
+        candidate = candidate.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+    return candidate if candidate.startswith(("http://", "https://")) else None
+
+
+class RedirectResolver:
+    """Resolve Google News links with the cheapest tier that works"""
+
+    def __init__(self, browser_pool: BrowserPool = None, url_cache: UrlCache = None, http_timeout: float = 10,
+                 pool_connections: int = 16, use_browser: bool = True):
+        self.browser_pool = browser_pool
+        self.url_cache = url_cache
+        self.http_timeout = http_timeout
+        self.pool_connections = pool_connections
+        self.use_browser = use_browser
+
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {tier: {"attempts": 0, "hits": 0, "seconds": 0.0} for tier in TIERS}
+        self._metrics["failed"] = 0
+        self._metrics["cache_hits"] = 0
+        self._metrics["cache_failed_hits"] = 0
+
+    # region Tiers
+    def _get_session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                      pool_maxsize=self.pool_connections)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"User-Agent": USER_AGENT})
+                self._session = session
+            return self._session
+
+    def _resolve_decode(self, url: str) -> str:
+        return decode_google_news_url(url)
+
+    def _resolve_http(self, url: str) -> str:
+        response = self._get_session().get(url, allow_redirects=True, timeout=self.http_timeout)
+        if not is_google_url(response.url):
+            return response.url
+
+        # The interstitial page sometimes carries the publisher URL as a data attribute
+        match = _DATA_URL_PATTERN.search(response.text)
+        if match:
+            candidate = html.unescape(match.group(1))
+            if not is_google_url(candidate):
+                return candidate
+        return None
+
+    def _resolve_browser(self, url: str, browser_pool: BrowserPool = None) -> str:
+        pool = browser_pool or self.browser_pool or get_browser_pool()
+        final_url = pool.resolve_redirect(url)
+        return None if is_google_url(final_url) else final_url
+    # endregion
+
+    def _attempt(self, tier: str, resolve, *args) -> str:
+        start = perf_counter()
+        try:
+            result = resolve(*args)
+        except Exception as e:
+            logging.debug(f"Redirect tier '{tier}' failed for {args[0]}: {e}")
+            result = None
+
+        with self._metrics_lock:
+            self._metrics[tier]["attempts"] += 1
+            self._metrics[tier]["seconds"] += perf_counter() - start
+            if result:
+                self._metrics[tier]["hits"] += 1
+        return result
+
+    def resolve(self, url: str, browser_pool: BrowserPool = None) -> str:
+        """Return the publisher URL for a Google News link, or the original link if every tier fails"""
+        if not is_google_url(url):
+            return url
+
+        if self.url_cache is not None:
+            hit, cached_url = self.url_cache.get(url)
+            if hit:
+                with self._metrics_lock:
+                    self._metrics["cache_hits" if cached_url else "cache_failed_hits"] += 1
+                return cached_url or url
+
+        result = (self._attempt("decode", self._resolve_decode, url)
+                  or self._attempt("http", self._resolve_http, url))
+        if not result and self.use_browser:
+            result = self._attempt("browser", self._resolve_browser, url, browser_pool)
+
+        if not result:
+            with self._metrics_lock:
+                self._metrics["failed"] += 1
+            if self.url_cache is not None:
+                self.url_cache.put_failure(url)
+            return url
+
+        if self.url_cache is not None:
+            self.url_cache.put(url, result)
+        return result
+
+    def metrics(self) -> dict:
+        """Attempts, hits, hit rate and mean latency per tier"""
+        with self._metrics_lock:
+            report = {
+                "failed": self._metrics["failed"],
+                "cache_hits": self._metrics["cache_hits"],
+                "cache_failed_hits": self._metrics["cache_failed_hits"],
+            }
+            for tier in TIERS:
+                counts = self._metrics[tier]
+                attempts = counts["attempts"]
+                report[tier] = {
+                    "attempts": attempts,
+                    "hits": counts["hits"],
+                    "hit_rate": counts["hits"] / attempts if attempts else 0.0,
+                    "mean_seconds": counts["seconds"] / attempts if attempts else 0.0,
+                }
+            return report
+
+    def log_metrics(self):
+        report = self.metrics()
+        summary = ", ".join(f"{tier}: {report[tier]['hits']}/{report[tier]['attempts']}" for tier in TIERS)
+        logging.info(f"Redirect resolution hits per tier - cache: {report['cache_hits']}, {summary}, "
+                     f"failed: {report['failed']} (cached failures: {report['cache_failed_hits']})")
+
+
+_shared_resolver = None
+_shared_resolver_lock = threading.Lock()
+
+
+def get_redirect_resolver() -> RedirectResolver:
+    """Return the process-wide redirect resolver"""
+    global _shared_resolver
+    with _shared_resolver_lock:
+        if _shared_resolver is None:
+            _shared_resolver = RedirectResolver(url_cache=get_url_cache())
+        return _shared_resolver
@@ -0,0 +1,207 @@
+"""
+Durable progress of search runs, so an interrupted run can be resumed.
+
+The digest records of new articles are written to `run_checkpoints.db` as they
+are stored, and every (company, key term) unit is checkpointed once it has been
+searched to the end. A search for the same companies, key terms, publish date
+cutoff and recipients that starts while an earlier one is unfinished (crashed, failed or cancelled within
+`resume_window`) continues that run: completed units are skipped, and the
+email digest at the end is read back from the checkpoint, so it covers the
+whole run without keeping its articles in memory.
+
+A unit whose articles were stored but whose checkpoint was not written yet is
+simply searched again; the article store and the seen-URL index skip what it
+already found.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from article_store import to_record
+
+CHECKPOINT_PATH = "run_checkpoints.db"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+RESUMABLE_STATES = (RUNNING, FAILED, CANCELLED)
+
+
+def run_key(companies: list, key_terms: list, since: datetime = None, receiver_email: str = None) -> str:
+    """
+    Identity of a search, independent of the order companies and key terms were given in. Searches
+    with another `since` find other entries, and ones for other recipients send their own digest.
+    """
+    payload = json.dumps([sorted(companies), sorted(key_terms), since.strftime(DATE_FORMAT) if since else None,
+                          receiver_email or None], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class CheckpointStore:
+    """
+    - `resume_window`: unfinished runs that started longer ago than this are not resumed
+    - `history_days`: finished runs older than this are deleted when a new run begins
+    """
+
+    def __init__(self, path: str = CHECKPOINT_PATH, resume_window: timedelta = timedelta(hours=24),
+                 history_days: int = 7):
+        self.path = path
+        self.resume_window = resume_window
+        self.history_days = history_days
+
+        self._lock = threading.Lock()
+        # Runs in progress in this process; never resumed by a second, concurrent search
+        self._active = set()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id TEXT PRIMARY KEY,
+                run_key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                units_done INTEGER NOT NULL DEFAULT 0,
+                articles_found INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_runs_key ON runs (run_key, started_at);
+            CREATE TABLE IF NOT EXISTS run_units (
+                run_id TEXT NOT NULL,
+                unit_key TEXT NOT NULL,
+                completed_at TEXT NOT NULL,
+                PRIMARY KEY (run_id, unit_key)
+            );
+            CREATE TABLE IF NOT EXISTS run_articles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                record TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_run_articles_run ON run_articles (run_id, id);
+        """)
+        self._connection.commit()
+
+    def begin_run(self, companies: list, key_terms: list, resume: bool = True, since: datetime = None,
+                  receiver_email: str = None) -> dict:
+        """
+        Start a run, or resume the latest unfinished run of the same search (see run_key).
+        Returns {"id", "resumed", "completed_units"} where completed_units is a set of unit keys.
+        """
+        key = run_key(companies, key_terms, since, receiver_email)
+        now = datetime.now()
+        with self._lock:
+            self._prune(now)
+            row = None
+            if resume:
+                states = ", ".join("?" * len(RESUMABLE_STATES))
+                row = self._connection.execute(f"""
+                    SELECT id FROM runs WHERE run_key = ? AND state IN ({states}) AND started_at >= ?
+                    ORDER BY started_at DESC LIMIT 1
+                """, (key, *RESUMABLE_STATES, (now - self.resume_window).strftime(DATE_FORMAT))).fetchone()
+            if row is not None and row[0] in self._active:
+                row = None
+
+            if row is None:
+                run_id = uuid.uuid4().hex[:12]
+                self._connection.execute(
+                    "INSERT INTO runs (id, run_key, state, started_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, key, RUNNING, now.strftime(DATE_FORMAT), now.strftime(DATE_FORMAT)))
+                completed_units = set()
+            else:
+                run_id = row[0]
+                self._connection.execute("UPDATE runs SET state = ?, updated_at = ? WHERE id = ?",
+                                         (RUNNING, now.strftime(DATE_FORMAT), run_id))
+                completed_units = {unit for (unit,) in self._connection.execute(
+                    "SELECT unit_key FROM run_units WHERE run_id = ?", (run_id,))}
+            self._connection.commit()
+            self._active.add(run_id)
+
+        if completed_units:
+            logging.info(f"Resuming search run {run_id}: {len(completed_units)} unit(s) already done")
+        return {"id": run_id, "resumed": row is not None, "completed_units": completed_units}
+
+    def record_articles(self, run_id: str, articles_found: int, new_articles: list):
+        """Record that a batch of found articles was stored, keeping the digest records of the new ones"""
+        now = datetime.now().strftime(DATE_FORMAT)
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT INTO run_articles (run_id, record) VALUES (?, ?)",
+                    [(run_id, json.dumps(to_record(article), ensure_ascii=False)) for article in new_articles])
+                self._connection.execute(
+                    "UPDATE runs SET articles_found = articles_found + ?, updated_at = ? WHERE id = ?",
+                    (articles_found, now, run_id))
+
+    def complete_unit(self, run_id: str, unit_key: str):
+        """Checkpoint a unit that was searched to the end, so a resumed run skips it"""
+        now = datetime.now().strftime(DATE_FORMAT)
+        with self._lock:
+            with self._connection:
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO run_units (run_id, unit_key, completed_at) VALUES (?, ?, ?)",
+                    (run_id, unit_key, now))
+                if cursor.rowcount:
+                    self._connection.execute(
+                        "UPDATE runs SET units_done = units_done + 1, updated_at = ? WHERE id = ?", (now, run_id))
+
+    def new_articles(self, run_id: str, batch_size: int = 500):
+        """Yield the records of every new article of a run, in the order they were found"""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT id, record FROM run_articles WHERE run_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (run_id, last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for row_id, record in rows:
+                yield json.loads(record)
+            last_id = rows[-1][0]
+
+    def summary(self, run_id: str) -> dict:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT units_done, articles_found, (SELECT COUNT(*) FROM run_articles WHERE run_id = ?) "
+                "FROM runs WHERE id = ?", (run_id, run_id)).fetchone()
+        if row is None:
+            return {"units_done": 0, "articles_found": 0, "new_articles": 0}
+        return {"units_done": row[0], "articles_found": row[1], "new_articles": row[2]}
+
+    def finish_run(self, run_id: str, state: str):
+        with self._lock:
+            self._connection.execute("UPDATE runs SET state = ?, updated_at = ? WHERE id = ?",
+                                     (state, datetime.now().strftime(DATE_FORMAT), run_id))
+            self._connection.commit()
+            self._active.discard(run_id)
+
+    def _prune(self, now: datetime):
+        cutoff = (now - timedelta(days=self.history_days)).strftime(DATE_FORMAT)
+        old_runs = [run_id for (run_id,) in self._connection.execute(
+            "SELECT id FROM runs WHERE updated_at < ?", (cutoff,)) if run_id not in self._active]
+        for table, column in (("run_articles", "run_id"), ("run_units", "run_id"), ("runs", "id")):
+            self._connection.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(run_id,) for run_id in old_runs])
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """Return the process-wide checkpoint store"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = CheckpointStore()
+        return _shared_store
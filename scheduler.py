@@ -0,0 +1,489 @@
+"""
+In-process scheduler for recurring searches.
+
+Each schedule has its own cron expression, companies, key terms and email
+recipient, and is kept in a small SQLite database with the time of its next
+run and of its last successful one, so schedules survive restarts. A run that
+was due while the app was down is made once on startup, not once per missed
+slot.
+
+Due schedules are handed to the JobManager one at a time: a schedule only
+starts when fewer than `max_running` searches (scheduled or manual) are in
+progress, so recurring searches do not pile up on the browser pool and the
+network. Every schedule also gets a fixed offset of up to `spread_seconds`
+after its cron time, so schedules sharing an expression such as `0 8 * * 1`
+start a few minutes apart.
+
+A scheduled search only considers RSS entries published since the schedule's
+last successful run (minus `overlap`). Feed watermarks and the seen-URL index
+are shared by every search, so a schedule's digest is not what its run stored
+first but every article stored for its companies and key terms since its last
+digest, kept as the store row id `digest_row_id`.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from job_manager import CANCELLED, COMPLETED, FINISHED_STATES, QUEUED, RUNNING, JobManager
+
+SCHEDULE_PATH = "schedules.db"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Schedule runs recorded as in progress when the process stopped
+INTERRUPTED = "interrupted"
+
+# region Cron expressions
+_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+_MONTHS = {name: number for number, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+_WEEKDAYS = {name: number for number, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])}
+
+# (minimum, maximum, names) of minute, hour, day of month, month and day of week
+_FIELDS = ((0, 59, {}), (0, 23, {}), (1, 31, {}), (1, 12, _MONTHS), (0, 7, _WEEKDAYS))
+
+# How far ahead next_after looks before deciding an expression never matches (e.g. 0 0 30 2 *)
+_MAX_LOOKAHEAD_DAYS = 366 * 5
+
+
+def _parse_value(text: str, names: dict) -> int:
+    text = text.lower()
+    if text in names:
+        return names[text]
+    if not text.isdigit():
+        raise ValueError(f"invalid value '{text}'")
+    return int(text)
+
+
+def _parse_field(text: str, minimum: int, maximum: int, names: dict) -> set:
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise ValueError(f"invalid step '{step_text}'")
+            step = int(step_text)
+
+        if part == "*":
+            start, end = minimum, maximum
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = _parse_value(start_text, names), _parse_value(end_text, names)
+        else:
+            start = _parse_value(part, names)
+            end = maximum if step > 1 else start
+
+        if not minimum <= start <= end <= maximum:
+            raise ValueError(f"'{text}' is outside {minimum}-{maximum}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """
+    Standard five-field cron expression (minute hour day-of-month month day-of-week) with
+    lists, ranges, steps, month and weekday names and the @daily/@weekly/... aliases.
+    As in Vixie cron, when both day fields are restricted a day matching either one matches;
+    a day field starting with `*` (e.g. `*/2`) counts as unrestricted.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        fields = _ALIASES.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' must have 5 fields")
+
+        try:
+            parsed = [_parse_field(field, *limits) for field, limits in zip(fields, _FIELDS)]
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression '{expression}': {e}") from None
+
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # 7 is Sunday too; Python counts Monday as 0
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self._any_day = fields[2].startswith("*")
+        self._any_weekday = fields[4].startswith("*")
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        day_match = day.day in self.days
+        weekday_match = day.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First time strictly after `moment` that matches the expression"""
+        start = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(_MAX_LOOKAHEAD_DAYS):
+            if self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+    def __str__(self) -> str:
+        return self.expression
+# endregion
+
+
+def _format(moment: datetime) -> str:
+    return moment.strftime(DATE_FORMAT) if moment else None
+
+
+def _parse(text: str) -> datetime:
+    return datetime.strptime(text, DATE_FORMAT) if text else None
+
+
+class Scheduler:
+    """
+    Runs recurring searches through a JobManager.
+
+    - `poll_interval`: seconds between checks for due schedules and finished runs
+    - `max_running`: scheduled runs only start while fewer searches than this are queued or running
+    - `spread_seconds`: upper bound of the fixed per-schedule offset after its cron time
+    - `overlap`: how far before its last successful run a schedule's next run looks back
+    """
+
+    COLUMNS = ("id", "name", "cron", "companies", "key_terms", "receiver_email", "enabled", "created_at",
+               "next_run_at", "last_success_at", "last_run_at", "last_job_id", "last_state", "last_message",
+               "digest_row_id")
+
+    def __init__(self, job_manager: JobManager, path: str = SCHEDULE_PATH, poll_interval: float = 30,
+                 max_running: int = 1, spread_seconds: int = 600, overlap: timedelta = timedelta(hours=6)):
+        self.job_manager = job_manager
+        self.path = path
+        self.poll_interval = poll_interval
+        self.max_running = max_running
+        self.spread_seconds = spread_seconds
+        self.overlap = overlap
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS schedules (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                cron TEXT NOT NULL,
+                companies TEXT NOT NULL,
+                key_terms TEXT NOT NULL,
+                receiver_email TEXT,
+                enabled INTEGER NOT NULL DEFAULT 1,
+                created_at TEXT NOT NULL,
+                next_run_at TEXT,
+                last_success_at TEXT,
+                last_run_at TEXT,
+                last_job_id TEXT,
+                last_state TEXT,
+                last_message TEXT,
+                digest_row_id INTEGER
+            )
+        """)
+        # Databases created before schedules kept their own digest
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(schedules)")}
+        if "digest_row_id" not in columns:
+            self._connection.execute("ALTER TABLE schedules ADD COLUMN digest_row_id INTEGER")
+        self._connection.commit()
+        self._mark_interrupted()
+
+    # region Schedules
+    def _row_to_dict(self, row) -> dict:
+        schedule = dict(zip(self.COLUMNS, row))
+        schedule["companies"] = json.loads(schedule["companies"])
+        schedule["key_terms"] = json.loads(schedule["key_terms"])
+        schedule["enabled"] = bool(schedule["enabled"])
+        return schedule
+
+    def _offset(self, schedule_id: str) -> timedelta:
+        """Fixed start offset of a schedule, so schedules with the same cron time do not start together"""
+        if self.spread_seconds <= 0:
+            return timedelta(0)
+        digest = hashlib.blake2b(schedule_id.encode("utf-8"), digest_size=4).digest()
+        return timedelta(seconds=int.from_bytes(digest, "little") % self.spread_seconds)
+
+    def _next_run(self, schedule_id: str, cron: str, after: datetime) -> datetime:
+        # Compare against the cron slot, not the offset time, so an offset never skips a slot
+        return CronExpression(cron).next_after(after - self._offset(schedule_id)) + self._offset(schedule_id)
+
+    def list(self) -> list:
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM schedules ORDER BY created_at").fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def get(self, schedule_id: str) -> dict:
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM schedules WHERE id = ?", (schedule_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def add(self, name: str, cron: str, companies: list, key_terms: list, receiver_email: str = None,
+            enabled: bool = True) -> dict:
+        """Create a schedule. Raises ValueError for an invalid cron expression or an empty search."""
+        CronExpression(cron)
+        if not companies or not key_terms:
+            raise ValueError("A schedule needs at least one company and one key term")
+
+        schedule_id = uuid.uuid4().hex[:12]
+        now = datetime.now()
+        with self._lock:
+            self._connection.execute("""
+                INSERT INTO schedules (id, name, cron, companies, key_terms, receiver_email, enabled, created_at,
+                                       next_run_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (schedule_id, name or cron, cron, json.dumps(companies), json.dumps(key_terms), receiver_email,
+                  int(enabled), _format(now), _format(self._next_run(schedule_id, cron, now))))
+            self._connection.commit()
+        logging.info(f"Added schedule {schedule_id} '{name}' ({cron})")
+        return self.get(schedule_id)
+
+    def update(self, schedule_id: str, **fields) -> dict:
+        """Change a schedule's name, cron, companies, key_terms, receiver_email or enabled flag"""
+        schedule = self.get(schedule_id)
+        if schedule is None:
+            return None
+
+        allowed = {"name", "cron", "companies", "key_terms", "receiver_email", "enabled"}
+        unknown = set(fields) - allowed
+        if unknown:
+            raise ValueError(f"Unknown schedule fields: {', '.join(sorted(unknown))}")
+        schedule.update(fields)
+        if not schedule["companies"] or not schedule["key_terms"]:
+            raise ValueError("A schedule needs at least one company and one key term")
+        next_run_at = self._next_run(schedule_id, schedule["cron"], datetime.now())
+
+        with self._lock:
+            self._connection.execute("""
+                UPDATE schedules SET name = ?, cron = ?, companies = ?, key_terms = ?, receiver_email = ?,
+                                     enabled = ?, next_run_at = ?
+                WHERE id = ?
+            """, (schedule["name"], schedule["cron"], json.dumps(schedule["companies"]),
+                  json.dumps(schedule["key_terms"]), schedule["receiver_email"], int(bool(schedule["enabled"])),
+                  _format(next_run_at), schedule_id))
+            self._connection.commit()
+        return self.get(schedule_id)
+
+    def remove(self, schedule_id: str) -> bool:
+        with self._lock:
+            cursor = self._connection.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
+            self._connection.commit()
+        return cursor.rowcount > 0
+
+    def run_now(self, schedule_id: str) -> bool:
+        """Make a schedule due immediately; it starts on the next check once capacity allows"""
+        with self._lock:
+            cursor = self._connection.execute("UPDATE schedules SET next_run_at = ? WHERE id = ?",
+                                              (_format(datetime.now()), schedule_id))
+            self._connection.commit()
+        return cursor.rowcount > 0
+    # endregion
+
+    # region Running
+    def _mark_interrupted(self):
+        """Runs that were in progress when the process stopped will never report back"""
+        with self._lock:
+            self._connection.execute("UPDATE schedules SET last_state = ? WHERE last_state IN (?, ?)",
+                                     (INTERRUPTED, QUEUED, RUNNING))
+            self._connection.commit()
+
+    def _collect_finished(self):
+        """Record the outcome of scheduled runs that have finished since the last check"""
+        with self._lock:
+            in_flight = self._connection.execute(
+                "SELECT id, last_job_id, last_run_at FROM schedules WHERE last_state IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+
+        for schedule_id, job_id, run_at in in_flight:
+            status = self.job_manager.get(job_id)
+            state = status["state"] if status else INTERRUPTED
+            if status and state not in FINISHED_STATES:
+                continue
+
+            # A cancelled run kept what it found, but its email was skipped, so the next run starts from the same point
+            succeeded = state == COMPLETED
+            with self._lock:
+                self._connection.execute("""
+                    UPDATE schedules SET last_state = ?, last_message = ?,
+                                         last_success_at = CASE WHEN ? THEN ? ELSE last_success_at END,
+                                         digest_row_id = CASE WHEN ? THEN COALESCE(?, digest_row_id) ELSE digest_row_id END
+                    WHERE id = ? AND last_job_id = ?
+                """, (state, status["message"] if status else "Run was lost", succeeded, run_at,
+                      succeeded, status and status.get("digest_row_id"), schedule_id, job_id))
+                self._connection.commit()
+            log = logging.info if succeeded or state == CANCELLED else logging.warning
+            log(f"Scheduled run {job_id} of {schedule_id} finished: {state}")
+
+    def _busy(self) -> int:
+        return sum(1 for job in self.job_manager.list() if job["state"] not in FINISHED_STATES)
+
+    def _start(self, schedule: dict, now: datetime) -> bool:
+        """Claim a due schedule and submit its search. Returns False if another scheduler claimed it first."""
+        next_run_at = self._next_run(schedule["id"], schedule["cron"], now)
+        with self._lock:
+            # Compare-and-set on next_run_at, so a slot is never started twice
+            cursor = self._connection.execute("""
+                UPDATE schedules SET next_run_at = ?, last_run_at = ?, last_state = ?, last_job_id = NULL,
+                                     last_message = NULL
+                WHERE id = ? AND next_run_at = ?
+            """, (_format(next_run_at), _format(now), QUEUED, schedule["id"], schedule["next_run_at"]))
+            self._connection.commit()
+        if not cursor.rowcount:
+            return False
+
+        since = schedule["last_success_at"] and _parse(schedule["last_success_at"]) - self.overlap
+        try:
+            job = self.job_manager.submit(schedule["companies"], schedule["key_terms"],
+                                          receiver_email=schedule["receiver_email"], since=since,
+                                          schedule_id=schedule["id"], digest_after_id=schedule["digest_row_id"])
+        except RuntimeError as e:
+            # Too many searches queued; retry at the next check
+            logging.warning(f"Could not start schedule {schedule['id']}: {e}")
+            with self._lock:
+                self._connection.execute("UPDATE schedules SET next_run_at = ?, last_state = ? WHERE id = ?",
+                                         (schedule["next_run_at"], INTERRUPTED, schedule["id"]))
+                self._connection.commit()
+            return False
+
+        with self._lock:
+            self._connection.execute("UPDATE schedules SET last_job_id = ? WHERE id = ?", (job.id, schedule["id"]))
+            self._connection.commit()
+        logging.info(f"Started scheduled search {job.id} for '{schedule['name']}'"
+                     f"{f' with articles since {_format(since)}' if since else ''}, next run at {_format(next_run_at)}")
+        return True
+
+    def tick(self, now: datetime = None) -> int:
+        """Record finished runs and start due schedules while capacity allows. Returns the number started."""
+        now = now or datetime.now()
+        self._collect_finished()
+
+        with self._lock:
+            rows = self._connection.execute(f"""
+                SELECT {', '.join(self.COLUMNS)} FROM schedules
+                WHERE enabled = 1 AND next_run_at <= ? ORDER BY next_run_at
+            """, (_format(now),)).fetchall()
+
+        started = 0
+        for schedule in map(self._row_to_dict, rows):
+            if schedule["last_state"] in (QUEUED, RUNNING):
+                # Still running from its previous slot: skip this slot rather than overlap with itself
+                next_run_at = self._next_run(schedule["id"], schedule["cron"], now)
+                logging.warning(f"Schedule '{schedule['name']}' is still running, skipping to {_format(next_run_at)}")
+                with self._lock:
+                    self._connection.execute("UPDATE schedules SET next_run_at = ? WHERE id = ?",
+                                             (_format(next_run_at), schedule["id"]))
+                    self._connection.commit()
+                continue
+            if self._busy() >= self.max_running:
+                break
+            if self._start(schedule, now):
+                started += 1
+        return started
+
+    def run(self):
+        """Check schedules every `poll_interval` seconds until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"Error in search scheduler: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="SearchScheduler", daemon=True)
+        self._thread.start()
+        logging.info(f"Search scheduler started with {len(self.list())} schedule(s)")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+    # endregion
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._connection.close()
+
+
+def run_scheduled_search(job, progress_callback, unit_callback) -> dict:
+    """JobManager run function for a scheduler running without the web app"""
+    from NewsRadar import main_web_friendly
+
+    return main_web_friendly(companies=job.companies, key_terms=job.key_terms, progress_callback=progress_callback,
+                             receiver_email=job.receiver_email, unit_callback=unit_callback,
+                             cancel_event=job.cancel_event, since=job.since, digest_after_id=job.digest_after_id)
+
+
+def _split(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage and run recurring NewsRadar searches")
+    parser.add_argument("--path", default=SCHEDULE_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="Show every schedule")
+    add = commands.add_parser("add", help="Add a schedule")
+    add.add_argument("--name", required=True)
+    add.add_argument("--cron", required=True, help="e.g. '0 7 * * mon' for Mondays at 07:00")
+    add.add_argument("--companies", required=True, help="Comma separated")
+    add.add_argument("--key-terms", required=True, help="Comma separated")
+    add.add_argument("--email", help="Recipient(s) of the digest, comma separated")
+    remove = commands.add_parser("remove", help="Delete a schedule")
+    remove.add_argument("schedule_id")
+    commands.add_parser("run", help="Run the scheduler in the foreground, without the web app")
+    args = parser.parse_args()
+
+    scheduler = Scheduler(JobManager(run_scheduled_search, max_workers=1), path=args.path)
+    if args.command == "run":
+        import NewsRadar  # noqa: F401 - sets up logging to app.log
+
+        print(f"Running {len(scheduler.list())} schedule(s), see app.log for progress. Stop with Ctrl+C.")
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            scheduler.close()
+    elif args.command == "list":
+        for schedule in scheduler.list():
+            print(f"{schedule['id']}  {schedule['name']} [{schedule['cron']}]"
+                  f"{'' if schedule['enabled'] else ' (disabled)'} - {len(schedule['companies'])} companies, "
+                  f"{len(schedule['key_terms'])} key terms, next run {schedule['next_run_at']}, "
+                  f"last {schedule['last_state'] or 'never'}")
+    elif args.command == "add":
+        schedule = scheduler.add(args.name, args.cron, _split(args.companies), _split(args.key_terms),
+                                 receiver_email=args.email)
+        print(f"Added schedule {schedule['id']}, next run at {schedule['next_run_at']}")
+    elif args.command == "remove":
+        print("Removed" if scheduler.remove(args.schedule_id) else f"No schedule {args.schedule_id}")
+
+
+if __name__ == "__main__":
+    main()
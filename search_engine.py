@@ -0,0 +1,167 @@
+"""
+Asynchronous search engine for the company x key term matrix.
+
+Every (company, key term) unit flows through three stages - RSS feed fetch,
+redirect resolution and article download/parse - and each stage has its own
+concurrency limit, so while one unit is being parsed others are already fetching
+feeds or resolving redirects. A per-host rate limiter replaces the fixed sleep
+between queries.
+
+The stage functions themselves are blocking (feedparser, Playwright, newspaper)
+and run on a thread pool; NewsRadar.py supplies them.
+"""
+
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from urllib.parse import urlparse
+
+
+class HostRateLimiter:
+    """Enforce a minimum interval between requests to the same host"""
+
+    def __init__(self, min_interval: float = 0.25):
+        self.min_interval = min_interval
+        self._next_allowed = {}
+        self._locks = {}
+
+    async def wait(self, url: str):
+        if self.min_interval <= 0:
+            return
+
+        host = urlparse(url).netloc.lower()
+        lock = self._locks.setdefault(host, asyncio.Lock())
+
+        async with lock:
+            delay = self._next_allowed.get(host, 0) - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_allowed[host] = monotonic() + self.min_interval
+
+
+class SearchEngine:
+    """
+    Pipeline over (company, key term) units.
+
+    - `fetch_entries(company, key_term)` returns the RSS entries for a query
+    - `build_item(entry, company, key_term)` returns an article dict or None to skip it
+    - `resolve_item(item)` resolves the article URL, returning None to skip it
+    - `parse_item(item)` downloads and parses the article and returns the final dict,
+      or a list of dicts when one entry is attributed to several key terms
+    - `feed_url(company, key_term)` returns the feed URL, used for rate limiting
+    - `plan_units(companies, key_terms)` optionally groups the matrix into units; by default
+      every (company, key term) pair is its own unit. The key term of a unit is passed on
+      to the other stage functions as-is.
+    """
+
+    def __init__(self, fetch_entries, build_item, resolve_item, parse_item, feed_url, plan_units=None,
+                 feed_concurrency: int = 4, redirect_concurrency: int = 4,
+                 parse_concurrency: int = 8, host_interval: float = 0.25):
+        self.fetch_entries = fetch_entries
+        self.build_item = build_item
+        self.resolve_item = resolve_item
+        self.parse_item = parse_item
+        self.feed_url = feed_url
+        self.plan_units = plan_units or (lambda companies, key_terms: [
+            (company, term) for company in companies for term in key_terms])
+
+        self.feed_concurrency = max(1, feed_concurrency)
+        self.redirect_concurrency = max(1, redirect_concurrency)
+        self.parse_concurrency = max(1, parse_concurrency)
+        self.host_interval = host_interval
+
+    def search(self, companies: list[str], key_terms: list[str], progress_callback=None,
+               progress_start: int = 20, progress_end: int = 80, unit_callback=None, cancel_event=None,
+               results_callback=None, complete_callback=None, collect: bool = True) -> list:
+        """Blocking entry point: run the whole matrix and return the found articles in query order"""
+        return asyncio.run(self.run(companies, key_terms, progress_callback, progress_start, progress_end,
+                                    unit_callback, cancel_event, results_callback, complete_callback, collect))
+
+    async def run(self, companies: list[str], key_terms: list[str], progress_callback=None,
+                  progress_start: int = 20, progress_end: int = 80, unit_callback=None, cancel_event=None,
+                  results_callback=None, complete_callback=None, collect: bool = True) -> list:
+        """
+        Run every unit through the pipeline. `unit_callback(done, total)` is called as units
+        complete and `results_callback(company, key_term, articles)` with each unit's articles
+        as soon as it finishes; once `cancel_event` is set, units that haven't started are skipped.
+        `complete_callback(company, key_term)` follows for units that ran to the end without an
+        error or cancellation. Without `collect` the articles are only handed to results_callback
+        and an empty list is returned, so a long search does not hold them all in memory.
+        """
+        units = self.plan_units(companies, key_terms)
+        if not units:
+            return []
+
+        loop = asyncio.get_running_loop()
+        workers = self.feed_concurrency + self.redirect_concurrency + self.parse_concurrency
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="SearchEngine")
+
+        feed_slots = asyncio.Semaphore(self.feed_concurrency)
+        redirect_slots = asyncio.Semaphore(self.redirect_concurrency)
+        parse_slots = asyncio.Semaphore(self.parse_concurrency)
+        feed_limiter = HostRateLimiter(self.host_interval)
+        article_limiter = HostRateLimiter(self.host_interval)
+
+        completed = 0
+
+        def report(company: str, term: str):
+            if unit_callback:
+                unit_callback(completed, len(units))
+            if progress_callback:
+                progress = progress_start + int((completed / len(units)) * (progress_end - progress_start))
+                progress_callback(progress, f"Searching {company} for {term}...")
+
+        async def blocking(fn, *args):
+            # Carry the caller's context into the pool thread, e.g. the run's metrics registry
+            return await loop.run_in_executor(executor, contextvars.copy_context().run, fn, *args)
+
+        async def process_item(item):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            async with redirect_slots:
+                item = await blocking(self.resolve_item, item)
+            if item is None:
+                return None
+
+            await article_limiter.wait(item["url"])
+            async with parse_slots:
+                return await blocking(self.parse_item, item)
+
+        async def process_unit(company: str, term: str) -> list:
+            nonlocal completed
+            try:
+                if cancel_event is not None and cancel_event.is_set():
+                    return []
+                await feed_limiter.wait(self.feed_url(company, term))
+                async with feed_slots:
+                    entries = await blocking(self.fetch_entries, company, term)
+
+                items = [self.build_item(entry, company, term) for entry in entries]
+                results = await asyncio.gather(*(process_item(item) for item in items if item is not None))
+                articles = []
+                for result in results:
+                    if isinstance(result, list):
+                        articles.extend(result)
+                    elif result is not None:
+                        articles.append(result)
+
+                if results_callback and articles:
+                    await blocking(results_callback, company, term, articles)
+                if complete_callback and not (cancel_event is not None and cancel_event.is_set()):
+                    await blocking(complete_callback, company, term)
+                return articles if collect else []
+            except Exception as e:
+                logging.error(f"Error fetching RSS feed for {company} - {term}: {e}")
+                return []
+            finally:
+                completed += 1
+                report(company, term)
+
+        try:
+            unit_results = await asyncio.gather(*(process_unit(company, term) for company, term in units))
+        finally:
+            executor.shutdown(wait=False)
+
+        return [article for articles in unit_results for article in articles]
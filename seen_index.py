@@ -0,0 +1,233 @@
+"""
+Compact on-disk index of article URLs NewsRadar has already seen.
+
+URLs are canonicalized and hashed to 64 bits, and the hashes are kept as one
+sorted array (8 bytes per URL) which loads straight from disk with a single
+read. An optional Bloom filter sits in front of the array so most lookups for
+unseen URLs never touch it. Both Google News links and resolved publisher URLs
+are indexed, so a known article can be skipped before redirect resolution and
+again before it is downloaded and parsed.
+
+Several processes (search workers) can share one index file: a flush takes a
+lock file and merges in whatever other processes wrote since this one last
+read the file, instead of overwriting it.
+"""
+
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from article_store import get_article_store
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process writes the index
+    fcntl = None
+
+SEEN_INDEX_PATH = "seen_urls.idx"
+
+_TRACKING_PARAMETERS = {"fbclid", "gclid", "dclid", "mc_cid", "mc_eid", "oc", "ref", "cmpid", "ocid"}
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a URL so trivial variants (tracking params, www., fragments, trailing slash) compare equal"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if host.endswith(":80") or host.endswith(":443"):
+        host = host.rsplit(":", 1)[0]
+
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not key.lower().startswith("utm_") and key.lower() not in _TRACKING_PARAMETERS]
+    path = parts.path.rstrip("/") or "/"
+
+    return urlunsplit(("https" if parts.scheme in ("http", "https") else parts.scheme,
+                       host, path, urlencode(sorted(query)), ""))
+
+
+def url_hash(url: str) -> int:
+    digest = hashlib.blake2b(canonicalize_url(url).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+@contextmanager
+def _file_lock(path: str):
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class BloomFilter:
+    """Bloom filter over 64-bit URL hashes, using double hashing to derive the probe positions"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01, bits: bytearray = None):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.probes = max(1, round(self.size / capacity * math.log(2)))
+        length = (self.size + 7) // 8
+        self.bits = bits if bits is not None and len(bits) == length else bytearray(length)
+
+    def _positions(self, value: int):
+        first = value & 0xFFFFFFFF
+        second = (value >> 32) | 1
+        for i in range(self.probes):
+            yield (first + i * second) % self.size
+
+    def add(self, value: int):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: int) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class SeenUrlIndex:
+
+    def __init__(self, path: str = SEEN_INDEX_PATH, use_bloom: bool = True,
+                 bloom_capacity: int = 1000000, bloom_error_rate: float = 0.01):
+        self.path = path
+        self.use_bloom = use_bloom
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+
+        self._lock = threading.Lock()
+        self._hashes = array("Q")
+        self._pending = set()
+        self._bloom = None
+        self._file_stamp = None
+        self.load()
+
+    @property
+    def _bloom_path(self) -> str:
+        return self.path + ".bloom"
+
+    def _stamp(self) -> tuple:
+        """Size and modification time of the index file, to notice writes by other processes"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def load(self):
+        with self._lock:
+            self._hashes = array("Q")
+            self._pending = set()
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    self._hashes.frombytes(f.read())
+            self._file_stamp = self._stamp()
+
+            self._bloom = None
+            if self.use_bloom:
+                capacity = max(self.bloom_capacity, len(self._hashes) * 2)
+                bits = None
+                if os.path.exists(self._bloom_path):
+                    with open(self._bloom_path, "rb") as f:
+                        bits = bytearray(f.read())
+                self._bloom = BloomFilter(capacity, self.bloom_error_rate, bits)
+                if self._bloom.bits is not bits:
+                    # Missing or resized filter: rebuild it from the hash array
+                    for value in self._hashes:
+                        self._bloom.add(value)
+
+    def _contains_hash(self, value: int) -> bool:
+        if self._bloom is not None and value not in self._bloom:
+            return False
+        if value in self._pending:
+            return True
+        position = bisect_left(self._hashes, value)
+        return position < len(self._hashes) and self._hashes[position] == value
+
+    def __contains__(self, url: str) -> bool:
+        if not url:
+            return False
+        with self._lock:
+            return self._contains_hash(url_hash(url))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._hashes) + len(self._pending)
+
+    def add_many(self, urls):
+        with self._lock:
+            for url in urls:
+                if not url:
+                    continue
+                value = url_hash(url)
+                if self._contains_hash(value):
+                    continue
+                self._pending.add(value)
+                if self._bloom is not None:
+                    self._bloom.add(value)
+
+    def add(self, url: str):
+        self.add_many([url])
+
+    def flush(self):
+        """Merge pending hashes into the sorted array and write it (and the Bloom filter) to disk"""
+        with self._lock, _file_lock(self.path + ".lock"):
+            if not self._pending:
+                return
+            sources = [self._hashes, sorted(self._pending)]
+            if self._stamp() != self._file_stamp:
+                # Another process flushed since we last read the file; keep its hashes too
+                written = array("Q")
+                with open(self.path, "rb") as f:
+                    written.frombytes(f.read())
+                sources.append(written)
+                if self._bloom is not None:
+                    for value in written:
+                        self._bloom.add(value)
+            # A linear merge of sorted inputs, dropping hashes present in more than one of them
+            merged = array("Q", (value for value, _ in itertools.groupby(heapq.merge(*sources))))
+            self._hashes = merged
+            self._pending = set()
+
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, "wb") as f:
+                merged.tofile(f)
+            os.replace(temporary_path, self.path)
+
+            if self._bloom is not None:
+                with open(temporary_path, "wb") as f:
+                    f.write(self._bloom.bits)
+                os.replace(temporary_path, self._bloom_path)
+            self._file_stamp = self._stamp()
+
+            logging.debug(f"Seen URL index flushed with {len(merged)} entries")
+
+
+_shared_index = None
+_shared_index_lock = threading.Lock()
+
+
+def get_seen_index() -> SeenUrlIndex:
+    """
+    Return the process-wide seen-URL index. If no index exists yet it is built once
+    from the URLs already in the article store.
+    """
+    global _shared_index
+    with _shared_index_lock:
+        if _shared_index is None:
+            building = not os.path.exists(SEEN_INDEX_PATH)
+            _shared_index = SeenUrlIndex()
+            if building:
+                _shared_index.add_many(article["url"] for article in get_article_store().all_articles())
+                _shared_index.flush()
+        return _shared_index
@@ -17,7 +17,7 @@ def main():
         
     # Import and run the Flask app
     try:
-        from web_app import app
+        from web_app import app, start_scheduler
         
         print("Web interface will be available at:")
         print("Local:http://localhost:5000")
@@ -29,7 +29,8 @@ def main():
         except:
             pass  # Browser opening is optional
         
-        # Start the Flask application
+        # Start the Flask application, and the scheduled searches with it
+        start_scheduler(use_reloader=True)
         app.run(debug=True, host='0.0.0.0', port=5000)
     except Exception as e:
         print(f"Error starting web interface: {e}")
@@ -0,0 +1,261 @@
+"""
+Article summarization backends.
+
+- `newspaper`: newspaper's extractive `nlp()` summary (the default, cheap)
+- `pegasus`: abstractive summaries from a Pegasus model
+
+The Pegasus engine loads the model once, sorts articles by token length and
+summarizes them in batches, so a batch only pads up to its own longest article.
+Generation runs under `torch.inference_mode()` with a fixed number of CPU
+threads and can use dynamic int8 quantization of the linear layers. Summaries
+of both backends are cached by a hash of the content they were generated from,
+so an article found again for another company or key term is summarized once.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from time import time
+
+SUMMARY_CACHE_PATH = "summary_cache.db"
+
+BACKENDS = ("newspaper", "pegasus")
+DEFAULT_PEGASUS_MODEL = "google/pegasus-cnn_dailymail"
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SummaryCache:
+
+    def __init__(self, path: str = SUMMARY_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS summary_cache (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._connection.commit()
+
+    def get_many(self, keys) -> dict:
+        keys = list(set(keys))
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, summary FROM summary_cache WHERE key IN ({placeholders})", chunk)
+                found.update(rows)
+        return found
+
+    def put_many(self, summaries: dict):
+        now = time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO summary_cache (key, summary, created_at) VALUES (?, ?, ?)",
+                [(key, summary, now) for key, summary in summaries.items()])
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class Summarizer:
+    """
+    Base class of the backends. `summarize_many(articles)` takes dicts with `title` and
+    `text` and returns one summary per article ("" when there is no text).
+    """
+
+    name = None
+
+    def __init__(self, cache: SummaryCache = None):
+        self.cache = cache
+
+    def cache_key(self, article: dict) -> str:
+        return content_hash(self.name, article.get("title"), article.get("text"))
+
+    def _summarize_batch(self, articles: list) -> list:
+        raise NotImplementedError
+
+    def summarize(self, title: str, text: str) -> str:
+        return self.summarize_many([{"title": title, "text": text}])[0]
+
+    def summarize_many(self, articles: list) -> list:
+        keys = [self.cache_key(article) if article.get("text") else None for article in articles]
+        summaries = self.cache.get_many(key for key in keys if key) if self.cache else {}
+
+        # The same content is only summarized once, however often it appears
+        pending = {}
+        for key, article in zip(keys, articles):
+            if key and key not in summaries:
+                pending.setdefault(key, article)
+
+        if pending:
+            generated = dict(zip(pending, self._summarize_batch(list(pending.values()))))
+            summaries.update(generated)
+            if self.cache:
+                # An empty summary is a failed batch; leave it uncached so the content is retried
+                self.cache.put_many({key: summary for key, summary in generated.items() if summary})
+
+        return [summaries.get(key, "") if key else "" for key in keys]
+
+
+class NewspaperSummarizer(Summarizer):
+    """The extractive summary newspaper's `Article.nlp()` produces"""
+
+    name = "newspaper"
+
+    def __init__(self, max_sentences: int = 5, language: str = "en", cache: SummaryCache = None):
+        super().__init__(cache)
+        self.max_sentences = max_sentences
+        self.language = language
+        self._stopwords_loaded = False
+
+    def _summarize_batch(self, articles: list) -> list:
+        from newspaper import nlp
+
+        if not self._stopwords_loaded:
+            nlp.load_stopwords(self.language)
+            self._stopwords_loaded = True
+
+        summaries = []
+        for article in articles:
+            try:
+                sentences = nlp.summarize(title=article.get("title") or "", text=article.get("text") or "",
+                                          max_sents=self.max_sentences)
+                summaries.append("\n".join(sentences))
+            except Exception as e:
+                logging.debug(f"Error summarizing article {article.get('url', '')}: {e}")
+                summaries.append("")
+        return summaries
+
+
+class PegasusSummarizer(Summarizer):
+    """
+    Batched Pegasus summarization on CPU.
+
+    - `batch_size`: most articles generated together
+    - `max_batch_tokens`: cap on batch size x padded length, so long articles get smaller batches
+    - `threads`: torch intra-op threads, every core by default
+    - `quantize`: apply dynamic int8 quantization to the model's linear layers
+    """
+
+    name = "pegasus"
+
+    def __init__(self, model_name: str = DEFAULT_PEGASUS_MODEL, batch_size: int = 8, max_batch_tokens: int = 4096,
+                 max_input_tokens: int = 512, max_summary_tokens: int = 96, num_beams: int = 2,
+                 threads: int = None, quantize: bool = False, cache: SummaryCache = None):
+        super().__init__(cache)
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_input_tokens = max_input_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.num_beams = num_beams
+        self.threads = threads or os.cpu_count() or 1
+        self.quantize = quantize
+
+        self._load_lock = threading.Lock()
+        self._generate_lock = threading.Lock()
+        self._tokenizer = None
+        self._model = None
+
+    def cache_key(self, article: dict) -> str:
+        # Pegasus only reads the text; the settings that change the output are part of the key
+        return content_hash(self.name, self.model_name, str(self.quantize), str(self.max_input_tokens),
+                            str(self.max_summary_tokens), str(self.num_beams), article.get("text"))
+
+    def load(self):
+        """Load the tokenizer and model, once"""
+        with self._load_lock:
+            if self._model is not None:
+                return self
+
+            import torch
+            from transformers import PegasusForConditionalGeneration, PegasusTokenizer
+
+            torch.set_num_threads(self.threads)
+            tokenizer = PegasusTokenizer.from_pretrained(self.model_name)
+            model = PegasusForConditionalGeneration.from_pretrained(self.model_name)
+            model.eval()
+            if self.quantize:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+            self._tokenizer = tokenizer
+            self._model = model
+            logging.info(f"Loaded {self.model_name} with {self.threads} thread(s)"
+                         f"{', int8 quantized' if self.quantize else ''}")
+            return self
+
+    def _batches(self, encoded: list) -> list:
+        """Indices of the encoded articles grouped into batches of similar length"""
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+        batches = []
+        current = []
+        for i in order:
+            # Sorted by length, so the newest article sets the batch's padded length
+            if current and (len(current) >= self.batch_size
+                            or (len(current) + 1) * len(encoded[i]) > self.max_batch_tokens):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _summarize_batch(self, articles: list) -> list:
+        self.load()
+        import torch
+
+        encoded = self._tokenizer([article.get("text") or "" for article in articles], truncation=True,
+                                  max_length=self.max_input_tokens)["input_ids"]
+        summaries = [""] * len(articles)
+
+        with self._generate_lock, torch.inference_mode():
+            for batch in self._batches(encoded):
+                inputs = self._tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="pt")
+                try:
+                    outputs = self._model.generate(**inputs, num_beams=self.num_beams,
+                                                   max_new_tokens=self.max_summary_tokens)
+                except Exception as e:
+                    logging.error(f"Error summarizing a batch of {len(batch)} articles: {e}")
+                    continue
+                decoded = self._tokenizer.batch_decode(outputs, skip_special_tokens=True)
+                for i, summary in zip(batch, decoded):
+                    summaries[i] = summary.replace("<n>", " ").strip()
+        return summaries
+
+
+_shared_summarizers = {}
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_summarizer(backend: str = "newspaper", **kwargs) -> Summarizer:
+    """Return the process-wide summarizer for a backend, sharing one summary cache"""
+    global _shared_cache
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown summarizer backend {backend}, expected one of {', '.join(BACKENDS)}")
+
+    with _shared_lock:
+        if backend not in _shared_summarizers:
+            if _shared_cache is None:
+                _shared_cache = SummaryCache()
+            summarizer_class = PegasusSummarizer if backend == "pegasus" else NewspaperSummarizer
+            _shared_summarizers[backend] = summarizer_class(cache=_shared_cache, **kwargs)
+        return _shared_summarizers[backend]
@@ -0,0 +1,99 @@
+import socket
+
+import pytest
+
+pytest.importorskip("dotenv")
+controller = pytest.importorskip("aiosmtpd.controller")
+
+import Email
+from Email import SmtpMailer, build_message, send_digest
+
+
+class RecordingHandler:
+    """Accepts every message except to rejected.example, remembering the connection it came over"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.endswith("@rejected.example"):
+            return "550 5.1.1 Mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append({"peer": session.peer, "to": list(envelope.rcpt_tos)})
+        return "250 Message accepted"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalSmtp:
+    """aiosmtpd server on a fixed local port that can be restarted"""
+
+    def __init__(self):
+        self.hostname = "127.0.0.1"
+        self.port = free_port()
+        self.handler = RecordingHandler()
+        self._controller = None
+
+    def start(self):
+        self._controller = controller.Controller(self.handler, hostname=self.hostname, port=self.port)
+        self._controller.start()
+
+    def stop(self):
+        self._controller.stop()
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    monkeypatch.setattr(Email, "sender_email", "radar@example.com")
+    server = LocalSmtp()
+    server.start()
+    yield server, server.handler
+    server.stop()
+
+
+def make_mailer(server: LocalSmtp) -> SmtpMailer:
+    return SmtpMailer(host=server.hostname, port=server.port, username="", password="", starttls=False,
+                      timeout=5, retries=2, backoff=0)
+
+
+def test_connection_is_reused_across_messages(smtp):
+    server, handler = smtp
+    with make_mailer(server) as mailer:
+        for index in range(3):
+            assert mailer.send(build_message("reader@example.com", f"Digest {index}", "body"))
+
+    assert len(handler.messages) == 3
+    assert len({message["peer"] for message in handler.messages}) == 1
+
+
+def test_dropped_connection_is_retried(smtp):
+    server, handler = smtp
+    with make_mailer(server) as mailer:
+        assert mailer.send(build_message("reader@example.com", "First", "body"))
+
+        # Restart the server, which drops the mailer's open connection
+        server.stop()
+        server.start()
+        assert mailer.send(build_message("reader@example.com", "Second", "body"))
+
+    assert [message["to"] for message in handler.messages] == [["reader@example.com"], ["reader@example.com"]]
+    assert handler.messages[0]["peer"] != handler.messages[1]["peer"]
+
+
+def test_send_digest_reports_each_recipient(smtp):
+    server, handler = smtp
+    mailer = make_mailer(server)
+    results = send_digest("a@example.com; b@rejected.example, c@example.com", "Digest", "body",
+                          html="<p>body</p>", mailer=mailer)
+    mailer.close()
+
+    assert results == {"a@example.com": True, "b@rejected.example": False, "c@example.com": True}
+    assert [message["to"] for message in handler.messages] == [["a@example.com"], ["c@example.com"]]
+    assert len({message["peer"] for message in handler.messages}) == 1
@@ -0,0 +1,174 @@
+import base64
+import importlib.util
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import url_cache
+from redirect_resolver import RedirectResolver, decode_google_news_url
+from url_cache import UrlCache
+
+requires_requests = pytest.mark.skipif(importlib.util.find_spec("requests") is None,
+                                       reason="the HTTP tier needs requests")
+
+PUBLISHER_URL = "https://publisher.example/2024/05/story.html"
+
+
+def article_link(url: str) -> str:
+    """Google News link whose article ID embeds `url`, like the older CBMi... IDs"""
+    payload = url.encode("utf-8")
+    article_id = base64.urlsafe_b64encode(b"\x08\x13\x22" + bytes([len(payload)]) + payload + b"\xd2\x01\x00")
+    return f"http://news.google.com/rss/articles/{article_id.decode('ascii').rstrip('=')}?oc=5"
+
+
+class FakeGoogle:
+    """
+    Local HTTP proxy that answers for news.google.com: `routes` maps a requested URL to
+    (status, headers, body), and `requests` lists every URL that was asked for.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                # Proxied requests carry the absolute URL as their path
+                fake.requests.append(self.path)
+                status, headers, body = fake.routes.get(self.path, (404, {}, "not found"))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body.encode("utf-8"))))
+                self.end_headers()
+                self.wfile.write(body.encode("utf-8"))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeBrowserPool:
+
+    def __init__(self, final_url: str):
+        self.final_url = final_url
+        self.calls = []
+
+    def resolve_redirect(self, url: str, timeout: float = 30) -> str:
+        self.calls.append(url)
+        return self.final_url
+
+
+@pytest.fixture
+def google():
+    fake = FakeGoogle()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = UrlCache(str(tmp_path / "url_cache.db"), negative_ttl=60)
+    yield cache
+    cache.close()
+
+
+def make_resolver(google: FakeGoogle, cache: UrlCache = None, browser_pool=None) -> RedirectResolver:
+    resolver = RedirectResolver(browser_pool=browser_pool, url_cache=cache, http_timeout=5,
+                                use_browser=browser_pool is not None)
+    session = resolver._get_session()
+    # Ignore proxies from the environment, every request goes to the fake
+    session.trust_env = False
+    session.proxies = {"http": google.url}
+    return resolver
+
+
+def test_decode_offline(google):
+    link = article_link(PUBLISHER_URL)
+    assert decode_google_news_url(link) == PUBLISHER_URL
+
+    resolver = RedirectResolver(url_cache=None, use_browser=False)
+    assert resolver.resolve(link) == PUBLISHER_URL
+    assert resolver.metrics()["decode"]["hits"] == 1
+    assert resolver.metrics()["http"]["attempts"] == 0
+
+
+def test_decode_rejects_opaque_ids():
+    token = base64.urlsafe_b64encode(b"\x08\x13\x22\x0aAU_yqLabcd\xd2\x01\x00").decode("ascii").rstrip("=")
+    assert decode_google_news_url(f"https://news.google.com/rss/articles/{token}") is None
+    assert decode_google_news_url("https://news.google.com/topics/abc") is None
+
+
+@requires_requests
+def test_http_redirect_chain(google):
+    link = "http://news.google.com/rss/articles/opaque?oc=5"
+    google.routes[link] = (302, {"Location": "http://news.google.com/read/opaque"}, "")
+    google.routes["http://news.google.com/read/opaque"] = (301, {"Location": "http://publisher.example/story"}, "")
+    google.routes["http://publisher.example/story"] = (200, {"Content-Type": "text/html"}, "<html>story</html>")
+
+    resolver = make_resolver(google)
+    assert resolver.resolve(link) == "http://publisher.example/story"
+    assert google.requests == [link, "http://news.google.com/read/opaque", "http://publisher.example/story"]
+    assert resolver.metrics()["http"]["hits"] == 1
+
+
+@requires_requests
+def test_http_reads_publisher_url_from_interstitial(google):
+    link = "http://news.google.com/rss/articles/interstitial"
+    google.routes[link] = (200, {"Content-Type": "text/html"},
+                           '<div data-n-au="https://publisher.example/a?x=1&amp;y=2"></div>')
+
+    assert make_resolver(google).resolve(link) == "https://publisher.example/a?x=1&y=2"
+
+
+@requires_requests
+@pytest.mark.parametrize("page", [
+    '<html><head><meta http-equiv="refresh" content="0;url=https://publisher.example/meta"></head></html>',
+    '<html><script>window.location.replace("https://publisher.example/js")</script></html>',
+])
+def test_browser_fallback_on_script_or_meta_refresh(google, cache, page):
+    link = "http://news.google.com/rss/articles/scripted"
+    google.routes[link] = (200, {"Content-Type": "text/html"}, page)
+    browser_pool = FakeBrowserPool(PUBLISHER_URL)
+
+    resolver = make_resolver(google, cache, browser_pool)
+    assert resolver.resolve(link) == PUBLISHER_URL
+    assert browser_pool.calls == [link]
+    assert resolver.metrics()["http"]["hits"] == 0
+    assert resolver.metrics()["browser"]["hits"] == 1
+    assert cache.get(link) == (True, PUBLISHER_URL)
+
+
+@requires_requests
+def test_failures_are_cached_for_the_negative_ttl(google, cache, monkeypatch):
+    link = "http://news.google.com/rss/articles/broken"
+    google.routes[link] = (200, {"Content-Type": "text/html"}, "<html>consent page</html>")
+    resolver = make_resolver(google, cache)
+
+    now = 1_000_000.0
+    monkeypatch.setattr(url_cache, "time", lambda: now)
+    assert resolver.resolve(link) == link
+    assert cache.get(link) == (True, None)
+
+    # Within the negative TTL the failure is served from the cache
+    now += cache.negative_ttl - 1
+    assert resolver.resolve(link) == link
+    assert google.requests == [link]
+    assert resolver.metrics()["cache_failed_hits"] == 1
+
+    # After it the link is resolved again
+    google.routes[link] = (302, {"Location": "http://publisher.example/late"}, "")
+    google.routes["http://publisher.example/late"] = (200, {}, "story")
+    now += 2
+    assert resolver.resolve(link) == "http://publisher.example/late"
+    assert google.requests == [link, link, "http://publisher.example/late"]
@@ -0,0 +1,147 @@
+"""
+Persistent cache from Google News links to resolved publisher URLs.
+
+Entries live in a small SQLite database so they survive between weekly runs.
+Successful resolutions expire after `ttl` seconds, failed ones are cached with a
+shorter `negative_ttl` so we don't keep retrying a broken link within a run but
+do try again later. The table is capped at `max_entries`, evicting the least
+recently used links first. Access times of cache hits are written in batches of
+`touch_every`, not on every hit.
+"""
+
+import sqlite3
+import threading
+from time import time
+
+URL_CACHE_PATH = "url_cache.db"
+
+DAY = 24 * 60 * 60
+
+
+class UrlCache:
+
+    def __init__(self, path: str = URL_CACHE_PATH, ttl: float = 30 * DAY, negative_ttl: float = DAY,
+                 max_entries: int = 100000, evict_every: int = 500, touch_every: int = 200):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.touch_every = touch_every
+
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        # url -> access time of hits not written yet
+        self._touched = {}
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS url_cache (
+                url TEXT PRIMARY KEY,
+                final_url TEXT,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS idx_url_cache_last_access ON url_cache (last_access)")
+        self._connection.commit()
+
+    def get(self, url: str):
+        """
+        Look up a link. Returns `(hit, final_url)`: `hit` is False on a miss or an
+        expired entry, and `final_url` is None when the link is cached as failed.
+        """
+        now = time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT final_url, expires_at FROM url_cache WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return False, None
+
+            final_url, expires_at = row
+            if expires_at < now:
+                self._touched.pop(url, None)
+                self._connection.execute("DELETE FROM url_cache WHERE url = ?", (url,))
+                self._connection.commit()
+                return False, None
+
+            self._touched[url] = now
+            if len(self._touched) >= self.touch_every:
+                self._write_touched()
+                self._connection.commit()
+            return True, final_url
+
+    def put(self, url: str, final_url: str):
+        """Cache a resolved link"""
+        self._store(url, final_url, self.ttl)
+
+    def put_failure(self, url: str):
+        """Cache a link whose redirect could not be resolved"""
+        self._store(url, None, self.negative_ttl)
+
+    def _store(self, url: str, final_url: str, ttl: float):
+        now = time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO url_cache (url, final_url, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (url, final_url, now + ttl, now))
+            self._touched.pop(url, None)
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= self.evict_every:
+                self._evict(now)
+            self._connection.commit()
+
+    def _write_touched(self):
+        if self._touched:
+            self._connection.executemany("UPDATE url_cache SET last_access = ? WHERE url = ?",
+                                         [(accessed, url) for url, accessed in self._touched.items()])
+            self._touched = {}
+
+    def _evict(self, now: float):
+        self._writes_since_evict = 0
+        self._write_touched()
+        self._connection.execute("DELETE FROM url_cache WHERE expires_at < ?", (now,))
+        excess = self._count() - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM url_cache WHERE url IN "
+                "(SELECT url FROM url_cache ORDER BY last_access ASC LIMIT ?)", (excess,))
+
+    def _count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM url_cache").fetchone()[0]
+
+    def evict(self):
+        """Drop expired entries and trim the cache down to `max_entries`"""
+        with self._lock:
+            self._evict(time())
+            self._connection.commit()
+
+    def flush(self):
+        """Write the access times of recent hits"""
+        with self._lock:
+            self._write_touched()
+            self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def close(self):
+        with self._lock:
+            self._write_touched()
+            self._connection.commit()
+            self._connection.close()
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_url_cache() -> UrlCache:
+    """Return the process-wide URL cache backed by `URL_CACHE_PATH`"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = UrlCache()
+        return _shared_cache
@@ -1,15 +1,17 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
-import pandas as pd
 import json
 import os
 import logging
-from datetime import datetime
-from NewsRadar import search_news_rss, get_old_articles, write_to_text_file, write_to_email_body, COMPANIES, KEY_TERMS, main_web_friendly
-from Email import send_email
-import threading
-from time import sleep
-from tqdm import tqdm
+from NewsRadar import COMPANIES, KEY_TERMS, main_web_friendly, run_queued_search
+from article_store import get_article_store, merge_attributions, to_record
+from event_stream import EventBroker
+from job_manager import QUEUED, RUNNING, JobManager
+from work_queue import get_work_queue
+from metrics import current_rss, get_process_metrics, peak_rss
+from scheduler import Scheduler
+from article_fetcher import get_article_fetcher
+from time import perf_counter
 
 app = Flask(__name__)
 CORS(app)
@@ -57,77 +59,53 @@ def save_user_preferences(preferences):
         logger.error(f"Error saving preferences: {e}")
         return False
 
-# Global variable to track search status
-search_status = {"running": False, "progress": 0, "message": "Ready"}
+# Progress updates and newly stored articles are pushed to dashboards over /api/events
+event_broker = EventBroker()
 
-def run_custom_search(selected_companies, selected_key_terms):
-    """Run NewsRadar search with custom company and key term selection using main_web_friendly"""
-    global search_status
-    
-    def progress_callback(progress, message):
-        """Callback function to update search status"""
-        search_status = {"running": True, "progress": progress, "message": message}
-    
-    try:
-        search_status = {"running": True, "progress": 0, "message": "Starting search..."}
-        
-        # Get user preferences for email
-        preferences = load_user_preferences()
-        receiver_email = preferences.get("receiver_email")
-        
-        # Use the main_web_friendly function from NewsRadar.py
-        result = main_web_friendly(
-            companies=selected_companies, 
-            key_terms=selected_key_terms,
-            progress_callback=progress_callback,
-            receiver_email=receiver_email
-        )
-        
-        if result['success']:
-            search_status = {"running": False, "progress": 100, 
-                            "message": result['message']}
-        else:
-            search_status = {"running": False, "progress": 0, 
-                            "message": f"Search failed: {result.get('error', 'Unknown error')}"}
-        
-    except Exception as e:
-        logger.error(f"Error running custom search: {e}")
-        search_status = {"running": False, "progress": 0, "message": f"Search failed: {str(e)}"}
+def publish_articles(articles):
+    """Push newly stored articles to connected dashboards"""
+    for record in merge_attributions([to_record(article) for article in articles]):
+        event_broker.publish("article", record)
+
+# "local" runs searches in this process; "queue" hands them to worker processes (see worker.py)
+SEARCH_MODE = os.getenv("NEWSRADAR_SEARCH_MODE", "local")
+
+def run_custom_search(job, progress_callback, unit_callback):
+    """Run NewsRadar search for a job with custom company and key term selection using main_web_friendly"""
+    # In queue mode the job only enqueues the search and follows the workers' progress
+    search = run_queued_search if SEARCH_MODE == "queue" else main_web_friendly
+    return search(
+        companies=job.companies,
+        key_terms=job.key_terms,
+        progress_callback=progress_callback,
+        receiver_email=job.receiver_email,
+        unit_callback=unit_callback,
+        cancel_event=job.cancel_event,
+        articles_callback=publish_articles,
+        since=job.since,
+        digest_after_id=job.digest_after_id
+    )
+
+# Background search jobs, several can be queued or run at once; in queue mode a job only waits on the workers
+SEARCH_WORKERS = 8 if SEARCH_MODE == "queue" else 2
+job_manager = JobManager(run_custom_search, max_workers=SEARCH_WORKERS,
+                         on_update=lambda status: event_broker.publish("progress", status))
+
+# Recurring searches, started with the app (see __main__) one at a time on the same job manager
+scheduler = Scheduler(job_manager)
+
+def start_scheduler(use_reloader: bool):
+    """
+    Start running schedules; called by every entry point before app.run. With the debug reloader
+    the app is served by a child process, and only that one runs schedules.
+    """
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scheduler.start()
 
 def get_recent_articles(limit=20):
-    """Get recent articles from the CSV file, sorted by retrieval order (most recent first)"""
+    """Get recent articles from the article store, sorted by retrieval order (most recent first)"""
     try:
-        if os.path.exists("news_articles.csv"):
-            df = pd.read_csv("news_articles.csv")
-            
-            if not df.empty:
-                # Add an index to track retrieval order (higher index = more recently retrieved)
-                df = df.reset_index(drop=True)
-                
-                # Sort by index in descending order (most recently retrieved first)
-                df = df.sort_index(ascending=False)
-                
-                # Handle publish_date formatting for display
-                if 'publish_date' in df.columns:
-                    df['publish_date'] = pd.to_datetime(df['publish_date'], errors='coerce')
-                    # Convert datetime back to string for JSON serialization
-                    df['publish_date'] = df['publish_date'].dt.strftime('%Y-%m-%d %H:%M:%S')
-                    # Replace NaT with empty string
-                    df['publish_date'] = df['publish_date'].fillna('')
-            
-            # Convert to dict and ensure all values are JSON serializable
-            articles = df.head(limit).to_dict('records')
-            
-            # Clean up any remaining pandas objects or NaN values
-            for article in articles:
-                for key, value in article.items():
-                    if pd.isna(value):
-                        article[key] = ''
-                    elif isinstance(value, pd.Timestamp):
-                        article[key] = str(value) if not pd.isna(value) else ''
-            
-            return articles
-        return []
+        return merge_attributions(get_article_store().recent_articles(limit))
     except Exception as e:
         logger.error(f"Error reading articles: {e}")
         return []
@@ -143,7 +121,7 @@ def dashboard():
     
     return render_template('dashboard.html', 
                          articles=articles, 
-                         total_articles=len(articles),
+                         total_articles=get_article_store().count(),
                          companies=all_companies,
                          key_terms=all_key_terms,
                          default_companies=DEFAULT_COMPANIES,
@@ -153,23 +131,58 @@ def dashboard():
 
 @app.route('/api/articles')
 def api_articles():
-    """API endpoint to get articles"""
+    """
+    API endpoint to get articles, one page at a time. A story stored for several companies or
+    key terms is returned once, on one page, with its companies and key terms joined.
+
+    Query parameters: limit, cursor (next_cursor of the previous page), company, key_term,
+    since/until (publish date range) and order (retrieved_at or publish_date).
+    """
     try:
-        limit = request.args.get('limit', 20, type=int)
-        articles = get_recent_articles(limit)
-        return jsonify(articles)
+        page = get_article_store().page_articles(
+            limit=request.args.get('limit', 20, type=int),
+            cursor=request.args.get('cursor'),
+            company=request.args.get('company'),
+            key_term=request.args.get('key_term'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            order_by=request.args.get('order', 'retrieved_at')
+        )
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error in api_articles: {e}")
         return jsonify({"error": "Failed to retrieve articles"}), 500
 
+@app.route('/api/search_articles')
+def api_search_articles():
+    """API endpoint for ranked full-text search over stored article titles, summaries and text"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Missing search query"}), 400
+    
+    try:
+        start = perf_counter()
+        results = get_article_store().search_articles(
+            query,
+            limit=request.args.get('limit', 20, type=int),
+            company=request.args.get('company')
+        )
+        return jsonify({
+            "query": query,
+            "results": results,
+            "took_ms": round((perf_counter() - start) * 1000, 1)
+        })
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error in api_search_articles: {e}")
+        return jsonify({"error": "Failed to search articles"}), 500
+
 @app.route('/api/search', methods=['POST'])
 def api_search():
     """API endpoint to trigger manual search"""
-    global search_status
-    
-    if search_status["running"]:
-        return jsonify({"error": "Search already in progress"}), 400
-    
     # Get search parameters from request or use preferences
     data = request.get_json() or {}
     preferences = load_user_preferences()
@@ -180,17 +193,124 @@ def api_search():
     if not selected_companies or not selected_key_terms:
         return jsonify({"error": "No companies or key terms selected"}), 400
     
-    # Start search in background thread
-    thread = threading.Thread(target=run_custom_search, args=(selected_companies, selected_key_terms))
-    thread.daemon = True
-    thread.start()
+    # Queue the search as a background job
+    try:
+        job = job_manager.submit(selected_companies, selected_key_terms,
+                                 receiver_email=preferences.get("receiver_email"))
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 429
     
-    return jsonify({"message": "Search started", "status": search_status})
+    return jsonify({"message": "Search started", "job_id": job.id, "status": job_manager.get(job.id)})
 
 @app.route('/api/search/status')
 def api_search_status():
-    """API endpoint to get search status"""
-    return jsonify(search_status)
+    """API endpoint to get the status of a search job, or of the most recent one"""
+    job_id = request.args.get('job_id')
+    status = job_manager.get(job_id) if job_id else job_manager.latest()
+    
+    if status is None:
+        if job_id:
+            return jsonify({"error": "Unknown search job"}), 404
+        return jsonify({"running": False, "progress": 0, "message": "Ready"})
+    return jsonify(status)
+
+@app.route('/api/search/jobs')
+def api_search_jobs():
+    """API endpoint to list recent search jobs"""
+    return jsonify(job_manager.list())
+
+@app.route('/api/search/<job_id>')
+def api_search_job(job_id):
+    """API endpoint to get the status of one search job"""
+    status = job_manager.get(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown search job"}), 404
+    return jsonify(status)
+
+@app.route('/api/search/<job_id>/cancel', methods=['POST'])
+def api_search_cancel(job_id):
+    """API endpoint to cancel a queued or running search job"""
+    if not job_manager.cancel(job_id):
+        return jsonify({"error": "Search job not found or already finished"}), 404
+    return jsonify({"message": "Search cancellation requested", "status": job_manager.get(job_id)})
+
+@app.route('/api/events')
+def api_events():
+    """Server-Sent Events stream of search progress and newly stored articles"""
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    subscription = event_broker.subscribe(last_event_id)
+    
+    response = Response(stream_with_context(event_broker.stream(subscription)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/schedules', methods=['GET', 'POST'])
+def api_schedules():
+    """API endpoint to list recurring searches or add one"""
+    if request.method == 'GET':
+        return jsonify(scheduler.list())
+    
+    data = request.get_json() or {}
+    preferences = load_user_preferences()
+    try:
+        schedule = scheduler.add(
+            name=data.get('name'),
+            cron=data.get('cron', ''),
+            companies=data.get('companies', preferences.get("selected_companies", DEFAULT_COMPANIES)),
+            key_terms=data.get('key_terms', preferences.get("selected_key_terms", DEFAULT_KEY_TERMS)),
+            receiver_email=data.get('receiver_email', preferences.get("receiver_email")),
+            enabled=data.get('enabled', True)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(schedule), 201
+
+@app.route('/api/schedules/<schedule_id>', methods=['GET', 'PUT', 'DELETE'])
+def api_schedule(schedule_id):
+    """API endpoint to read, change or delete one recurring search"""
+    if request.method == 'DELETE':
+        if not scheduler.remove(schedule_id):
+            return jsonify({"error": "Unknown schedule"}), 404
+        return jsonify({"message": "Schedule deleted"})
+    
+    if request.method == 'PUT':
+        try:
+            schedule = scheduler.update(schedule_id, **(request.get_json() or {}))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    else:
+        schedule = scheduler.get(schedule_id)
+    
+    if schedule is None:
+        return jsonify({"error": "Unknown schedule"}), 404
+    return jsonify(schedule)
+
+@app.route('/api/schedules/<schedule_id>/run', methods=['POST'])
+def api_schedule_run(schedule_id):
+    """API endpoint to run a recurring search now, as soon as no other search is running"""
+    if not scheduler.run_now(schedule_id):
+        return jsonify({"error": "Unknown schedule"}), 404
+    return jsonify({"message": "Schedule will run shortly", "schedule": scheduler.get(schedule_id)})
+
+@app.route('/metrics')
+def metrics():
+    """Pipeline stage latencies and outcome counters in the Prometheus text format"""
+    jobs = job_manager.list()
+    domains = get_article_fetcher().stats().values()
+    gauges = {
+        "search_jobs_running": sum(1 for job in jobs if job["state"] == RUNNING),
+        "search_jobs_queued": sum(1 for job in jobs if job["state"] == QUEUED),
+        "event_subscribers": event_broker.subscriber_count,
+        "open_domain_circuits": sum(1 for domain in domains if domain["state"] != "closed"),
+        "resident_memory_bytes": current_rss(),
+        "peak_resident_memory_bytes": peak_rss()
+    }
+    if SEARCH_MODE == "queue":
+        # Stage metrics are recorded by the worker processes; the web app reports the queue
+        gauges["queue_workers"] = len(get_work_queue().workers())
+        gauges["queue_pending_units"] = get_work_queue().pending_units()
+    return Response(get_process_metrics().render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/stats')
 def api_stats():
@@ -198,26 +318,22 @@ def api_stats():
     try:
         preferences = load_user_preferences()
         
-        if os.path.exists("news_articles.csv"):
-            df = pd.read_csv("news_articles.csv")
-            
+        article_store = get_article_store()
+        total_articles = article_store.count()
+        
+        if total_articles:
             stats = {
-                "total_articles": len(df),
+                "total_articles": total_articles,
                 "companies_tracked": len(preferences.get("selected_companies", [])),
                 "key_terms": len(preferences.get("selected_key_terms", [])),
-                "last_updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            
-            if not df.empty:
+                "last_updated": article_store.last_retrieved_at(),
                 # Articles by company
-                if 'company' in df.columns:
-                    company_stats = df['company'].value_counts().head(10).to_dict()
-                    stats["top_companies"] = company_stats
-                
+                "top_companies": article_store.counts_by("company", limit=10),
                 # Articles by key term
-                if 'key_term' in df.columns:
-                    term_stats = df['key_term'].value_counts().to_dict()
-                    stats["key_term_distribution"] = term_stats
+                "key_term_distribution": article_store.counts_by("key_term"),
+                # Articles by publish day, last 30 days with articles
+                "daily_counts": article_store.daily_counts(days=30)
+            }
             
             return jsonify(stats)
         else:
@@ -227,7 +343,8 @@ def api_stats():
                 "key_terms": len(preferences.get("selected_key_terms", [])),
                 "last_updated": "Never",
                 "top_companies": {},
-                "key_term_distribution": {}
+                "key_term_distribution": {},
+                "daily_counts": {}
             })
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
@@ -327,4 +444,5 @@ if __name__ == '__main__':
     os.makedirs('static/css', exist_ok=True)
     os.makedirs('static/js', exist_ok=True)
     
+    start_scheduler(use_reloader=True)
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,480 @@
+"""
+Shared queue of search units for worker processes.
+
+In queue mode the web app does not run searches itself: it enqueues a search as
+its (company, key term) units in `work_queue.db`, and any number of worker
+processes (`python worker.py`, see worker.py) claim units a few at a time, run
+them through the search pipeline and write the articles to the shared article
+store. A claim is a lease: a worker extends it while it works, and units whose
+lease ran out (the worker crashed or was killed) are handed to another worker,
+up to `max_attempts` times.
+
+Once no unit of a search is left open, one worker claims its finalization,
+sends the email digest from the new articles the workers recorded here, and
+marks the search completed. The web app follows a search with `status` and
+`article_rows`.
+
+The queue is a SQLite database, so the workers share it on one host; SQLite
+locking is not reliable over network filesystems.
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+from time import time
+
+from article_store import to_record
+from query_planner import QueryBatch
+
+WORK_QUEUE_PATH = os.getenv("NEWSRADAR_WORK_QUEUE", "work_queue.db")
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Search states
+QUEUED = "queued"
+RUNNING = "running"
+FINALIZING = "finalizing"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# Unit states
+UNIT_QUEUED = "queued"
+UNIT_CLAIMED = "claimed"
+UNIT_DONE = "done"
+UNIT_FAILED = "failed"
+UNIT_CANCELLED = "cancelled"
+
+
+def dump_key_term(key_term) -> str:
+    """A unit's key term, or QueryBatch of key terms, as JSON"""
+    if isinstance(key_term, QueryBatch):
+        return json.dumps({"company": key_term.company, "terms": key_term.terms, "query": key_term.query,
+                           "all_terms": key_term.all_terms}, ensure_ascii=False)
+    return json.dumps({"term": key_term}, ensure_ascii=False)
+
+
+def load_key_term(value: str):
+    data = json.loads(value)
+    if "term" in data:
+        return data["term"]
+    return QueryBatch(data["company"], data["terms"], data["query"], data.get("all_terms"))
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class WorkQueue:
+    """
+    - `lease_seconds`: how long a claim holds without a heartbeat before the unit is handed out again
+    - `max_attempts`: a unit whose claim failed or expired this many times is given up
+    - `history_days`: finished searches older than this are deleted when a new one is enqueued
+    """
+
+    def __init__(self, path: str = WORK_QUEUE_PATH, lease_seconds: float = 300, max_attempts: int = 3,
+                 history_days: int = 7):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.history_days = history_days
+
+        self._lock = threading.Lock()
+        # Writers in other processes hold the database lock briefly; wait for them instead of failing
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS searches (
+                id TEXT PRIMARY KEY,
+                companies TEXT NOT NULL,
+                key_terms TEXT NOT NULL,
+                receiver_email TEXT,
+                since TEXT,
+                state TEXT NOT NULL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                articles_found INTEGER NOT NULL DEFAULT 0,
+                worker_id TEXT,
+                lease_until REAL,
+                message TEXT,
+                email_status TEXT,
+                digest_after_id INTEGER,
+                digest_row_id INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_searches_state ON searches (state, created_at);
+            CREATE TABLE IF NOT EXISTS units (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                search_id TEXT NOT NULL,
+                company TEXT NOT NULL,
+                key_term TEXT NOT NULL,
+                unit_key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker_id TEXT,
+                lease_until REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_units_state ON units (state, id);
+            CREATE INDEX IF NOT EXISTS idx_units_search ON units (search_id, state);
+            CREATE TABLE IF NOT EXISTS search_articles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                search_id TEXT NOT NULL,
+                record TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_search_articles ON search_articles (search_id, id);
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                host TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                started_at TEXT NOT NULL,
+                last_seen REAL NOT NULL,
+                units_done INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        # Queues created before searches had a digest row range
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(searches)")}
+        for column in ("digest_after_id", "digest_row_id"):
+            if column not in columns:
+                self._connection.execute(f"ALTER TABLE searches ADD COLUMN {column} INTEGER")
+
+    def _write(self):
+        """Transaction that takes the write lock up front, so a read-then-update cannot race another process"""
+        return _ImmediateTransaction(self._connection)
+
+    # region Web app side
+    def enqueue_search(self, companies: list, key_terms: list, units: list, receiver_email: str = None,
+                       since: datetime = None, digest_after_id: int = None) -> str:
+        """
+        Enqueue a search as its units, a list of (company, key_term, unit_key) where the key term
+        may be a QueryBatch and the unit key identifies the query (its feed URL). `digest_after_id`
+        is passed on to the finalizing worker (see NewsRadar.digest_articles). Returns the search id.
+        """
+        search_id = uuid.uuid4().hex[:12]
+        now = datetime.now().strftime(DATE_FORMAT)
+        with self._lock, self._write():
+            self._prune()
+            self._connection.execute("""
+                INSERT INTO searches (id, companies, key_terms, receiver_email, since, state, created_at, updated_at,
+                                      digest_after_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (search_id, json.dumps(companies, ensure_ascii=False), json.dumps(key_terms, ensure_ascii=False),
+                  receiver_email, since.strftime(DATE_FORMAT) if since else None, QUEUED, now, now,
+                  digest_after_id))
+            self._connection.executemany(
+                "INSERT INTO units (search_id, company, key_term, unit_key, state) VALUES (?, ?, ?, ?, ?)",
+                [(search_id, company, dump_key_term(key_term), unit_key, UNIT_QUEUED)
+                 for company, key_term, unit_key in units])
+        logging.info(f"Enqueued search {search_id} with {len(units)} units")
+        return search_id
+
+    def cancel(self, search_id: str) -> bool:
+        """Stop handing out the search's units; units being worked on finish or are dropped by their workers"""
+        with self._lock, self._write():
+            cursor = self._connection.execute(
+                "UPDATE searches SET cancel_requested = 1 WHERE id = ? AND state IN (?, ?)",
+                (search_id, QUEUED, RUNNING))
+            if not cursor.rowcount:
+                return False
+            self._connection.execute("UPDATE units SET state = ? WHERE search_id = ? AND state = ?",
+                                     (UNIT_CANCELLED, search_id, UNIT_QUEUED))
+        return True
+
+    def abandon(self, search_id: str, state: str, message: str) -> bool:
+        """
+        Finish a search that no worker is taking to the end: cancel its open units and mark it `state`.
+        Returns False if it already finished or a worker holds a live lease on its finalization.
+        """
+        with self._lock, self._write():
+            cursor = self._connection.execute("""
+                UPDATE searches SET state = ?, message = ?, cancel_requested = 1, lease_until = NULL, updated_at = ?
+                WHERE id = ? AND (state IN (?, ?) OR (state = ? AND lease_until < ?))
+            """, (state, message, datetime.now().strftime(DATE_FORMAT), search_id, QUEUED, RUNNING,
+                  FINALIZING, time()))
+            if not cursor.rowcount:
+                return False
+            self._connection.execute(
+                "UPDATE units SET state = ?, lease_until = NULL WHERE search_id = ? AND state IN (?, ?)",
+                (UNIT_CANCELLED, search_id, UNIT_QUEUED, UNIT_CLAIMED))
+        logging.warning(f"Abandoned search {search_id}: {message}")
+        return True
+
+    def status(self, search_id: str) -> dict:
+        with self._lock:
+            row = self._connection.execute("""
+                SELECT state, cancel_requested, articles_found, message, email_status, created_at, updated_at,
+                       digest_row_id
+                FROM searches WHERE id = ?
+            """, (search_id,)).fetchone()
+            if row is None:
+                return None
+            units = dict(self._connection.execute(
+                "SELECT state, COUNT(*) FROM units WHERE search_id = ? GROUP BY state", (search_id,)).fetchall())
+            new_articles = self._connection.execute(
+                "SELECT COUNT(*) FROM search_articles WHERE search_id = ?", (search_id,)).fetchone()[0]
+
+        return {
+            "id": search_id,
+            "state": row[0],
+            "cancelled": bool(row[1]),
+            "articles_found": row[2],
+            "message": row[3],
+            "email_status": json.loads(row[4]) if row[4] else {},
+            "created_at": row[5],
+            "updated_at": row[6],
+            "digest_row_id": row[7],
+            "units_total": sum(units.values()),
+            "units_done": units.get(UNIT_DONE, 0),
+            "units_failed": units.get(UNIT_FAILED, 0),
+            "units_claimed": units.get(UNIT_CLAIMED, 0),
+            "new_articles": new_articles
+        }
+
+    def article_rows(self, search_id: str, after_id: int = 0, limit: int = 500) -> list:
+        """[(row_id, record)] of new articles recorded for a search after `after_id`"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, record FROM search_articles WHERE search_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (search_id, after_id, limit)).fetchall()
+        return [(row_id, json.loads(record)) for row_id, record in rows]
+
+    def new_articles(self, search_id: str):
+        """Yield the records of every new article of a search, in the order they were found"""
+        last_id = 0
+        while True:
+            rows = self.article_rows(search_id, last_id)
+            if not rows:
+                return
+            for _, record in rows:
+                yield record
+            last_id = rows[-1][0]
+
+    def workers(self) -> list:
+        """Workers that sent a heartbeat within the last lease"""
+        cutoff = time() - self.lease_seconds
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT worker_id, host, pid, started_at, units_done FROM workers WHERE last_seen >= ?",
+                (cutoff,)).fetchall()
+        return [{"worker_id": row[0], "host": row[1], "pid": row[2], "started_at": row[3], "units_done": row[4]}
+                for row in rows]
+
+    def pending_units(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM units WHERE state IN (?, ?)",
+                                            (UNIT_QUEUED, UNIT_CLAIMED)).fetchone()[0]
+    # endregion
+
+    # region Worker side
+    def register_worker(self, worker_id: str):
+        with self._lock, self._write():
+            self._connection.execute("""
+                INSERT OR REPLACE INTO workers (worker_id, host, pid, started_at, last_seen) VALUES (?, ?, ?, ?, ?)
+            """, (worker_id, socket.gethostname(), os.getpid(), datetime.now().strftime(DATE_FORMAT), time()))
+
+    def claim(self, worker_id: str, limit: int = 4) -> dict:
+        """
+        Claim up to `limit` units of the oldest search that has work left, including units whose
+        lease expired. Returns {"search": {...}, "units": [{"id", "company", "key_term", "unit_key"}]}
+        or None when there is nothing to do.
+        """
+        now = time()
+        with self._lock, self._write():
+            self._expire_units(now)
+            row = self._connection.execute("""
+                SELECT units.search_id FROM units JOIN searches ON searches.id = units.search_id
+                WHERE searches.cancel_requested = 0 AND searches.state IN (?, ?)
+                  AND (units.state = ? OR (units.state = ? AND units.lease_until < ?))
+                ORDER BY units.id LIMIT 1
+            """, (QUEUED, RUNNING, UNIT_QUEUED, UNIT_CLAIMED, now)).fetchone()
+            if row is None:
+                return None
+            search_id = row[0]
+
+            rows = self._connection.execute("""
+                SELECT id, company, key_term, unit_key FROM units
+                WHERE search_id = ? AND (state = ? OR (state = ? AND lease_until < ?))
+                ORDER BY id LIMIT ?
+            """, (search_id, UNIT_QUEUED, UNIT_CLAIMED, now, limit)).fetchall()
+            self._connection.executemany("""
+                UPDATE units SET state = ?, worker_id = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?
+            """, [(UNIT_CLAIMED, worker_id, now + self.lease_seconds, unit_id) for unit_id, _, _, _ in rows])
+            self._connection.execute("UPDATE searches SET state = ?, updated_at = ? WHERE id = ? AND state = ?",
+                                     (RUNNING, datetime.now().strftime(DATE_FORMAT), search_id, QUEUED))
+            search = self._search(search_id)
+            self._touch_worker(worker_id, now)
+
+        units = [{"id": unit_id, "company": company, "key_term": load_key_term(key_term), "unit_key": unit_key}
+                 for unit_id, company, key_term, unit_key in rows]
+        return {"search": search, "units": units}
+
+    def heartbeat(self, worker_id: str, unit_ids: list) -> bool:
+        """Extend the leases of the worker's units. Returns False if their search was cancelled."""
+        now = time()
+        with self._lock, self._write():
+            self._touch_worker(worker_id, now)
+            if not unit_ids:
+                return True
+            marks = ", ".join("?" * len(unit_ids))
+            self._connection.execute(
+                f"UPDATE units SET lease_until = ? WHERE worker_id = ? AND state = ? AND id IN ({marks})",
+                (now + self.lease_seconds, worker_id, UNIT_CLAIMED, *unit_ids))
+            cancelled = self._connection.execute(f"""
+                SELECT 1 FROM searches WHERE cancel_requested = 1
+                  AND id IN (SELECT search_id FROM units WHERE id IN ({marks}))
+            """, unit_ids).fetchone()
+        return cancelled is None
+
+    def record_articles(self, search_id: str, articles_found: int, new_articles: list):
+        """Record that a batch of found articles was stored, keeping the digest records of the new ones"""
+        with self._lock, self._write():
+            self._connection.executemany(
+                "INSERT INTO search_articles (search_id, record) VALUES (?, ?)",
+                [(search_id, json.dumps(to_record(article), ensure_ascii=False)) for article in new_articles])
+            self._connection.execute(
+                "UPDATE searches SET articles_found = articles_found + ?, updated_at = ? WHERE id = ?",
+                (articles_found, datetime.now().strftime(DATE_FORMAT), search_id))
+
+    def complete_unit(self, unit_id: int, worker_id: str) -> bool:
+        """Mark a unit done; False if the worker's lease was lost and the unit handed to another worker"""
+        with self._lock, self._write():
+            cursor = self._connection.execute(
+                "UPDATE units SET state = ?, lease_until = NULL WHERE id = ? AND worker_id = ? AND state = ?",
+                (UNIT_DONE, unit_id, worker_id, UNIT_CLAIMED))
+            if cursor.rowcount:
+                self._connection.execute("UPDATE workers SET units_done = units_done + 1 WHERE worker_id = ?",
+                                         (worker_id,))
+        return bool(cursor.rowcount)
+
+    def release_unit(self, unit_id: int, worker_id: str, error: str = None):
+        """
+        Give back a unit the worker did not finish: it is queued again, unless its search was
+        cancelled or it has used up its attempts.
+        """
+        with self._lock, self._write():
+            row = self._connection.execute("""
+                SELECT units.attempts, searches.cancel_requested FROM units JOIN searches ON searches.id = units.search_id
+                WHERE units.id = ? AND units.worker_id = ? AND units.state = ?
+            """, (unit_id, worker_id, UNIT_CLAIMED)).fetchone()
+            if row is None:
+                return
+            attempts, cancel_requested = row
+            if cancel_requested:
+                state = UNIT_CANCELLED
+            elif attempts >= self.max_attempts:
+                state = UNIT_FAILED
+                logging.warning(f"Giving up unit {unit_id} after {attempts} attempts: {error}")
+            else:
+                state = UNIT_QUEUED
+            self._connection.execute("UPDATE units SET state = ?, lease_until = NULL, error = ? WHERE id = ?",
+                                     (state, error, unit_id))
+
+    def claim_finalization(self, worker_id: str) -> dict:
+        """
+        Claim a search that has no open units left (or whose finalizing worker's lease expired),
+        so this worker sends its digest. Returns the search, or None.
+        """
+        now = time()
+        with self._lock, self._write():
+            self._expire_units(now)
+            row = self._connection.execute("""
+                SELECT id FROM searches
+                WHERE (state IN (?, ?) AND NOT EXISTS (
+                         SELECT 1 FROM units WHERE units.search_id = searches.id AND units.state IN (?, ?)))
+                   OR (state = ? AND lease_until < ?)
+                ORDER BY created_at LIMIT 1
+            """, (QUEUED, RUNNING, UNIT_QUEUED, UNIT_CLAIMED, FINALIZING, now)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE searches SET state = ?, worker_id = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                (FINALIZING, worker_id, now + self.lease_seconds, datetime.now().strftime(DATE_FORMAT), row[0]))
+            return self._search(row[0])
+
+    def finish_search(self, search_id: str, state: str, message: str = None, email_status: dict = None,
+                      digest_row_id: int = None):
+        with self._lock, self._write():
+            self._connection.execute("""
+                UPDATE searches SET state = ?, message = ?, email_status = ?, lease_until = NULL, updated_at = ?,
+                                    digest_row_id = ?
+                WHERE id = ?
+            """, (state, message, json.dumps(email_status or {}), datetime.now().strftime(DATE_FORMAT),
+                  digest_row_id, search_id))
+    # endregion
+
+    def _search(self, search_id: str) -> dict:
+        row = self._connection.execute("""
+            SELECT id, companies, key_terms, receiver_email, since, cancel_requested, digest_after_id
+            FROM searches WHERE id = ?
+        """, (search_id,)).fetchone()
+        return {
+            "id": row[0],
+            "companies": json.loads(row[1]),
+            "key_terms": json.loads(row[2]),
+            "receiver_email": row[3],
+            "since": datetime.strptime(row[4], DATE_FORMAT) if row[4] else None,
+            "cancelled": bool(row[5]),
+            "digest_after_id": row[6]
+        }
+
+    def _expire_units(self, now: float):
+        """Settle expired claims that cannot be handed out again: used-up attempts, or a cancelled search"""
+        self._connection.execute("""
+            UPDATE units SET state = ?, error = 'lease expired'
+            WHERE state = ? AND lease_until < ? AND attempts >= ?
+        """, (UNIT_FAILED, UNIT_CLAIMED, now, self.max_attempts))
+        self._connection.execute("""
+            UPDATE units SET state = ?
+            WHERE state = ? AND lease_until < ?
+              AND search_id IN (SELECT id FROM searches WHERE cancel_requested = 1)
+        """, (UNIT_CANCELLED, UNIT_CLAIMED, now))
+
+    def _touch_worker(self, worker_id: str, now: float):
+        self._connection.execute("UPDATE workers SET last_seen = ? WHERE worker_id = ?", (now, worker_id))
+
+    def _prune(self):
+        cutoff = (datetime.now() - timedelta(days=self.history_days)).strftime(DATE_FORMAT)
+        states = ", ".join("?" * len(FINISHED_STATES))
+        old_searches = [(search_id,) for (search_id,) in self._connection.execute(
+            f"SELECT id FROM searches WHERE state IN ({states}) AND updated_at < ?", (*FINISHED_STATES, cutoff))]
+        for table, column in (("search_articles", "search_id"), ("units", "search_id"), ("searches", "id")):
+            self._connection.executemany(f"DELETE FROM {table} WHERE {column} = ?", old_searches)
+        self._connection.execute("DELETE FROM workers WHERE last_seen < ?", (time() - 86400 * self.history_days,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class _ImmediateTransaction:
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        self.connection.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        return False
+
+
+_shared_queue = None
+_shared_queue_lock = threading.Lock()
+
+
+def get_work_queue() -> WorkQueue:
+    """Return the process-wide work queue"""
+    global _shared_queue
+    with _shared_queue_lock:
+        if _shared_queue is None:
+            _shared_queue = WorkQueue()
+        return _shared_queue
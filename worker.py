@@ -0,0 +1,188 @@
+"""
+Search worker: runs units of queued searches from the shared work queue.
+
+Start one or more workers next to a web app running in queue mode
+(NEWSRADAR_SEARCH_MODE=queue):
+
+    python worker.py                  # one worker process
+    python worker.py --processes 4    # four worker processes
+
+Each worker process has its own browser, parser pool and event loop, claims a
+few (company, key term) units at a time (see work_queue.py), stores their
+articles in the shared article store, and sends the digest of a search once
+its last unit is done. Workers can be started and stopped at any time; the
+units of a worker that stops are handed to the others when its lease runs out.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import threading
+
+from NewsRadar import (build_results_email, commit_feed_state, create_search_engine, digest_articles,
+                       discard_feed_state, save_articles, send_results_email, write_to_text_file)
+from nlp_resources import check_resources
+from seen_index import get_seen_index
+from url_cache import get_url_cache
+from work_queue import CANCELLED, COMPLETED, FAILED, WORK_QUEUE_PATH, WorkQueue, default_worker_id
+
+# Units claimed at a time; they run concurrently through the pipeline stages
+WORKER_BATCH_SIZE = 4
+WORKER_POLL_INTERVAL = 2
+
+
+def run_claim(queue: WorkQueue, worker_id: str, claim: dict):
+    """Search the claimed units of one search, storing their articles and marking them done"""
+    search = claim["search"]
+    open_units = {unit["unit_key"]: unit["id"] for unit in claim["units"]}
+    cancel_event = threading.Event()
+    stop_heartbeat = threading.Event()
+    run_id = f"{search['id']}-{worker_id}"
+
+    def heartbeat():
+        while not stop_heartbeat.wait(queue.lease_seconds / 3):
+            try:
+                if not queue.heartbeat(worker_id, list(open_units.copy().values())):
+                    cancel_event.set()
+            except Exception as e:
+                logging.error(f"Worker {worker_id} heartbeat failed: {e}")
+
+    def store_results(company, key_term, articles):
+        stored = save_articles(articles, flush=False)
+        queue.record_articles(search["id"], len(articles), stored)
+
+    def complete_unit(company, key_term):
+        unit_key = search_engine.feed_url(company, key_term)
+        commit_feed_state(company, key_term, run_id=run_id)
+        queue.complete_unit(open_units.pop(unit_key), worker_id)
+
+    search_engine = create_search_engine(since=search["since"], run_id=run_id,
+                                         units=[(unit["company"], unit["key_term"]) for unit in claim["units"]])
+    heartbeat_thread = threading.Thread(target=heartbeat, name="WorkerHeartbeat", daemon=True)
+    heartbeat_thread.start()
+    error = "unit did not complete"
+    try:
+        search_engine.search(search["companies"], search["key_terms"], cancel_event=cancel_event,
+                             results_callback=store_results, complete_callback=complete_unit, collect=False)
+    except Exception as e:
+        error = str(e)
+        logging.error(f"Worker {worker_id} failed on search {search['id']}: {e}")
+    finally:
+        stop_heartbeat.set()
+        heartbeat_thread.join()
+        discard_feed_state(run_id)
+        get_seen_index().flush()
+        get_url_cache().flush()
+        # Failed or cancelled units go back to the queue (or are given up after too many attempts)
+        for unit_id in open_units.values():
+            queue.release_unit(unit_id, worker_id, error)
+
+
+def finalize_search(queue: WorkQueue, search: dict):
+    """Email the digest of a search whose units are all done, and mark it finished"""
+    new_articles, digest_row_id = digest_articles(queue.new_articles(search["id"]), search["companies"],
+                                                  search["key_terms"], search["digest_after_id"])
+    status = queue.status(search["id"])
+
+    if search["cancelled"]:
+        queue.finish_search(search["id"], CANCELLED, f"Search cancelled. Kept {len(new_articles)} new articles.")
+        return
+
+    subject = f"NewsRadar - {status['created_at'][:10]}"
+    if new_articles:
+        write_to_text_file(new_articles, "news_articles.txt")
+        subject += f" - Found {len(new_articles)} new articles"
+    else:
+        subject += " - No New Articles"
+    body, html = build_results_email(new_articles, intro="NewsRadar found the following new articles:",
+                                     empty_body="NewsRadar found no news articles.")
+
+    email_status = {}
+    if search["receiver_email"]:
+        email_status = send_results_email(search["receiver_email"], subject, body, html)
+
+    message = f"Found {len(new_articles)} new articles."
+    if status["units_failed"]:
+        message += f" {status['units_failed']} queries failed."
+    email_failed = [recipient for recipient, sent in email_status.items() if not sent]
+    if email_failed:
+        message += f" Email could not be sent to {', '.join(email_failed)}."
+    queue.finish_search(search["id"], COMPLETED, message, email_status, digest_row_id)
+    logging.info(f"Search {search['id']} finished: {message}")
+
+
+def start_worker(queue_path: str = WORK_QUEUE_PATH, worker_id: str = None, batch_size: int = WORKER_BATCH_SIZE,
+                 poll_interval: float = WORKER_POLL_INTERVAL, stop_event: threading.Event = None):
+    """Claim and run units from the work queue until `stop_event` is set (or forever)"""
+    queue = WorkQueue(queue_path)
+    worker_id = worker_id or default_worker_id()
+    stop_event = stop_event or threading.Event()
+    queue.register_worker(worker_id)
+    check_resources()
+    logging.info(f"Worker {worker_id} started on {queue_path}")
+
+    while not stop_event.is_set():
+        try:
+            search = queue.claim_finalization(worker_id)
+            if search is not None:
+                try:
+                    finalize_search(queue, search)
+                except Exception as e:
+                    logging.error(f"Worker {worker_id} could not finish search {search['id']}: {e}")
+                    queue.finish_search(search["id"], FAILED, f"Search failed: {e}")
+                continue
+
+            claim = queue.claim(worker_id, batch_size)
+            if claim is None:
+                queue.heartbeat(worker_id, [])
+                stop_event.wait(poll_interval)
+                continue
+            logging.info(f"Worker {worker_id} running {len(claim['units'])} units of search {claim['search']['id']}")
+            run_claim(queue, worker_id, claim)
+        except Exception as e:
+            logging.error(f"Worker {worker_id} error: {e}")
+            stop_event.wait(poll_interval)
+
+    queue.close()
+    logging.info(f"Worker {worker_id} stopped")
+
+
+def _worker_process(queue_path: str, batch_size: int):
+    try:
+        start_worker(queue_path, batch_size=batch_size)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run NewsRadar search workers on the shared work queue")
+    parser.add_argument("--queue", default=WORK_QUEUE_PATH, help="Path of the work queue database")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start")
+    parser.add_argument("--batch-size", type=int, default=WORKER_BATCH_SIZE, help="Units claimed at a time")
+    args = parser.parse_args()
+
+    if args.processes > 1 and "NEWSRADAR_PARSE_WORKERS" not in os.environ:
+        # Share the cores between the workers' parser pools instead of giving each worker all of them
+        os.environ["NEWSRADAR_PARSE_WORKERS"] = str(max(1, (os.cpu_count() or 1) // args.processes))
+
+    print(f"Starting {args.processes} worker(s) on {args.queue}, see app.log for progress. Stop with Ctrl+C.")
+    if args.processes == 1:
+        _worker_process(args.queue, args.batch_size)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_worker_process, args=(args.queue, args.batch_size), name=f"Worker-{i}")
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join(timeout=10)
+
+
+if __name__ == "__main__":
+    main()